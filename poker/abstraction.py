@@ -0,0 +1,291 @@
+"""
+Equity distribution card abstraction.
+
+Every (hole cards, board) pair is reduced to its suit-canonical class: suits are relabelled in order of their
+(hole, board) rank masks, which leaves the same class for every suit permutation, and the relabelled cards are packed
+into one int64 key, 6 bits a card with the hole cards first. For each class of a street a histogram of the hand's
+equity against a random opponent is sampled over the possible future boards, the same evaluator scores Hand uses
+and with random deals as in Game. The histograms are clustered into buckets with k-means under the earth mover's
+distance, which for 1-D histograms is the L1 distance between their CDFs, so every step is a batch of array
+operations.
+
+build works through a street's classes in fixed chunks on a process pool and saves each chunk's histograms as its
+own .npy file, so memory stays bounded and an interrupted build skips the chunks already on disk. The result is a
+BucketTable of sorted class keys and uint16 bucket ids, looked up with a binary search.
+"""
+import itertools
+import json
+import math
+import os
+
+import numpy as np
+
+import batch
+import evaluator
+import exact
+import util
+
+STREETS = PREFLOP, FLOP, TURN = 0, 1, 2
+STREET_NAMES = ('preflop', 'flop', 'turn')
+BOARD_CARDS = (0, 3, 4)
+DEFAULT_DIRECTORY = os.path.join(os.path.dirname(__file__), '../data/abstraction')
+DEFAULT_NUM_BUCKETS = (169, 200, 200)
+DEFAULT_NUM_BINS = 20
+DEFAULT_NUM_BOARDS = 64
+DEFAULT_NUM_OPPONENTS = 16
+DEFAULT_CHUNK_SIZE = 2000
+DEFAULT_ITERATIONS = 25
+DEFAULT_MAX_FIT = 200000
+CARD_BITS = 6
+
+
+def canonical_keys(cards):
+    """
+    suit-canonical class keys of an (N, 2 + board cards) array of card indices, hole cards first
+    """
+    cards = np.asarray(cards, dtype=np.int64)
+    suits = cards & 3
+    bits = np.int64(1) << (cards >> 2)
+    # each suit's 26 bit signature: its hole card ranks above its board ranks
+    signatures = np.stack([np.where(suits == suit, bits << np.where(np.arange(cards.shape[1]) < 2, 13, 0), 0)
+                           .sum(axis=1) for suit in range(4)], axis=1)
+    order = np.argsort(-signatures, axis=1, kind='stable')
+    new_suits = np.empty_like(order)
+    np.put_along_axis(new_suits, order, np.arange(4), axis=1)
+    relabelled = (cards & ~3) | np.take_along_axis(new_suits, suits, axis=1)
+    relabelled = np.concatenate([np.sort(relabelled[:, :2], axis=1), np.sort(relabelled[:, 2:], axis=1)], axis=1)
+    return (relabelled << (CARD_BITS * np.arange(cards.shape[1]))).sum(axis=1)
+
+
+def decode_keys(keys, num_cards):
+    """
+    (N, num_cards) representative card indices of class keys
+    """
+    return (np.asarray(keys, dtype=np.int64)[:, None] >> (CARD_BITS * np.arange(num_cards))) & ((1 << CARD_BITS) - 1)
+
+
+def enumerate_classes(street):
+    """
+    sorted keys of every class of a street, one preflop class at a time so memory stays with the classes
+    """
+    num_board = BOARD_CARDS[street]
+    if num_board == 0:
+        return np.sort(canonical_keys([exact.representative(hand_class) for hand_class in range(169)]))
+    keys = []
+    for hand_class in range(169):
+        hole = exact.representative(hand_class)
+        remaining = np.array([card for card in range(52) if card not in hole], dtype=np.int64)
+        boards = remaining[np.fromiter(itertools.combinations(range(len(remaining)), num_board),
+                                       dtype=np.dtype((np.int8, num_board)),
+                                       count=math.comb(len(remaining), num_board))].reshape(-1, num_board)
+        cards = np.concatenate([np.tile(np.array(hole, dtype=np.int64), (len(boards), 1)), boards], axis=1)
+        keys.append(np.unique(canonical_keys(cards)))
+    return np.sort(np.concatenate(keys))
+
+
+def histograms(keys, street, rng, num_boards=DEFAULT_NUM_BOARDS, num_opponents=DEFAULT_NUM_OPPONENTS,
+               num_bins=DEFAULT_NUM_BINS):
+    """
+    (N, num_bins) float32 histograms of equity against one random hand over num_boards sampled board completions,
+    each completion's equity estimated from num_opponents random opponent hands
+    """
+    num_board = BOARD_CARDS[street]
+    cards = np.repeat(decode_keys(keys, 2 + num_board), num_boards, axis=0)
+    num_rows = len(cards)
+    unseen = batch.deal(num_rows, 50 - num_board, rng, dead=cards)
+    board = np.concatenate([cards[:, 2:], unseen[:, :5 - num_board]], axis=1)
+    hero_scores = evaluator.evaluate_batch(np.concatenate([cards[:, :2], board], axis=1))
+
+    # two distinct cards per opponent from the 45 left after the board is complete
+    rows = np.repeat(np.arange(num_rows), num_opponents)
+    first = rng.integers(45, size=len(rows))
+    second = rng.integers(44, size=len(rows))
+    second += second >= first
+    opponents = unseen[:, 5 - num_board:][rows[:, None], np.stack([first, second], axis=1)]
+    villain_scores = evaluator.evaluate_batch(np.concatenate([opponents, board[rows]], axis=1))
+    hero_scores = hero_scores[rows]
+    shares = (hero_scores > villain_scores) + 0.5 * (hero_scores == villain_scores)
+    equities = shares.reshape(len(keys), num_boards, num_opponents).mean(axis=2)
+
+    bins = np.minimum((equities * num_bins).astype(np.int64), num_bins - 1)
+    counts = np.zeros((len(keys), num_bins))
+    np.add.at(counts, (np.arange(len(keys))[:, None], bins), 1)
+    return (counts / num_boards).astype(np.float32)
+
+
+def emd(cdfs, centroids):
+    """
+    (N, K) earth mover's distances between rows of CDFs and centroid CDFs, in bins
+    """
+    return np.abs(cdfs[:, None, :] - centroids[None, :, :]).sum(axis=2)
+
+
+def assign(cdfs, centroids, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    nearest centroid of every CDF and the distance to it, chunked so the (chunk, K, bins) differences stay small
+    """
+    buckets = np.empty(len(cdfs), dtype=np.int64)
+    nearest = np.empty(len(cdfs))
+    for start in range(0, len(cdfs), chunk_size):
+        distances = emd(cdfs[start:start + chunk_size], centroids)
+        buckets[start:start + chunk_size] = distances.argmin(axis=1)
+        nearest[start:start + chunk_size] = distances.min(axis=1)
+    return buckets, nearest
+
+
+def kmeans(cdfs, num_buckets, rng, iterations=DEFAULT_ITERATIONS, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    (num_buckets, bins) centroid CDFs from k-means++ seeding and Lloyd iterations under the earth mover's distance,
+    ordered from the lowest mean equity to the highest
+
+    a centroid is the mean of its members' CDFs, the usual stand-in for the exact L1 minimiser (the per-bin median)
+    """
+    num_buckets = min(num_buckets, len(np.unique(cdfs, axis=0)))
+    centroids = [cdfs[rng.integers(len(cdfs))]]
+    nearest = assign(cdfs, np.array(centroids), chunk_size)[1]
+    for _ in range(num_buckets - 1):
+        centroids.append(cdfs[rng.choice(len(cdfs), p=nearest ** 2 / (nearest ** 2).sum())])
+        nearest = np.minimum(nearest, assign(cdfs, np.array(centroids[-1:]), chunk_size)[1])
+    centroids = np.array(centroids)
+
+    previous = None
+    for _ in range(iterations):
+        buckets, _ = assign(cdfs, centroids, chunk_size)
+        if previous is not None and (buckets == previous).all():
+            break
+        previous = buckets
+        sizes = np.bincount(buckets, minlength=num_buckets)
+        sums = np.zeros(centroids.shape)
+        np.add.at(sums, buckets, cdfs)
+        # an emptied bucket keeps its old centroid
+        centroids = np.where(sizes[:, None] > 0, sums / np.maximum(sizes, 1)[:, None], centroids)
+    # a higher CDF means more weight on low equities
+    return centroids[np.argsort(-centroids.sum(axis=1), kind='stable')]
+
+
+class BucketTable:
+    def __init__(self, street, keys, buckets, centroids):
+        """
+        keys are the sorted class keys of a street, buckets their uint16 bucket ids and centroids the bucket CDFs
+        """
+        self.street = street
+        self.keys = keys
+        self.buckets = buckets
+        self.centroids = centroids
+
+    def __repr__(self):
+        return f"BucketTable({STREET_NAMES[self.street]}, classes={len(self.keys):,}, buckets={len(self.centroids)})"
+
+    def lookup(self, cards):
+        """
+        bucket ids of an (N, 2 + board cards) array of card indices, hole cards first
+        """
+        keys = canonical_keys(cards)
+        positions = np.searchsorted(self.keys, keys)
+        if (positions >= len(self.keys)).any() or (self.keys[np.minimum(positions, len(self.keys) - 1)] != keys).any():
+            raise ValueError(f"Not every hand is a {STREET_NAMES[self.street]} class of this table.")
+        return self.buckets[positions]
+
+    def bucket(self, hole_cards, board=()):
+        """
+        bucket id of one hand given as Card objects or card indices
+        """
+        cards = [card if isinstance(card, (int, np.integer)) else card.index for card in [*hole_cards, *board]]
+        return int(self.lookup(np.array([cards]))[0])
+
+    def save(self, path):
+        with util.atomic_path(path, '.npz') as tmp_path:
+            np.savez(tmp_path, street=self.street, keys=self.keys, buckets=self.buckets, centroids=self.centroids)
+
+    @staticmethod
+    def load(path):
+        arrays = np.load(path)
+        return BucketTable(int(arrays['street']), arrays['keys'], arrays['buckets'], arrays['centroids'])
+
+
+def chunk_path(directory, street, chunk):
+    return os.path.join(directory, f"{STREET_NAMES[street]}_{chunk:05d}.npy")
+
+
+def load_params(path, params, entropy=None):
+    """
+    check params against the ones the saved chunks of a street were built with, writing them to path on the first
+    build, since chunk files are only meaningful for the chunking, sampling and seed they were made with
+
+    returns the seed entropy of the chunks: the saved one, which an unseeded (entropy=None) build resumes with as a
+    resumed scheduler run does, or a fresh one for a first unseeded build
+    """
+    if not os.path.exists(path):
+        entropy = np.random.SeedSequence().entropy if entropy is None else entropy
+        with util.atomic_path(path) as tmp_path, open(tmp_path, 'w') as f:
+            json.dump(dict(params, entropy=str(entropy)), f)
+        return entropy
+    with open(path) as f:
+        saved = json.load(f)
+    saved['entropy'] = int(saved['entropy'])
+    for name, value in dict(params, entropy=entropy).items():
+        if value is not None and saved[name] != value:
+            raise ValueError(f"Chunks at {path} were built with {name}={saved[name]}, not {value}.")
+    return saved['entropy']
+
+
+def run_task(task):
+    street, chunk, keys, seed, num_boards, num_opponents, num_bins = task
+    return chunk, histograms(keys, street, np.random.default_rng(seed), num_boards, num_opponents, num_bins)
+
+
+def build(street, directory=DEFAULT_DIRECTORY, num_buckets=None, processes=None, seed=None,
+          chunk_size=DEFAULT_CHUNK_SIZE, num_boards=DEFAULT_NUM_BOARDS, num_opponents=DEFAULT_NUM_OPPONENTS,
+          num_bins=DEFAULT_NUM_BINS, iterations=DEFAULT_ITERATIONS, max_fit=DEFAULT_MAX_FIT):
+    """
+    histogram every class of a street in chunks, skipping chunks already saved in directory, then cluster them into
+    num_buckets buckets and save the BucketTable as <street>_buckets.npz
+
+    saved chunks are only reused by a build with the same chunk_size, num_boards, num_opponents, num_bins and seed,
+    which <street>_params.json records; an unseeded build resumes with the saved seed
+
+    k-means is fitted on at most max_fit histograms and every class is then assigned chunk by chunk, so memory stays
+    bounded on the larger streets
+    """
+    os.makedirs(directory, exist_ok=True)
+    name = STREET_NAMES[street]
+    num_buckets = DEFAULT_NUM_BUCKETS[street] if num_buckets is None else num_buckets
+    classes_path = os.path.join(directory, f"{name}_classes.npy")
+    if not os.path.exists(classes_path):
+        with util.atomic_path(classes_path, '.npy') as tmp_path:
+            np.save(tmp_path, enumerate_classes(street))
+    keys = np.load(classes_path, mmap_mode='r')
+
+    chunks = range(-(-len(keys) // chunk_size))
+    params_path = os.path.join(directory, f"{name}_params.json")
+    saved = [chunk for chunk in chunks if os.path.exists(chunk_path(directory, street, chunk))]
+    if saved and not os.path.exists(params_path):
+        raise ValueError(f"The {name} chunks in {directory} have no {name}_params.json, remove them to rebuild.")
+    params = dict(chunk_size=chunk_size, num_boards=num_boards, num_opponents=num_opponents, num_bins=num_bins)
+    entropy = load_params(params_path, params, None if seed is None else np.random.SeedSequence(seed).entropy)
+    tasks = [(street, chunk, np.array(keys[chunk * chunk_size:(chunk + 1) * chunk_size]),
+              np.random.SeedSequence(entropy, spawn_key=(street, chunk)), num_boards, num_opponents, num_bins)
+             for chunk in chunks if chunk not in saved]
+    print(f"Computing {len(tasks):,} {name} chunks ({len(saved):,} already saved).")
+    for i, (chunk, chunk_histograms) in enumerate(util.imap_tasks(run_task, tasks, processes)):
+        with util.atomic_path(chunk_path(directory, street, chunk), '.npy') as tmp_path:
+            np.save(tmp_path, chunk_histograms)
+        print(f"Finished {i + 1:,} / {len(tasks):,} {name} chunks.")
+
+    rng = np.random.default_rng(np.random.SeedSequence(entropy, spawn_key=(street, len(chunks))))
+    fit_rows = np.sort(rng.choice(len(keys), size=min(max_fit, len(keys)), replace=False))
+    fit_chunks = fit_rows // chunk_size
+    fit_cdfs = np.concatenate([np.load(chunk_path(directory, street, chunk))[fit_rows[fit_chunks == chunk] -
+                                                                             chunk * chunk_size].cumsum(axis=1)
+                               for chunk in np.unique(fit_chunks)])
+    centroids = kmeans(fit_cdfs, num_buckets, rng, iterations, chunk_size)
+    buckets = np.concatenate([assign(np.load(chunk_path(directory, street, chunk)).cumsum(axis=1), centroids,
+                                     chunk_size)[0] for chunk in chunks]).astype(np.uint16)
+    table = BucketTable(street, np.array(keys), buckets, centroids.astype(np.float32))
+    table.save(os.path.join(directory, f"{name}_buckets.npz"))
+    return table
+
+
+if __name__ == '__main__':
+    for street in STREETS:
+        print(build(street, seed=0))
@@ -0,0 +1,75 @@
+"""
+Adaptive sampling that spends simulations on the (players, hand) cells with the widest confidence intervals.
+
+Each round picks the cells with the largest standard error, deals their hole cards to the hero and random cards to
+everyone else, and stops once every cell is within the target standard error.
+"""
+import numpy as np
+
+import batch
+from counts import NUM_CLASSES, SHARE_UNITS
+import evaluator
+import exact
+
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_CELLS_PER_ROUND = 8
+
+
+def play_fixed(num_players, hand_class, num_games, rng):
+    """
+    (won, tied, share, played) for a hero holding hand_class against num_players - 1 random hands
+    """
+    hero = exact.representative(hand_class)
+    cards = np.concatenate([np.tile(np.array(hero, dtype=np.int64), (num_games, 1)),
+                            batch.deal(num_games, 2 * num_players + 3, rng, dead=hero)], axis=1)
+    board = cards[:, 2 * num_players:]
+
+    scores = np.empty((num_games, num_players), dtype=np.int64)
+    for player in range(num_players):
+        scores[:, player] = evaluator.evaluate_batch(
+            np.concatenate([cards[:, 2 * player:2 * player + 2], board], axis=1))
+    best = scores.max(axis=1)
+    hero_won = scores[:, 0] == best
+    num_winners = np.count_nonzero(scores == best[:, None], axis=1)[hero_won]
+    return (int(np.count_nonzero(num_winners == 1)), int(np.count_nonzero(num_winners > 1)),
+            int((SHARE_UNITS // num_winners).sum()), num_games)
+
+
+def std_errors(counts, players):
+    """
+    (len(players), 169) standard errors of the equity, using (share + 1) / (played + 2) so unplayed cells are never
+    treated as tight
+    """
+    share = counts.share[players] / SHARE_UNITS
+    played = counts.played[players].astype(float)
+    prob = (share + 1) / (played + 2)
+    with np.errstate(divide='ignore'):
+        return np.sqrt(prob * (1 - prob) / played)
+
+
+def run(counts, players, target_std_err, batch_size=DEFAULT_BATCH_SIZE, cells_per_round=DEFAULT_CELLS_PER_ROUND,
+        max_games=None, rng=None):
+    """
+    add adaptive samples to counts until every cell for the given player counts reaches target_std_err
+
+    returns the number of games played
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    players = list(players)
+    games = 0
+    while max_games is None or games < max_games:
+        errors = std_errors(counts, players)
+        if errors.max() <= target_std_err:
+            break
+        widest = np.argsort(errors, axis=None)[::-1][:cells_per_round]
+        for cell in widest:
+            if errors.flat[cell] <= target_std_err:
+                break
+            row, hand_class = divmod(int(cell), NUM_CLASSES)
+            won, tied, share, played = play_fixed(players[row], hand_class, batch_size, rng)
+            counts.won[players[row], hand_class] += won
+            counts.tied[players[row], hand_class] += tied
+            counts.share[players[row], hand_class] += share
+            counts.played[players[row], hand_class] += played
+            games += played
+    return games
@@ -0,0 +1,90 @@
+"""
+Vectorized Monte Carlo engine that deals and scores many games at once as NumPy arrays.
+"""
+import numpy as np
+
+from counts import SHARE_UNITS
+import evaluator
+from metrics import DEAL, EVALUATE, UPDATE, WINNER
+
+DEFAULT_CHUNK_SIZE = 50000
+
+
+def deal(num_games, num_cards, rng, dead=None):
+    """
+    (num_games, num_cards) array of distinct card indices, each row the top of an independently shuffled deck
+
+    dead is a list of cards left out of every deck, or a (num_games, k) array of the cards left out of each row's
+    """
+    dead = np.zeros(0, dtype=np.int64) if dead is None else np.asarray(dead, dtype=np.int64)
+    rows = np.arange(num_games)
+    if dead.ndim == 1:
+        deck = np.setdiff1d(np.arange(52), dead).astype(np.int8)
+        decks = np.empty((num_games, len(deck)), dtype=np.int8)
+        decks[:] = deck
+        start = 0
+    else:
+        # swap each row's dead cards to the front of its deck and shuffle the rest behind them
+        decks = np.empty((num_games, 52), dtype=np.int8)
+        decks[:] = np.arange(52, dtype=np.int8)
+        positions = decks.copy()
+        for i in range(dead.shape[1]):
+            card, position, other = dead[:, i], positions[rows, dead[:, i]], decks[:, i].copy()
+            decks[rows, position] = other
+            positions[rows, other] = position
+            decks[:, i] = card
+            positions[rows, card] = i
+        start = dead.shape[1]
+    # partial Fisher-Yates on every row at once, only as many swaps as cards dealt
+    for i in range(start, start + num_cards):
+        swap = rng.integers(i, decks.shape[1], size=num_games)
+        card = decks[rows, swap]
+        decks[rows, swap] = decks[:, i]
+        decks[:, i] = card
+    return decks[:, start:start + num_cards].astype(np.int64)
+
+
+def play(num_players, num_games, rng, metrics=None):
+    """
+    deal num_games showdowns and return (won, tied, share, played) count arrays indexed by hole card class, share in
+    counts.SHARE_UNITS; player i holds columns 2i and 2i + 1, the board is the last 5 columns
+    """
+    stopwatch = metrics.stopwatch() if metrics is not None else None
+    # the deck is shuffled while dealing, so all of it is charged to the deal phase
+    cards = deal(num_games, 2 * num_players + 5, rng)
+    if stopwatch is not None:
+        stopwatch.lap(DEAL)
+    board = cards[:, 2 * num_players:]
+    hole_cards = cards[:, :2 * num_players].reshape(num_games, num_players, 2)
+
+    scores = np.empty((num_games, num_players), dtype=np.int64)
+    for player in range(num_players):
+        scores[:, player] = evaluator.evaluate_batch(np.concatenate([hole_cards[:, player], board], axis=1))
+    if stopwatch is not None:
+        stopwatch.lap(EVALUATE)
+    winners = scores == scores.max(axis=1, keepdims=True)
+    if stopwatch is not None:
+        stopwatch.lap(WINNER)
+
+    classes = evaluator.CLASS_TABLE[hole_cards[:, :, 0], hole_cards[:, :, 1]]
+    num_winners = winners.sum(axis=1, keepdims=True)
+    won, tied, share, played = np.zeros((4, 169), dtype=np.int64)
+    np.add.at(won, classes[winners & (num_winners == 1)], 1)
+    np.add.at(tied, classes[winners & (num_winners > 1)], 1)
+    np.add.at(share, classes[winners], np.broadcast_to(SHARE_UNITS // num_winners, winners.shape)[winners])
+    np.add.at(played, classes.ravel(), 1)
+    if stopwatch is not None:
+        stopwatch.lap(UPDATE)
+        metrics.record(scores, num_games)
+    return won, tied, share, played
+
+
+def run(num_players, num_games, rng=None, chunk_size=DEFAULT_CHUNK_SIZE, metrics=None):
+    """
+    play num_games in chunks of at most chunk_size so memory stays bounded, returning (won, tied, share, played)
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    totals = np.zeros((4, 169), dtype=np.int64)
+    for start in range(0, num_games, chunk_size):
+        totals += play(num_players, min(chunk_size, num_games - start), rng, metrics)
+    return tuple(totals)
@@ -0,0 +1,216 @@
+"""
+Throughput benchmarks for the evaluator, dealing, simulation engines, result storage, regret matching, the
+betting engine and cold imports.
+
+    python benchmarks.py --output bench.json                  # run everything and write JSON
+    python benchmarks.py --baseline bench.json --filter eval  # compare against a saved run
+
+Each benchmark is timed with timeit over several repeats (garbage collection off, after a warm-up call) and the
+fastest repeat is reported, which is the most stable estimate on a noisy machine.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import timeit
+
+import numpy as np
+
+import batch
+import evaluator
+import regret_matching
+import tables
+from simulation import CARDS, Deck, Game, Hand, Player
+from store import ResultsStore
+
+DEFAULT_REPEAT = 5
+DEFAULT_TOLERANCE = 0.1
+
+BENCHMARKS = {}
+
+
+def benchmark(name, ops=1):
+    """
+    register a setup function that returns the callable to time; ops is how many operations one call performs
+    """
+    def register(setup):
+        BENCHMARKS[name] = (setup, ops)
+        return setup
+    return register
+
+
+def random_hands(num_hands, seed=0):
+    rng = random.Random(seed)
+    return [rng.sample(range(52), 7) for _ in range(num_hands)]
+
+
+@benchmark('hand_init', ops=1000)
+def hand_init():
+    hands = [[CARDS[card] for card in cards] for cards in random_hands(1000)]
+    return lambda: [Hand(cards) for cards in hands]
+
+
+@benchmark('hand_get_score', ops=1000)
+def hand_get_score():
+    hands = [Hand([CARDS[card] for card in cards]) for cards in random_hands(1000)]
+    return lambda: [hand.get_score() for hand in hands]
+
+
+@benchmark('evaluate', ops=10000)
+def evaluate():
+    hands = random_hands(10000)
+    return lambda: [evaluator.evaluate(cards) for cards in hands]
+
+
+@benchmark('evaluate_batch', ops=100000)
+def evaluate_batch():
+    hands = np.array(random_hands(100000))
+    return lambda: evaluator.evaluate_batch(hands)
+
+
+@benchmark('deck_deal', ops=1000)
+def deck_deal():
+    deck = Deck(seed=0)
+    players = [Player() for _ in range(2)]
+
+    def deal():
+        for _ in range(1000):
+            deck.shuffle()
+            deck.deal_hole_cards(players)
+            deck.deal_community_cards()
+    return deal
+
+
+def game_simulate(num_players):
+    def setup():
+        game = Game(num_players, seed=0)
+
+        def simulate():
+            for _ in range(100):
+                game.simulate()
+        return simulate
+    return setup
+
+
+def batch_simulate(num_players):
+    def setup():
+        rng = np.random.default_rng(0)
+        return lambda: batch.run(num_players, 20000, rng=rng)
+    return setup
+
+
+for _num_players in range(2, 10):
+    benchmark(f"game_simulate_{_num_players}", ops=100)(game_simulate(_num_players))
+    benchmark(f"batch_simulate_{_num_players}", ops=20000)(batch_simulate(_num_players))
+
+
+def cold_import(module):
+    """
+    a fresh interpreter importing module, which is what every CLI call and spawned worker pays
+    """
+    def setup():
+        command = [sys.executable, '-c', f"import {module}"]
+        return lambda: subprocess.run(command, cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+    return setup
+
+
+for _module in ('evaluator', 'lookup', 'simulation', 'regret_matching'):
+    benchmark(f"import_{_module}")(cold_import(_module))
+
+
+@benchmark('store_probabilities')
+def store_probabilities():
+    tmp_dir = tempfile.TemporaryDirectory()  # removed once the returned closure is dropped
+    store = ResultsStore(os.path.join(tmp_dir.name, 'probabilities.sqlite'), csv_path=None)
+    game = Game(2)
+    game.simulate_batch(10000, rng=np.random.default_rng(0))
+
+    def store_and_export():
+        with contextlib.redirect_stdout(io.StringIO()):
+            game.store_probabilities(store)
+        store.export_csv(os.path.join(tmp_dir.name, 'probabilities.csv'))
+    return store_and_export
+
+
+@benchmark('regret_matching_play', ops=1000)
+def regret_matching_play():
+    game = regret_matching.Game(max_game=1000, seed=0)
+
+    def play():
+        with contextlib.redirect_stdout(io.StringIO()):
+            game.play()
+    return play
+
+
+@benchmark('tables_play_6', ops=1000)
+def tables_play_6():
+    rng = np.random.default_rng(0)
+    policies = [tables.EquityThreshold(0.3 + 0.05 * seat, 0.7, name=f"seat {seat}") for seat in range(6)]
+    return lambda: tables.play(policies, 1000, rng=rng)
+
+
+def run(names, repeat=DEFAULT_REPEAT):
+    results = {}
+    for name in names:
+        setup, ops = BENCHMARKS[name]
+        func = setup()
+        func()  # warm up caches and lazily built tables
+        times = timeit.Timer(func).repeat(repeat=repeat, number=1)
+        best = min(times)
+        results[name] = dict(seconds=best, median_seconds=float(np.median(times)), ops=ops, ops_per_second=ops / best)
+        print(f"{name:>24}: {ops / best:>14,.0f} ops/s ({best * 1e3:.2f}ms per call)", file=sys.stderr)
+    return results
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    {name: speedup} against the baseline and the names that got slower by more than tolerance
+    """
+    speedups = {name: result['ops_per_second'] / baseline[name]['ops_per_second']
+                for name, result in results.items() if name in baseline}
+    regressions = [name for name, speedup in speedups.items() if speedup < 1 - tolerance]
+    return speedups, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--filter', default='', help='only run benchmarks whose name contains this')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    parser.add_argument('--output', help='write results as JSON to this path (default stdout)')
+    parser.add_argument('--baseline', help='JSON results to compare against')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='fractional slowdown that counts as a regression')
+    args = parser.parse_args(argv)
+
+    names = [name for name in BENCHMARKS if args.filter in name]
+    report = dict(python=platform.python_version(), numpy=np.__version__, machine=platform.machine(),
+                  results=run(names, args.repeat))
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        speedups, regressions = compare(report['results'], baseline, args.tolerance)
+        report['speedups'] = speedups
+        report['regressions'] = regressions
+        for name, speedup in speedups.items():
+            flag = '  REGRESSION' if name in regressions else ''
+            print(f"{name:>24}: {speedup:.2f}x baseline{flag}", file=sys.stderr)
+        exit_code = 1 if regressions else 0
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,176 @@
+"""
+Opt-in evaluation cache keyed by a suit-canonical signature.
+
+A hand's score does not change when its suits are permuted, so every hand is keyed by its four per-suit 13 bit rank
+masks, sorted and packed into one 52 bit integer. Recent keys live in a bounded LRU, and a precomputed table of
+(key, score) pairs can be built once, saved as a .npy file and memory-mapped at startup so lookups never hit the
+evaluator. Hits, misses and memory use are reported by stats().
+"""
+import collections
+import itertools
+import math
+import os
+import sys
+
+import numpy as np
+
+import evaluator
+import util
+
+DEFAULT_PATH = os.path.join(os.path.dirname(__file__), '../data/evaluation_cache.npy')
+DEFAULT_MAX_SIZE = 1 << 20
+
+
+def canonical_key(cards):
+    """
+    suit-canonical signature of card indices
+    """
+    masks = [0, 0, 0, 0]
+    for card in cards:
+        masks[card & 3] |= 1 << (card >> 2)
+    masks.sort()
+    return masks[0] | masks[1] << 13 | masks[2] << 26 | masks[3] << 39
+
+
+def canonical_keys(cards):
+    """
+    signatures of every row of an (N, num_cards) array of card indices
+    """
+    cards = np.asarray(cards, dtype=np.int64)
+    bits = evaluator.CARD_BITS_ARRAY[cards]
+    suits = cards & 3
+    # cards are distinct, so each suit's rank bits can be summed instead of or-ed
+    masks = np.stack([np.where(suits == suit, bits, 0).sum(axis=1) for suit in range(4)], axis=1)
+    masks.sort(axis=1)
+    return masks[:, 0] | masks[:, 1] << 13 | masks[:, 2] << 26 | masks[:, 3] << 39
+
+
+def combinations(num_cards, first_card):
+    """
+    every sorted num_cards combination of card indices starting with first_card
+    """
+    rest = np.arange(first_card + 1, 52, dtype=np.int8)
+    combos = np.fromiter(itertools.combinations(range(len(rest)), num_cards - 1),
+                         dtype=np.dtype((np.int8, num_cards - 1)), count=math.comb(len(rest), num_cards - 1))
+    return np.concatenate([np.full((len(combos), 1), first_card, dtype=np.int8), rest[combos]], axis=1)
+
+
+def build_table(num_cards=7):
+    """
+    (2, N) array of every sorted signature of num_cards cards and its score
+
+    enumerates every combination once (about a minute for 7 cards), scoring one representative per signature
+    """
+    keys, values = [], []
+    for first_card in range(52 - num_cards + 1):
+        cards = combinations(num_cards, first_card)
+        chunk_keys, representatives = np.unique(canonical_keys(cards), return_index=True)
+        keys.append(chunk_keys)
+        values.append(evaluator.evaluate_batch(cards[representatives]))
+    keys, first = np.unique(np.concatenate(keys), return_index=True)
+    return np.stack([keys, np.concatenate(values)[first]])
+
+
+class EvaluationCache:
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, table=None):
+        """
+        table is an optional (2, N) array of sorted signatures and scores, e.g. from build_table or a saved cache
+        """
+        self.max_size = max_size
+        self.entries = collections.OrderedDict()
+        self.table = np.empty((2, 0), dtype=np.int64) if table is None else table
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return f"EvaluationCache(entries={len(self.entries):,}, table={self.table.shape[1]:,}, " \
+               f"hit_rate={self.hit_rate():.1%})"
+
+    def __len__(self):
+        return len(self.entries) + self.table.shape[1]
+
+    def lookup_table(self, keys):
+        """
+        (scores, found) for an array of signatures, score 0 where the table has none
+        """
+        table_keys = self.table[0]
+        if not len(table_keys):
+            return np.zeros(len(keys), dtype=np.int64), np.zeros(len(keys), dtype=bool)
+        positions = np.minimum(np.searchsorted(table_keys, keys), len(table_keys) - 1)
+        found = table_keys[positions] == keys
+        return np.where(found, self.table[1][positions], 0), found
+
+    def evaluate(self, cards):
+        """
+        score of 5 to 7 card indices, as evaluator.evaluate
+        """
+        key = canonical_key(cards)
+        entries = self.entries
+        score = entries.get(key)
+        if score is not None:
+            entries.move_to_end(key)
+            self.hits += 1
+            return score
+        if self.table.shape[1]:
+            scores, found = self.lookup_table(np.array([key]))
+            if found[0]:
+                self.hits += 1
+                return int(scores[0])
+        self.misses += 1
+        score = entries[key] = evaluator.evaluate(cards)
+        if len(entries) > self.max_size:
+            entries.popitem(last=False)
+        return score
+
+    def evaluate_batch(self, cards):
+        """
+        scores of an (N, 5 to 7) array, as evaluator.evaluate_batch
+
+        rows sharing a signature are scored once and the table is consulted first; the LRU is left to scalar lookups
+        """
+        cards = np.asarray(cards, dtype=np.int64)
+        keys, representatives, inverse = np.unique(canonical_keys(cards), return_index=True, return_inverse=True)
+        scores, found = self.lookup_table(keys)
+        missing = np.flatnonzero(~found)
+        scores[missing] = evaluator.evaluate_batch(cards[representatives[missing]])
+        self.misses += len(missing)
+        self.hits += len(cards) - len(missing)
+        return scores[inverse.ravel()]
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def memory_bytes(self):
+        """
+        approximate bytes held by the LRU and by the table (memory-mapped tables are paged in on demand)
+        """
+        entry_bytes = sum(sys.getsizeof(key) + sys.getsizeof(score) for key, score in self.entries.items())
+        return sys.getsizeof(self.entries) + entry_bytes + self.table.nbytes
+
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses, hit_rate=self.hit_rate(), entries=len(self.entries),
+                    table_entries=self.table.shape[1], memory_bytes=self.memory_bytes(),
+                    mapped=isinstance(self.table, np.memmap))
+
+    def save(self, path=DEFAULT_PATH):
+        """
+        write the table merged with the LRU entries, so a later load starts warm
+        """
+        count = len(self.entries)
+        keys = np.concatenate([self.table[0], np.fromiter(self.entries.keys(), dtype=np.int64, count=count)])
+        values = np.concatenate([self.table[1], np.fromiter(self.entries.values(), dtype=np.int64, count=count)])
+        keys, first = np.unique(keys, return_index=True)
+        with util.atomic_path(path, '.npy') as tmp_path:
+            np.save(tmp_path, np.stack([keys, values[first]]))
+
+    @staticmethod
+    def load(path=DEFAULT_PATH, max_size=DEFAULT_MAX_SIZE):
+        return EvaluationCache(max_size, table=np.load(path, mmap_mode='r'))
+
+
+if __name__ == '__main__':
+    table = build_table()
+    with util.atomic_path(DEFAULT_PATH, '.npy') as tmp_path:
+        np.save(tmp_path, table)
+    print(f"Saved {table.shape[1]:,} suit-canonical 7 card hands to {DEFAULT_PATH} ({table.nbytes / 2 ** 20:.0f}MB).")
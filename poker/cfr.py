@@ -0,0 +1,139 @@
+"""
+CFR+ solver for heads-up push/fold Hold'em at many stack depths at once.
+
+The small blind (0.5bb) either folds or goes all in; the big blind then folds or calls. Terminal payoffs come from
+the class vs class equity matrix built with the hand evaluator (see matchups.py), weighted by the card-removal
+aware deal probabilities. Every information set is a row of a (stacks * 169, actions) array at index
+stack_index * 169 + hand_class, so all stack depths are solved with the same few matrix products per iteration.
+"""
+import os
+
+import numpy as np
+
+import evaluator
+import matchups
+from regret_matching import normalise
+import util
+
+SMALL_BLIND = 0.5
+BIG_BLIND = 1.0
+SB, BB = 0, 1
+FOLD, AGGRESSIVE = 0, 1  # push for the small blind, call for the big blind
+
+
+class PushFold:
+    def __init__(self, stacks, equities=None, weights=None):
+        """
+        stacks are effective stack depths in big blinds
+        """
+        self.stacks = np.asarray(stacks, dtype=float)
+        equities = matchups.load() if equities is None else np.asarray(equities, dtype=float)
+        weights = matchups.class_weights() if weights is None else np.asarray(weights, dtype=float)
+        self.probabilities = weights / weights.sum()
+        # small blind's share of the stacks on a call, before scaling by the stack depth
+        self.showdown = self.probabilities * (2 * equities - 1)
+
+        shape = (2, len(self.stacks) * 169, 2)
+        self.regrets = np.zeros(shape)
+        self.strategy_sums = np.zeros(shape)
+        self.iterations = 0
+
+    def __repr__(self):
+        return f"PushFold(stacks={self.stacks.tolist()}, iterations={self.iterations})"
+
+    @staticmethod
+    def infoset(stack_index, hand_class):
+        return stack_index * 169 + hand_class
+
+    def current_strategy(self, player):
+        # regret matching+ keeps regrets non-negative, so matching them is normalising them
+        return normalise(self.regrets[player])
+
+    def average_strategy(self, player):
+        """
+        (stacks, 169) probability of pushing (small blind) or calling (big blind)
+        """
+        return normalise(self.strategy_sums[player])[:, AGGRESSIVE].reshape(len(self.stacks), 169)
+
+    def action_values(self, player, push, call):
+        """
+        (stacks * 169, 2) counterfactual values of folding and of the aggressive action for one player, given the
+        (stacks, 169) push and call probabilities
+        """
+        stacks = self.stacks[:, None]
+        if player == SB:
+            fold = np.broadcast_to(-SMALL_BLIND * self.probabilities.sum(axis=1), push.shape)
+            push = (1 - call) @ self.probabilities.T * BIG_BLIND + stacks * (call @ self.showdown.T)
+            return np.stack([fold, push], axis=-1).reshape(-1, 2)
+        fold = -BIG_BLIND * (push @ self.probabilities)
+        call = -stacks * (push @ self.showdown)
+        return np.stack([fold, call], axis=-1).reshape(-1, 2)
+
+    def update(self, player):
+        strategies = [self.current_strategy(p)[:, AGGRESSIVE].reshape(len(self.stacks), 169) for p in (SB, BB)]
+        strategy = self.current_strategy(player)
+        values = self.action_values(player, *strategies)
+        expected = (values * strategy).sum(axis=1, keepdims=True)
+        self.regrets[player] = np.maximum(self.regrets[player] + values - expected, 0)
+        # CFR+ weights later iterations more heavily in the average
+        self.strategy_sums[player] += (self.iterations + 1) * strategy
+
+    def iterate(self, iterations, checkpoint_path=None, checkpoint_every=1000):
+        for _ in range(iterations):
+            self.update(SB)
+            self.update(BB)
+            self.iterations += 1
+            if checkpoint_path is not None and self.iterations % checkpoint_every == 0:
+                self.save(checkpoint_path)
+        return self
+
+    def exploitability(self):
+        """
+        (stacks,) average gain in big blinds per hand of best responding to the average strategies
+        """
+        push, call = self.average_strategy(SB), self.average_strategy(BB)
+        depth = len(self.stacks)
+        sb_values = self.action_values(SB, push, call).reshape(depth, 169, 2)
+        bb_values = self.action_values(BB, push, call).reshape(depth, 169, 2)
+        # the big blind collects the small blind whenever it folds
+        bb_fold_bonus = SMALL_BLIND * ((1 - push) @ self.probabilities).sum(axis=1)
+        sb_best = sb_values.max(axis=2).sum(axis=1)
+        bb_best = bb_values.max(axis=2).sum(axis=1) + bb_fold_bonus
+        # the game value cancels out of the two best responses in a zero-sum game
+        return (sb_best + bb_best) / 2
+
+    def ranges(self, stack_index, threshold=0.5):
+        """
+        hand classes the small blind pushes and the big blind calls with at a stack depth
+        """
+        push, call = self.average_strategy(SB)[stack_index], self.average_strategy(BB)[stack_index]
+        return ([evaluator.HAND_CLASSES[i] for i in np.flatnonzero(push > threshold)],
+                [evaluator.HAND_CLASSES[i] for i in np.flatnonzero(call > threshold)])
+
+    def save(self, path):
+        with util.atomic_path(path, '.npz') as tmp_path:
+            np.savez(tmp_path, stacks=self.stacks, probabilities=self.probabilities, showdown=self.showdown,
+                     regrets=self.regrets, strategy_sums=self.strategy_sums, iterations=self.iterations)
+
+    @staticmethod
+    def load(path):
+        arrays = np.load(path)
+        solver = PushFold.__new__(PushFold)
+        solver.stacks = arrays['stacks']
+        solver.probabilities = arrays['probabilities']
+        solver.showdown = arrays['showdown']
+        solver.regrets = arrays['regrets']
+        solver.strategy_sums = arrays['strategy_sums']
+        solver.iterations = int(arrays['iterations'])
+        return solver
+
+
+if __name__ == '__main__':
+    checkpoint_path = os.path.join(os.path.dirname(__file__), '../data/push_fold.npz')
+    solver = PushFold.load(checkpoint_path) if os.path.exists(checkpoint_path) else PushFold(np.arange(1, 21))
+    for _ in range(10):
+        solver.iterate(100, checkpoint_path=checkpoint_path, checkpoint_every=100)
+        print(f"Iteration {solver.iterations}: exploitability {solver.exploitability().max():.5f}bb")
+    for stack_index, stack in enumerate(solver.stacks):
+        push, call = solver.ranges(stack_index)
+        print(f"{stack:.0f}bb: push {len(push)} / 169 classes, call {len(call)} / 169 classes.")
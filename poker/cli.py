@@ -0,0 +1,219 @@
+"""
+Command-line driver for the preflop probability tables.
+
+    python cli.py --players 7-10 --seconds 3600           # an hour of 7 to 10 player games on every core
+    python cli.py --players 2-10 --precision 0.002        # until every cell's standard error is at most 0.2%
+    python cli.py --players 2,3 --games 200000 --engine scalar --workers 4 --seed 1 --output csv --csv out.csv
+    python cli.py --players 2 --engine exact              # heads-up by exhaustive enumeration, ~1.3 CPU-hours
+
+The budget is a number of games per player count, a wall time or a target standard error; with none of them each
+player count plays 13 * 13 * 10000 games. The vectorized (batch.py) and scalar (simulation.Game) engines stream
+tasks into the results store, so an interrupted sqlite run is resumed by passing its --run name again. The csv and
+none outputs keep the store in memory: csv adds the new counts to the --csv file and none only reports them. The
+exact engine ignores the budget and checkpoints to data/exact_checkpoint.json instead. Throughput and an ETA are
+printed to stderr while it runs.
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+import adaptive
+import counts as counts_module
+import scheduler
+
+ENGINES = ('vectorized', 'scalar', 'exact')
+OUTPUTS = ('sqlite', 'csv', 'none')
+DEFAULT_NUM_GAMES = 13 * 13 * 10000
+DEFAULT_REPORT_SECONDS = 2.0
+
+
+def parse_players(value):
+    """
+    player counts from '7-10', '2,3,6' or a mix such as '2,7-10'
+    """
+    players = set()
+    for part in value.split(','):
+        low, _, high = part.partition('-')
+        try:
+            players.update(range(int(low), int(high or low) + 1))
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"{value!r} is not a list of player counts such as '2-10' or '2,3,6'.")
+    if not players or min(players) < 2 or max(players) > counts_module.MAX_PLAYERS:
+        raise argparse.ArgumentTypeError(f"Player counts go from 2 to {counts_module.MAX_PLAYERS}, not {value!r}.")
+    return sorted(players)
+
+
+def run_scalar_task(task):
+    """
+    scheduler task played one game at a time by simulation.Game, for checking the vectorized engine at scale
+    """
+    from simulation import Game
+
+    num_players, num_games, seed = task
+    game = Game(num_players, seed=int(seed.generate_state(1)[0]))
+    for _ in range(num_games):
+        game.simulate()
+    counts = game.counts
+    return (num_players, counts.won[num_players], counts.tied[num_players], counts.share[num_players],
+            counts.played[num_players])
+
+
+def num_games_played(counts, players):
+    return sum(int(counts.played[num_players].sum()) // num_players for num_players in players)
+
+
+class Progress:
+    """
+    run_to_store progress callback that reports throughput and an ETA, and stops the run once a time or precision
+    budget is met
+    """
+    def __init__(self, players, num_games=None, seconds=None, precision=None, base=None,
+                 report_seconds=DEFAULT_REPORT_SECONDS, file=None):
+        """
+        base is the Counts already in the store, which a precision target counts towards
+        """
+        self.players = list(players)
+        self.num_games = num_games
+        self.seconds = seconds
+        self.precision = precision
+        self.base = counts_module.Counts() if base is None else base
+        self.report_seconds = report_seconds
+        self.file = sys.stderr if file is None else file
+        self.started = time.perf_counter()
+        self.last_report = self.started
+
+    def __repr__(self):
+        return f"Progress(players={self.players})"
+
+    def std_error(self, counts):
+        """
+        largest equity standard error over every (player count, hand class) cell
+        """
+        return float(adaptive.std_errors(self.base + counts, self.players).max())
+
+    def eta(self, counts, games, elapsed):
+        """
+        seconds left at the current throughput, or None while it cannot be estimated
+        """
+        if self.seconds is not None:
+            return max(self.seconds - elapsed, 0.0)
+        if not games:
+            return None
+        if self.num_games is not None:
+            return elapsed * (self.num_games * len(self.players) - games) / games
+        # the standard error shrinks as 1 / sqrt(games), so the games needed grow with its square
+        std_error = self.std_error(counts)
+        if not np.isfinite(std_error):
+            return None
+        total_games = num_games_played(self.base, self.players) + games
+        return max(total_games * ((std_error / self.precision) ** 2 - 1), 0.0) * elapsed / games
+
+    def __call__(self, counts):
+        now = time.perf_counter()
+        elapsed = now - self.started
+        stop = ((self.seconds is not None and elapsed >= self.seconds) or
+                (self.precision is not None and self.std_error(counts) <= self.precision))
+        if stop or now - self.last_report >= self.report_seconds:
+            self.last_report = now
+            games = num_games_played(counts, self.players)
+            eta = self.eta(counts, games, elapsed)
+            line = f"{games:,} games in {elapsed:.0f}s, {games / max(elapsed, 1e-9):,.0f} games/s"
+            if self.precision is not None:
+                line += f", max std err {self.std_error(counts):.5f}"
+            line += ", ETA " + ('?' if eta is None else f"{eta:.0f}s")
+            print(line, file=self.file, flush=True)
+        return stop
+
+
+def run_exact(args):
+    import exact
+
+    results = exact.enumerate_classes(processes=args.workers)
+    path = args.csv or exact.DEFAULT_OUTPUT_PATH
+    exact.write_csv(results, path)
+    print(f"Wrote exact heads-up probabilities to {path}.")
+
+
+def run_sampled(args):
+    import metrics as metrics_module
+    import store as store_module
+
+    if args.output == 'sqlite':
+        store = store_module.ResultsStore(args.db or store_module.DEFAULT_PATH,
+                                          csv_path=args.csv or store_module.CSV_PATH)
+    else:
+        # seeded from the --csv file, so csv output adds to it rather than replacing it
+        store = store_module.ResultsStore(':memory:', csv_path=args.csv if args.output == 'csv' else None)
+    num_games = args.games if args.seconds is None and args.precision is None else None
+    progress = Progress(args.players, num_games, args.seconds, args.precision,
+                        base=store.to_counts() if args.precision is not None else None)
+    metrics = metrics_module.Metrics(snapshot_path=metrics_module.DEFAULT_PATH) if args.metrics else None
+    worker = run_scalar_task if args.engine == 'scalar' else None
+    run_name = args.run or time.strftime('%Y%m%d-%H%M%S')
+
+    start_time = time.time()
+    with store:
+        print(f"Run {run_name!r}.")
+        counts = scheduler.run_to_store(args.players, num_games, store, run_name, processes=args.workers,
+                                        task_size=args.task_size, seed=args.seed, metrics=metrics, worker=worker,
+                                        progress=progress)
+        if metrics is not None:
+            metrics.write_snapshot()
+        for num_players in args.players:
+            print(f"Players = {num_players}, Total hands = {store.total_played(num_players):,}.")
+        if args.output == 'sqlite':
+            store.export_csv(args.csv or store_module.CSV_PATH)
+        elif args.output == 'csv':
+            store.export_csv(args.csv)
+
+    time_elapsed = time.time() - start_time
+    total_games = num_games_played(counts, args.players)
+    print(f"Took {time_elapsed:.1f}s for {total_games:,} simulations. {total_games / time_elapsed:.0f} games/s => "
+          f"{total_games / time_elapsed / 169:.1f} hands/s.")
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--players', type=parse_players, default=parse_players('2-5'),
+                        help="player counts such as '7-10' or '2,3,6' (default 2-5)")
+    budget = parser.add_mutually_exclusive_group()
+    budget.add_argument('--games', type=int, default=DEFAULT_NUM_GAMES, help='games per player count')
+    budget.add_argument('--seconds', type=float, help='wall time to run for')
+    budget.add_argument('--precision', type=float, help='largest standard error of any equity to stop at')
+    parser.add_argument('--workers', type=int, help='worker processes (default one per core)')
+    parser.add_argument('--engine', choices=ENGINES, default='vectorized',
+                        help='exact takes about 1.3 CPU-hours, roughly 10 minutes with 8 workers')
+    parser.add_argument('--seed', type=int, help='seed entropy of a new run (default random)')
+    parser.add_argument('--task-size', type=int, default=scheduler.DEFAULT_TASK_SIZE, help='games per task')
+    parser.add_argument('--run', help='name of the run, to resume an interrupted sqlite run (default the time)')
+    parser.add_argument('--output', choices=OUTPUTS,
+                        help='where the counts go (default sqlite, or csv for the exact engine)')
+    parser.add_argument('--db', help='sqlite store path (default data/probabilities.sqlite)')
+    parser.add_argument('--csv', help='csv path to write (default data/probabilities.csv, exact_probabilities.csv '
+                                      'for the exact engine)')
+    parser.add_argument('--metrics', action='store_true', help='append instrumentation to data/metrics.jsonl')
+    args = parser.parse_args(argv)
+
+    if args.engine == 'exact':
+        if args.players != [2]:
+            parser.error('The exact engine only enumerates heads-up, pass --players 2.')
+        if args.output not in (None, 'csv'):
+            parser.error('The exact engine writes a csv of its own, pass --output csv or leave it out.')
+        return run_exact(args)
+    args.output = args.output or 'sqlite'
+    if args.output == 'csv' and args.csv is None:
+        parser.error('--output csv needs a --csv path.')
+    if args.metrics and args.engine != 'vectorized':
+        parser.error('--metrics instruments the vectorized engine only.')
+    for name in ('games', 'seconds', 'precision', 'workers', 'task_size'):
+        value = getattr(args, name)
+        if value is not None and value <= 0:
+            parser.error(f"--{name.replace('_', '-')} must be positive.")
+    return run_sampled(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+Compact won/tied/share/played counters indexed by (number of players, hole card class).
+
+won counts outright wins and tied counts split pots. share is the pot share summed over every hand played, in units
+of 1 / SHARE_UNITS of a pot: SHARE_UNITS is divisible by every winner count up to MAX_PLAYERS, so a pot split any
+number of ways adds a whole number of units and the counts stay exact integers however they are merged.
+"""
+import io
+import math
+
+import numpy as np
+
+import evaluator
+
+MAX_PLAYERS = 10
+NUM_CLASSES = 169
+SHARE_UNITS = math.lcm(*range(1, MAX_PLAYERS + 1))
+
+
+class Counts:
+    def __init__(self, won=None, played=None, tied=None, share=None):
+        """
+        without tied and share the counts are treated as legacy totals that counted every split as a win
+        """
+        shape = (MAX_PLAYERS + 1, NUM_CLASSES)
+        self.won = np.zeros(shape, dtype=np.int64) if won is None else np.asarray(won, dtype=np.int64)
+        self.played = np.zeros(shape, dtype=np.int64) if played is None else np.asarray(played, dtype=np.int64)
+        self.tied = np.zeros(shape, dtype=np.int64) if tied is None else np.asarray(tied, dtype=np.int64)
+        self.share = self.won * SHARE_UNITS if share is None else np.asarray(share, dtype=np.int64)
+
+    def __repr__(self):
+        return f"Counts({int(self.played.sum()):,} hands played)"
+
+    def __add__(self, other):
+        return Counts(self.won + other.won, self.played + other.played, self.tied + other.tied,
+                      self.share + other.share)
+
+    def __iadd__(self, other):
+        self.won += other.won
+        self.tied += other.tied
+        self.share += other.share
+        self.played += other.played
+        return self
+
+    def __eq__(self, other):
+        return all(np.array_equal(getattr(self, name), getattr(other, name))
+                   for name in ('won', 'tied', 'share', 'played'))
+
+    def record(self, num_players, hand_class, won, num_winners=1):
+        """
+        count one hand, won being whether it is among the num_winners hands that split the pot
+        """
+        self.played[num_players, hand_class] += 1
+        if won:
+            if num_winners == 1:
+                self.won[num_players, hand_class] += 1
+            else:
+                self.tied[num_players, hand_class] += 1
+            self.share[num_players, hand_class] += SHARE_UNITS // num_winners
+
+    def add(self, num_players, won, tied, share, played):
+        self.won[num_players] += won
+        self.tied[num_players] += tied
+        self.share[num_players] += share
+        self.played[num_players] += played
+
+    def players(self):
+        return [int(num_players) for num_players in np.flatnonzero(self.played.sum(axis=1))]
+
+    def probabilities(self, num_players):
+        """
+        outright won / played per hand class, nan where nothing has been played
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.won[num_players] / self.played[num_players]
+
+    def equities(self, num_players):
+        """
+        average pot share per hand class, nan where nothing has been played
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.share[num_players] / (SHARE_UNITS * self.played[num_players])
+
+    def probability(self, num_players, hand):
+        hand_class = evaluator.HAND_CLASS_INDEX[hand] if isinstance(hand, str) else hand
+        played = self.played[num_players, hand_class]
+        return self.won[num_players, hand_class] / played if played else float('nan')
+
+    def equity(self, num_players, hand):
+        hand_class = evaluator.HAND_CLASS_INDEX[hand] if isinstance(hand, str) else hand
+        played = self.played[num_players, hand_class]
+        return self.share[num_players, hand_class] / (SHARE_UNITS * played) if played else float('nan')
+
+    def rows(self, num_players=None):
+        """
+        dict(players, hand, won, tied, share, played) for every played cell, share in SHARE_UNITS
+        """
+        for players in ([num_players] if num_players is not None else self.players()):
+            for hand_class in np.flatnonzero(self.played[players]):
+                yield dict(players=players, hand=evaluator.HAND_CLASSES[hand_class],
+                           won=int(self.won[players, hand_class]), tied=int(self.tied[players, hand_class]),
+                           share=int(self.share[players, hand_class]), played=int(self.played[players, hand_class]))
+
+    def to_bytes(self):
+        buffer = io.BytesIO()
+        np.savez(buffer, won=self.won, tied=self.tied, share=self.share, played=self.played)
+        return buffer.getvalue()
+
+    @staticmethod
+    def from_bytes(data):
+        arrays = np.load(io.BytesIO(data))
+        # files written before ties were tracked only hold won and played
+        return Counts(arrays['won'], arrays['played'], arrays['tied'] if 'tied' in arrays else None,
+                      arrays['share'] if 'share' in arrays else None)
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(self.to_bytes())
+
+    @staticmethod
+    def load(path):
+        with open(path, 'rb') as f:
+            return Counts.from_bytes(f.read())
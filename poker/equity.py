@@ -0,0 +1,147 @@
+"""
+Equity of known hole cards on an optional partial board, with dead cards and random opponents.
+
+Small outcome spaces are enumerated exactly. Larger ones are sampled in batches until the 95% confidence interval
+of every known player's equity is narrower than the requested error, or the time budget runs out.
+"""
+import itertools
+import math
+import time
+
+import numpy as np
+
+import batch
+import evaluator
+
+Z_95 = 1.96
+DEFAULT_MAX_ERROR = 0.005
+DEFAULT_MAX_TIME = 0.01
+DEFAULT_BATCH_SIZE = 1000
+
+
+class Equity:
+    def __init__(self, win, tie, equity, std_err, samples, exact):
+        self.win = win
+        self.tie = tie
+        self.loss = 1 - win - tie
+        self.equity = equity
+        self.std_err = std_err
+        self.samples = samples
+        self.exact = exact
+
+    def __repr__(self):
+        error = 'exact' if self.exact else f"+/- {Z_95 * self.std_err * 100:.2f}%"
+        return f"Equity({self.equity * 100:.2f}% {error}, win {self.win * 100:.2f}%, tie {self.tie * 100:.2f}%)"
+
+
+def to_indices(cards):
+    return [card if isinstance(card, (int, np.integer)) else card.index for card in cards]
+
+
+def hole_card_indices(hole_cards):
+    return to_indices(hole_cards.cards if hasattr(hole_cards, 'cards') else hole_cards)
+
+
+def count_outcomes(num_remaining, num_board, num_random):
+    """
+    number of (board completion, ordered random opponent hands) outcomes
+    """
+    count = math.comb(num_remaining, num_board)
+    num_remaining -= num_board
+    for _ in range(num_random):
+        count *= math.comb(num_remaining, 2)
+        num_remaining -= 2
+    return count
+
+
+def enumerate_outcomes(remaining, num_board, num_random):
+    """
+    (M, num_board + 2 * num_random) array of every board completion followed by the random opponents' cards
+    """
+    def deal(cards, num_hands):
+        if num_hands == 0:
+            yield ()
+            return
+        for hand in itertools.combinations(cards, 2):
+            rest = [card for card in cards if card not in hand]
+            for hands in deal(rest, num_hands - 1):
+                yield hand + hands
+
+    outcomes = []
+    for board in itertools.combinations(remaining, num_board):
+        rest = [card for card in remaining if card not in board]
+        outcomes.extend(board + hands for hands in deal(rest, num_random))
+    return np.array(outcomes, dtype=np.int64).reshape(len(outcomes), num_board + 2 * num_random)
+
+
+def sample_outcomes(remaining, num_cards, num_samples, rng):
+    return batch.deal(num_samples, num_cards, rng, dead=np.setdiff1d(np.arange(52), remaining))
+
+
+def showdown(known, board, outcomes, num_random):
+    """
+    per-outcome (wins, ties, shares) arrays of shape (M, len(known)) for the known players
+    """
+    num_board = 5 - len(board)
+    full_boards = np.concatenate([np.tile(np.asarray(board, dtype=np.int64), (len(outcomes), 1)),
+                                  outcomes[:, :num_board]], axis=1)
+    keys, suit_bits = evaluator.board_state(full_boards)
+    scores = [evaluator.evaluate_boards(keys, suit_bits, hole_cards) for hole_cards in known]
+    for opponent in range(num_random):
+        hole_cards = outcomes[:, num_board + 2 * opponent:num_board + 2 * opponent + 2]
+        scores.append(evaluator.evaluate_batch(np.concatenate([hole_cards, full_boards], axis=1)))
+    scores = np.stack(scores, axis=1)
+
+    best = scores == scores.max(axis=1, keepdims=True)
+    num_best = best.sum(axis=1, keepdims=True)
+    best = best[:, :len(known)]
+    return best & (num_best == 1), best & (num_best > 1), best / num_best
+
+
+def calculate(hole_cards, board=None, dead=None, num_random=0, max_error=DEFAULT_MAX_ERROR, max_time=DEFAULT_MAX_TIME,
+              batch_size=DEFAULT_BATCH_SIZE, rng=None):
+    """
+    equity of every known player given a list of HoleCards (or card pairs), 0/3/4/5 board cards, dead cards and a
+    number of opponents with random hole cards
+
+    enumerates when the outcome space is no bigger than the number of samples needed for max_error, otherwise samples
+    until the 95% confidence half-width is below max_error or another batch would overrun max_time seconds
+    """
+    known = [hole_card_indices(cards) for cards in hole_cards]
+    for cards in known:
+        if len(cards) != 2:
+            raise ValueError(f"Hole cards are 2 cards, not {len(cards)}.")
+    board = to_indices(board or [])
+    used = [card for cards in known for card in cards] + board + to_indices(dead or [])
+    if len(set(used)) != len(used):
+        raise ValueError('The same card is used more than once.')
+    if len(board) not in (0, 3, 4, 5):
+        raise ValueError(f"A board has 0, 3, 4 or 5 cards, not {len(board)}.")
+    remaining = [card for card in range(52) if card not in set(used)]
+    num_board = 5 - len(board)
+    if num_board + 2 * num_random > len(remaining):
+        raise ValueError('Not enough cards left in the deck.')
+
+    # worst case (p = 0.5) number of samples needed to reach max_error
+    needed = math.ceil((Z_95 * 0.5 / max_error) ** 2)
+    if count_outcomes(len(remaining), num_board, num_random) <= needed:
+        wins, ties, shares = showdown(known, board, enumerate_outcomes(remaining, num_board, num_random), num_random)
+        return [Equity(wins[:, i].mean(), ties[:, i].mean(), shares[:, i].mean(), 0.0, len(shares), True)
+                for i in range(len(known))]
+
+    rng = np.random.default_rng() if rng is None else rng
+    start_time = time.perf_counter()
+    totals = np.zeros((4, len(known)))  # wins, ties, shares, squared shares
+    samples = 0
+    while True:
+        outcomes = sample_outcomes(remaining, num_board + 2 * num_random, batch_size, rng)
+        wins, ties, shares = showdown(known, board, outcomes, num_random)
+        totals += [wins.sum(axis=0), ties.sum(axis=0), shares.sum(axis=0), (shares ** 2).sum(axis=0)]
+        samples += batch_size
+
+        means = totals / samples
+        std_errs = np.sqrt(np.maximum(means[3] - means[2] ** 2, 0) / samples)
+        elapsed = time.perf_counter() - start_time
+        if Z_95 * std_errs.max() <= max_error or elapsed * (samples + batch_size) / samples > max_time:
+            return [Equity(means[0, i], means[1, i], means[2, i], std_errs[i], samples, False)
+                    for i in range(len(known))]
@@ -0,0 +1,266 @@
+"""
+Integer-encoded hand evaluator backed by precomputed rank and flush lookup tables.
+
+Cards are ints in [0, 52): ``index = (rank_number - 2) * 4 + suit_index`` with suits ordered as ``Deck.suits``.
+Scores are ints where a higher value is a stronger hand: the category (1 = high card ... 9 = straight flush) sits in
+the top bits followed by up to five 4-bit rank numbers in order of significance, so ``score >> 20`` gives the
+category just like the integer part of ``Hand.get_score``.
+"""
+import itertools
+import os
+
+import numpy as np
+
+import util
+
+TABLES_PATH = os.path.join(os.path.dirname(__file__), '../data/evaluator_tables.npy')
+TABLES_VERSION = 1
+
+RANKS = '23456789TJQKA'
+SUITS = 'schd'
+
+HIGH_CARD, ONE_PAIR, TWO_PAIR, THREE_OF_A_KIND, STRAIGHT, FLUSH, FULL_HOUSE, FOUR_OF_A_KIND, STRAIGHT_FLUSH = \
+    range(1, 10)
+CATEGORY_NAMES = {
+    HIGH_CARD: 'high card',
+    ONE_PAIR: 'one pair',
+    TWO_PAIR: 'two pair',
+    THREE_OF_A_KIND: 'three of a kind',
+    STRAIGHT: 'straight',
+    FLUSH: 'flush',
+    FULL_HOUSE: 'full house',
+    FOUR_OF_A_KIND: 'four of a kind',
+    STRAIGHT_FLUSH: 'straight flush',
+}
+
+# each card adds 5 ** rank to the low bits (at most 4 of a rank, so digits never carry) and 8 ** suit to the high bits
+SUIT_SHIFT = 32
+RANK_MASK = (1 << SUIT_SHIFT) - 1
+CARD_KEYS = [5 ** (card >> 2) + (8 ** (card & 3) << SUIT_SHIFT) for card in range(52)]
+
+
+def card_index(rank_number, suit):
+    return (rank_number - 2) * 4 + SUITS.index(suit)
+
+
+def card_str(card):
+    return f"{RANKS[card >> 2]}{SUITS[card & 3]}"
+
+
+def make_score(category, ranks):
+    score = category
+    for i in range(5):
+        score = (score << 4) | (ranks[i] if i < len(ranks) else 0)
+    return score
+
+
+def score_category(score):
+    return score >> 20
+
+
+def straight_high(rank_bits):
+    # rank_bits has bit (rank_number - 2) set for every rank present
+    for high in range(12, 3, -1):
+        mask = 0b11111 << (high - 4)
+        if rank_bits & mask == mask:
+            return high + 2
+    wheel = (1 << 12) | 0b1111
+    return 5 if rank_bits & wheel == wheel else 0
+
+
+def score_rank_counts(counts):
+    """
+    score the best non-flush 5 card hand given the number of cards of each rank (index 0 is a deuce)
+    """
+    groups = sorted(((count, rank + 2) for rank, count in enumerate(counts) if count), reverse=True)
+    by_rank = [rank + 2 for rank in range(12, -1, -1) if counts[rank]]
+    trips = [rank for count, rank in groups if count == 3]
+    pairs = [rank for count, rank in groups if count == 2]
+
+    if groups[0][0] == 4:
+        quad_rank = groups[0][1]
+        return make_score(FOUR_OF_A_KIND, [quad_rank, max(rank for rank in by_rank if rank != quad_rank)])
+    if len(trips) == 2 or (trips and pairs):
+        return make_score(FULL_HOUSE, [trips[0], max(trips[1:] + pairs)])
+
+    high = straight_high(sum(1 << (rank - 2) for rank in by_rank))
+    if high:
+        return make_score(STRAIGHT, [high])
+    if trips:
+        return make_score(THREE_OF_A_KIND, [trips[0]] + [rank for rank in by_rank if rank != trips[0]][:2])
+    if len(pairs) >= 2:
+        return make_score(TWO_PAIR, pairs[:2] + [max(rank for rank in by_rank if rank not in pairs[:2])])
+    if pairs:
+        return make_score(ONE_PAIR, [pairs[0]] + [rank for rank in by_rank if rank != pairs[0]][:3])
+    return make_score(HIGH_CARD, by_rank[:5])
+
+
+def score_flush_bits(rank_bits):
+    high = straight_high(rank_bits)
+    if high:
+        return make_score(STRAIGHT_FLUSH, [high])
+    return make_score(FLUSH, [rank + 2 for rank in range(12, -1, -1) if rank_bits >> rank & 1][:5])
+
+
+def _build_rank_table():
+    table = {}
+    for num_cards in range(5, 8):
+        for ranks in itertools.combinations_with_replacement(range(13), num_cards):
+            counts = [0] * 13
+            for rank in ranks:
+                counts[rank] += 1
+            if max(counts) <= 4:
+                table[sum(5 ** rank for rank in ranks)] = score_rank_counts(counts)
+    return table
+
+
+def _build_flush_table():
+    return [score_flush_bits(bits) if bin(bits).count('1') >= 5 else 0 for bits in range(1 << 13)]
+
+
+def _build_flush_suit_table():
+    # maps the summed suit key to the suit holding at least 5 cards, or -1
+    table = [-1] * (8 ** 4)
+    for suits in itertools.chain.from_iterable(
+            itertools.combinations_with_replacement(range(4), n) for n in range(5, 8)):
+        for suit in range(4):
+            if suits.count(suit) >= 5:
+                table[sum(8 ** s for s in suits)] = suit
+    return table
+
+
+def build_tables():
+    """
+    (rank keys, rank values, flush scores, flush suits) arrays of the lookup tables, built from scratch (about a
+    second, nearly all of it the rank table)
+    """
+    rank_table = _build_rank_table()
+    # sorted key / value arrays for vectorized lookups, with a trailing 0 so keys of invalid hands (repeated cards)
+    # that sort past the end still index in bounds
+    rank_keys = np.array(sorted(rank_table), dtype=np.int64)
+    rank_values = np.array([rank_table[key] for key in rank_keys.tolist()] + [0], dtype=np.int64)
+    return (rank_keys, rank_values, np.array(_build_flush_table(), dtype=np.int64),
+            np.array(_build_flush_suit_table(), dtype=np.int64))
+
+
+def load_tables(path=TABLES_PATH):
+    """
+    the lookup table arrays from the cache file at path, building and caching them first if it is missing or stale
+
+    the cache is one flat int64 .npy (version, number of rank keys, then the four arrays end to end), which loads in
+    a couple of milliseconds where an .npz would first import zipfile
+    """
+    try:
+        flat = np.load(path)
+        if flat[0] == TABLES_VERSION:
+            num_keys = int(flat[1])
+            return tuple(np.split(flat[2:], np.cumsum([num_keys, num_keys + 1, 1 << 13])))
+    except (OSError, ValueError, IndexError):
+        pass
+    tables = build_tables()
+    try:
+        with util.atomic_path(path, '.npy') as tmp_path:  # workers starting together each write their own file
+            np.save(tmp_path, np.concatenate([[TABLES_VERSION, len(tables[0])], *tables]))
+    except OSError:  # a read-only install still works, it just rebuilds every time
+        pass
+    return tables
+
+
+RANK_KEYS, RANK_VALUES, FLUSH_ARRAY, FLUSH_SUIT_ARRAY = load_tables()
+# plain dict and lists for the scalar evaluator, which indexes them faster than arrays
+RANK_TABLE = dict(zip(RANK_KEYS.tolist(), RANK_VALUES[:-1].tolist()))
+FLUSH_TABLE = FLUSH_ARRAY.tolist()
+FLUSH_SUIT = FLUSH_SUIT_ARRAY.tolist()
+CARD_KEYS_ARRAY = np.array(CARD_KEYS, dtype=np.int64)
+CARD_BITS_ARRAY = np.array([1 << (card >> 2) for card in range(52)], dtype=np.int64)
+
+
+def evaluate(cards):
+    """
+    score 5 to 7 distinct card indices
+    """
+    key = 0
+    for card in cards:
+        key += CARD_KEYS[card]
+    score = RANK_TABLE[key & RANK_MASK]
+    flush_suit = FLUSH_SUIT[key >> SUIT_SHIFT]
+    if flush_suit >= 0:
+        bits = 0
+        for card in cards:
+            if card & 3 == flush_suit:
+                bits |= 1 << (card >> 2)
+        flush_score = FLUSH_TABLE[bits]
+        if flush_score > score:
+            score = flush_score
+    return score
+
+
+def evaluate_batch(cards):
+    """
+    score an (N, 5..7) integer array of card indices, one hand per row
+    """
+    cards = np.asarray(cards, dtype=np.int64)
+    keys = CARD_KEYS_ARRAY[cards].sum(axis=1)
+    scores = RANK_VALUES[np.searchsorted(RANK_KEYS, keys & RANK_MASK)]
+
+    flush_suits = FLUSH_SUIT_ARRAY[keys >> SUIT_SHIFT]
+    flushed = np.flatnonzero(flush_suits >= 0)
+    if flushed.size:
+        flush_cards = cards[flushed]
+        in_suit = (flush_cards & 3) == flush_suits[flushed, None]
+        bits = np.where(in_suit, CARD_BITS_ARRAY[flush_cards], 0).sum(axis=1)
+        scores[flushed] = np.maximum(scores[flushed], FLUSH_ARRAY[bits])
+    return scores
+
+
+def hole_card_class(card1, card2):
+    """
+    index in [0, 169) of the two card starting hand on a 13x13 rank grid: pairs on the diagonal, suited hands at
+    (high rank, low rank) and offsuit hands at (low rank, high rank)
+    """
+    high, low = max(card1 >> 2, card2 >> 2), min(card1 >> 2, card2 >> 2)
+    if (card1 & 3) == (card2 & 3):
+        return high * 13 + low
+    return low * 13 + high
+
+
+def hand_class_name(index):
+    row, col = divmod(index, 13)
+    if row > col:
+        return f"{RANKS[row]}{RANKS[col]}s"
+    return f"{RANKS[col]}{RANKS[row]}o"
+
+
+HAND_CLASSES = [hand_class_name(index) for index in range(169)]
+HAND_CLASS_INDEX = {name: index for index, name in enumerate(HAND_CLASSES)}
+CLASS_TABLE = np.array([[hole_card_class(card1, card2) for card2 in range(52)] for card1 in range(52)], dtype=np.int64)
+
+
+def board_state(boards):
+    """
+    precompute per-board rank/suit keys and per-suit rank bitmasks for an (N, k) array of boards, so that
+    evaluate_boards can score many different hole cards against the same boards without re-reading them
+    """
+    boards = np.asarray(boards, dtype=np.int64)
+    keys = CARD_KEYS_ARRAY[boards].sum(axis=1)
+    suit_bits = np.stack([np.where((boards & 3) == suit, CARD_BITS_ARRAY[boards], 0).sum(axis=1)
+                          for suit in range(4)], axis=1)
+    return keys, suit_bits
+
+
+def evaluate_boards(keys, suit_bits, cards):
+    """
+    score the same extra cards (e.g. one player's hole cards) against every board produced by board_state
+    """
+    keys = keys + sum(CARD_KEYS[card] for card in cards)
+    scores = RANK_VALUES[np.searchsorted(RANK_KEYS, keys & RANK_MASK)]
+
+    flush_suits = FLUSH_SUIT_ARRAY[keys >> SUIT_SHIFT]
+    flushed = np.flatnonzero(flush_suits >= 0)
+    if flushed.size:
+        flush_suits = flush_suits[flushed]
+        bits = suit_bits[flushed, flush_suits]
+        for card in cards:
+            bits |= np.where(flush_suits == card & 3, 1 << (card >> 2), 0)
+        scores[flushed] = np.maximum(scores[flushed], FLUSH_ARRAY[bits])
+    return scores
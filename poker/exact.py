@@ -0,0 +1,265 @@
+"""
+Exact heads-up preflop equity by enumerating every opponent hand and every board.
+
+A hole card class is represented by one combo. Opponent combos that are equivalent under the suit permutations
+fixing the hero's cards are enumerated once and weighted by the size of their orbit. A matchup of two classes is
+enumerated from one side only, the class with the lower index, and the other side is its complement rescaled by the
+two classes' combo counts, which halves the work: a class against every other takes about a minute on one core, so
+all 169 classes take about 1.3 CPU-hours, roughly 10 minutes on 8 cores. Work is split into (hand class, opponent
+class, opponent chunk) tasks that run on a process pool, and finished tasks are checkpointed to a JSON file so an
+interrupted run picks up where it stopped.
+"""
+import csv
+import itertools
+import json
+import math
+import os
+import time
+
+import numpy as np
+
+import evaluator
+import util
+
+NUM_BOARD_CARDS = 5
+DEFAULT_CHUNK_SIZE = 32
+DEFAULT_CHECKPOINT_SECONDS = 60.0
+DEFAULT_CHECKPOINT_TASKS = 100
+CHECKPOINT_VERSION = 2  # tasks keyed by (hand class, opponent class, chunk)
+DEFAULT_CHECKPOINT_PATH = os.path.join(os.path.dirname(__file__), '../data/exact_checkpoint.json')
+DEFAULT_OUTPUT_PATH = os.path.join(os.path.dirname(__file__), '../data/exact_probabilities.csv')
+SUIT_PERMUTATIONS = list(itertools.permutations(range(4)))
+# number of combos in every hole card class: 6 per pair, 4 per suited and 12 per offsuit hand
+CLASS_COMBOS = np.bincount(evaluator.CLASS_TABLE[np.triu_indices(52, 1)], minlength=169)
+
+_board_cache = {}
+
+
+def representative(hand_class):
+    """
+    one combo (card indices) of a hole card class given by index or name
+    """
+    index = evaluator.HAND_CLASS_INDEX[hand_class] if isinstance(hand_class, str) else hand_class
+    row, col = divmod(index, 13)
+    if row == col:
+        return row * 4, row * 4 + 1
+    if row > col:
+        return row * 4, col * 4
+    return col * 4, row * 4 + 1
+
+
+def permute_suits(card, permutation):
+    return (card & ~3) | permutation[card & 3]
+
+
+def stabilizer(cards):
+    """
+    suit permutations that map the set of cards onto itself
+    """
+    cards = set(cards)
+    return [perm for perm in SUIT_PERMUTATIONS if {permute_suits(card, perm) for card in cards} == cards]
+
+
+def opponent_orbits(hero):
+    """
+    list of (opponent combo, weight) with one combo per orbit under the hero's suit stabilizer
+    """
+    perms = stabilizer(hero)
+    remaining = [card for card in range(52) if card not in hero]
+    orbits = {}
+    for combo in itertools.combinations(remaining, 2):
+        canonical = min(tuple(sorted(permute_suits(card, perm) for card in combo)) for perm in perms)
+        orbits[canonical] = orbits.get(canonical, 0) + 1
+    return sorted(orbits.items())
+
+
+def board_state(hero):
+    """
+    every board from the cards the hero does not hold, with the hero's score on each (cached per process)
+    """
+    if hero not in _board_cache:
+        _board_cache.clear()
+        remaining = np.array([card for card in range(52) if card not in hero], dtype=np.int64)
+        combos = np.fromiter(itertools.combinations(range(len(remaining)), NUM_BOARD_CARDS),
+                             dtype=np.dtype((np.int8, NUM_BOARD_CARDS)),
+                             count=math.comb(len(remaining), NUM_BOARD_CARDS))
+        boards = remaining[combos]
+        keys, suit_bits = evaluator.board_state(boards)
+        masks = (np.int64(1) << boards).sum(axis=1)
+        _board_cache[hero] = keys, suit_bits, masks, evaluator.evaluate_boards(keys, suit_bits, hero)
+    return _board_cache[hero]
+
+
+def enumerate_matchup(hero, villain):
+    """
+    (won, tied, played) for the hero over every board that does not use either player's cards
+    """
+    keys, suit_bits, masks, hero_scores = board_state(tuple(hero))
+    # boards holding a villain card score as garbage and are masked out, which is cheaper than filtering them first
+    valid = (masks & ((1 << villain[0]) | (1 << villain[1]))) == 0
+    villain_scores = evaluator.evaluate_boards(keys, suit_bits, villain)
+    return (int(np.count_nonzero(valid & (hero_scores > villain_scores))),
+            int(np.count_nonzero(valid & (hero_scores == villain_scores))), int(np.count_nonzero(valid)))
+
+
+def run_task(task):
+    """
+    enumerate one chunk of weighted opponent combos of one class and return the hero's total counts against them
+    """
+    hand_class, villain_class, chunk, orbits = task
+    hero = representative(hand_class)
+    won = tied = played = 0
+    for villain, weight in orbits:
+        matchup_won, matchup_tied, matchup_played = enumerate_matchup(hero, villain)
+        won += weight * matchup_won
+        tied += weight * matchup_tied
+        played += weight * matchup_played
+    return hand_class, villain_class, chunk, won, tied, played
+
+
+def task_key(task):
+    return f"{task[0]}:{task[1]}:{task[2]}"
+
+
+def make_tasks(pairs, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    tasks enumerating every (hand class, opponent class) pair, each pair's opponent orbits split into chunks
+    """
+    tasks = []
+    for hand_class, pair_group in itertools.groupby(sorted(pairs), key=lambda pair: pair[0]):
+        orbits = {}
+        for villain, weight in opponent_orbits(representative(hand_class)):
+            orbits.setdefault(evaluator.hole_card_class(*villain), []).append((villain, weight))
+        for _, villain_class in pair_group:
+            villain_orbits = orbits.get(villain_class, [])
+            for chunk, start in enumerate(range(0, len(villain_orbits), chunk_size)):
+                tasks.append((hand_class, villain_class, chunk, villain_orbits[start:start + chunk_size]))
+    return tasks
+
+
+def mirror(won, tied, played, hand_class, villain_class):
+    """
+    the opponent's (won, tied, played) against hand_class from hand_class's counts against the opponent's class
+
+    every combo pair of the two classes is counted once per hero combo, so the counts scale by the combo counts
+    """
+    combos, villain_combos = int(CLASS_COMBOS[hand_class]), int(CLASS_COMBOS[villain_class])
+    return tuple(int(count) * combos // villain_combos for count in (played - won - tied, tied, played))
+
+
+def load_checkpoint(path, chunk_size):
+    if path is None or not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint.get('version') != CHECKPOINT_VERSION:
+        raise ValueError(f"Checkpoint {path} was written by an older version with other tasks, remove it to rerun.")
+    # task keys are only meaningful for the chunking they were made with
+    if checkpoint['chunk_size'] != chunk_size:
+        raise ValueError(f"Checkpoint {path} was written with chunk_size={checkpoint['chunk_size']}.")
+    return checkpoint['done']
+
+
+def save_checkpoint(done, path, chunk_size):
+    with util.atomic_path(path) as tmp_path, open(tmp_path, 'w') as f:
+        json.dump(dict(version=CHECKPOINT_VERSION, chunk_size=chunk_size, done=done), f)
+
+
+def enumerate_classes(hand_classes=None, processes=None, checkpoint_path=DEFAULT_CHECKPOINT_PATH,
+                      chunk_size=DEFAULT_CHUNK_SIZE, checkpoint_seconds=DEFAULT_CHECKPOINT_SECONDS,
+                      checkpoint_tasks=DEFAULT_CHECKPOINT_TASKS):
+    """
+    exact heads-up counts for the given hand class indices (all 169 by default)
+
+    the checkpoint is rewritten every checkpoint_seconds or checkpoint_tasks finished tasks and once at the end, as
+    rewriting it after every task would make the checkpoint I/O grow quadratically over the run
+
+    returns {hand class index: (3, 169) array} of won, tied and played counts indexed by the opponent's hand class
+    """
+    hand_classes = range(169) if hand_classes is None else [
+        evaluator.HAND_CLASS_INDEX[hand] if isinstance(hand, str) else hand for hand in hand_classes]
+    # each matchup is only enumerated for the class with the lower index
+    pairs = {(min(hand_class, villain_class), max(hand_class, villain_class))
+             for hand_class in hand_classes for villain_class in range(169)}
+    done = load_checkpoint(checkpoint_path, chunk_size)
+    tasks = [task for task in make_tasks(pairs, chunk_size) if task_key(task) not in done]
+    print(f"Enumerating {len(tasks):,} tasks ({len(done):,} already checkpointed).")
+
+    unsaved, last_save = 0, time.perf_counter()
+    for i, (hand_class, villain_class, chunk, *counts) in enumerate(util.imap_tasks(run_task, tasks, processes)):
+        done[f"{hand_class}:{villain_class}:{chunk}"] = counts
+        unsaved += 1
+        if checkpoint_path is not None and (unsaved >= checkpoint_tasks or
+                                            time.perf_counter() - last_save >= checkpoint_seconds):
+            save_checkpoint(done, checkpoint_path, chunk_size)
+            unsaved, last_save = 0, time.perf_counter()
+        print(f"Finished {i + 1:,} / {len(tasks):,} tasks.")
+    if checkpoint_path is not None and unsaved:
+        save_checkpoint(done, checkpoint_path, chunk_size)
+
+    totals = {}
+    for key, counts in done.items():
+        hand_class, villain_class, _ = map(int, key.split(':'))
+        if (hand_class, villain_class) in pairs:
+            totals[hand_class, villain_class] = totals.get((hand_class, villain_class), 0) + np.array(counts)
+    results = {hand_class: np.zeros((3, 169), dtype=np.int64) for hand_class in hand_classes}
+    for (hand_class, villain_class), (won, tied, played) in totals.items():
+        if hand_class in results:
+            results[hand_class][:, villain_class] = won, tied, played
+        if villain_class in results and villain_class != hand_class:
+            results[villain_class][:, hand_class] = mirror(won, tied, played, hand_class, villain_class)
+    return results
+
+
+def summarize(results):
+    """
+    collapse per-opponent-class counts to total (won, tied, played) per hand class name
+    """
+    return {evaluator.HAND_CLASSES[hand_class]: tuple(int(total) for total in counts.sum(axis=1))
+            for hand_class, counts in results.items()}
+
+
+def write_csv(results, path=DEFAULT_OUTPUT_PATH, num_players=2):
+    """
+    totals in the same columns as data/probabilities.csv, a heads-up split being worth half a pot
+    """
+    import store
+
+    rows = sorted(summarize(results).items(), key=lambda item: -(item[1][0] + item[1][1] / 2) / item[1][2])
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(store.CSV_COLUMNS)
+        for hand, (won, tied, played) in rows:
+            share = won + tied / 2
+            writer.writerow([hand, num_players, won, tied, played, share, won / played, share / played])
+
+
+def compare(results, sampled_path, num_players=2):
+    """
+    z-score of each sampled equity in a probabilities.csv style table against the exact value
+
+    legacy tables without an equity column counted splits as wins, so they are compared on (won + tied) / played
+    """
+    exact = summarize(results)
+    comparison = {}
+    with open(sampled_path, newline='') as f:
+        for row in csv.DictReader(f):
+            if int(row['players']) != num_players or row['hand'] not in exact:
+                continue
+            won, tied, played = exact[row['hand']]
+            if 'equity' in row:
+                exact_prob, sampled_prob = (won + tied / 2) / played, float(row['equity'])
+            else:
+                exact_prob, sampled_prob = (won + tied) / played, int(row['won']) / int(row['played'])
+            std_err = math.sqrt(exact_prob * (1 - exact_prob) / int(row['played']))
+            comparison[row['hand']] = (exact_prob, sampled_prob, (sampled_prob - exact_prob) / std_err)
+    return comparison
+
+
+if __name__ == '__main__':
+    sampled_path = os.path.join(os.path.dirname(__file__), '../data/probabilities.csv')
+    results = enumerate_classes()
+    write_csv(results)
+    for hand, (exact_prob, sampled_prob, z_score) in sorted(compare(results, sampled_path).items(),
+                                                            key=lambda item: -abs(item[1][2]))[:10]:
+        print(f"{hand}: exact {exact_prob:.4f}, sampled {sampled_prob:.4f}, z = {z_score:+.1f}")
@@ -0,0 +1,85 @@
+"""
+O(1) preflop win probability lookups over data/probabilities.csv.
+
+The table is held as a (players, 169) float array indexed by hole card class, cached next to the CSV as a .npy file
+that is memory-mapped on later loads. Nothing here imports pandas.
+"""
+import csv
+import os
+
+import numpy as np
+
+from counts import MAX_PLAYERS, NUM_CLASSES
+import evaluator
+import util
+
+CSV_PATH = os.path.join(os.path.dirname(__file__), '../data/probabilities.csv')
+
+
+def card_index(card):
+    return card if isinstance(card, (int, np.integer)) else card.index
+
+
+def hand_index(hand):
+    """
+    hole card class index of a class name ('AKs'), a class index or a pair of cards (Card objects or card indices)
+    """
+    if isinstance(hand, str):
+        return evaluator.HAND_CLASS_INDEX[hand]
+    if isinstance(hand, (int, np.integer)):
+        return int(hand)
+    card1, card2 = hand.cards if hasattr(hand, 'cards') else hand
+    return evaluator.hole_card_class(card_index(card1), card_index(card2))
+
+
+def canonical(card1, card2):
+    """
+    class name such as 'AKs' or '72o' of two cards, matching HoleCards.__repr__
+    """
+    return evaluator.HAND_CLASSES[evaluator.hole_card_class(card_index(card1), card_index(card2))]
+
+
+class EquityTable:
+    def __init__(self, probabilities):
+        self.probabilities = probabilities
+
+    def __repr__(self):
+        return f"EquityTable(players={self.players()})"
+
+    def players(self):
+        return [int(num_players) for num_players in np.flatnonzero(~np.isnan(self.probabilities).all(axis=1))]
+
+    def get(self, hand, num_players):
+        return float(self.probabilities[num_players, hand_index(hand)])
+
+    def batch(self, hands, num_players):
+        """
+        probabilities for an array of class indices, or an (N, 2) array of card indices
+        """
+        hands = np.asarray(hands)
+        if hands.ndim == 2:
+            hands = evaluator.CLASS_TABLE[hands[:, 0], hands[:, 1]]
+        return self.probabilities[num_players, hands]
+
+    @staticmethod
+    def from_csv(path=CSV_PATH):
+        """
+        pot share equities, or the prob column of legacy files that have no equity column
+        """
+        probabilities = np.full((MAX_PLAYERS + 1, NUM_CLASSES), np.nan)
+        with open(path, newline='') as f:
+            for row in csv.DictReader(f):
+                value = row['equity'] if 'equity' in row else row['prob']
+                probabilities[int(row['players']), evaluator.HAND_CLASS_INDEX[row['hand']]] = float(value)
+        return EquityTable(probabilities)
+
+    @staticmethod
+    def load(path=CSV_PATH, cache_path=None):
+        """
+        memory-map the cached array, rebuilding it first if the CSV is newer
+        """
+        cache_path = os.path.splitext(path)[0] + '.npy' if cache_path is None else cache_path
+        if not os.path.exists(cache_path) or os.path.getmtime(cache_path) < os.path.getmtime(path):
+            with util.atomic_path(cache_path, '.npy') as tmp_path:
+                np.save(tmp_path, EquityTable.from_csv(path).probabilities)
+        return EquityTable(np.load(cache_path, mmap_mode='r'))
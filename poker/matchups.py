@@ -0,0 +1,237 @@
+"""
+Heads-up hand class vs hand class equities.
+
+equities[i, j] is the pot share (win + tie / 2) of class i against class j, averaged over every combo pair that does
+not share a card. weights[i, j] is the number of such combo pairs, so weights / weights.sum() is the joint deal
+probability of the two classes.
+
+build fills the full (win, tie, loss) matrix as a (3, 169, 169) float64 .npy file, one row per hero class, either
+exactly (every villain combo and board, see exact.py) or by sampling. The file is created up front with NaN rows and
+memory-mapped, so every finished row is flushed straight to disk and a restarted build only computes the rows that
+are still missing. Matrix serves rows and range vs range aggregates from the mapped file.
+"""
+import itertools
+import os
+
+import numpy as np
+
+import batch
+import evaluator
+import exact
+import util
+
+DEFAULT_PATH = os.path.join(os.path.dirname(__file__), '../data/matchups.npy')
+DEFAULT_MATRIX_PATH = os.path.join(os.path.dirname(__file__), '../data/matchup_matrix.npy')
+DEFAULT_NUM_BOARDS = 500
+WIN, TIE, LOSS = range(3)
+
+COMBOS = np.array(list(itertools.combinations(range(52), 2)), dtype=np.int64)
+COMBO_CLASSES = evaluator.CLASS_TABLE[COMBOS[:, 0], COMBOS[:, 1]]
+COMBO_MASKS = (np.int64(1) << COMBOS).sum(axis=1)
+
+
+def class_weights():
+    """
+    (169, 169) number of non-conflicting combo pairs per pair of classes
+    """
+    compatible = (COMBO_MASKS[:, None] & COMBO_MASKS[None, :]) == 0
+    one_hot = np.zeros((len(COMBOS), 169))
+    one_hot[np.arange(len(COMBOS)), COMBO_CLASSES] = 1
+    return one_hot.T @ compatible @ one_hot
+
+
+def hand_class_index(hand):
+    return evaluator.HAND_CLASS_INDEX[hand] if isinstance(hand, str) else int(hand)
+
+
+def sample_combos(hand_class, num_samples, rng):
+    combos = np.flatnonzero(COMBO_CLASSES == hand_class)
+    return COMBOS[combos[rng.integers(len(combos), size=num_samples)]]
+
+
+def sample_row(hand_class, num_boards, rng):
+    """
+    (3, 169) sampled (won, tied, played) counts of hand_class against every class, num_boards random combo pairs and
+    boards per opponent class
+    """
+    num_samples = 169 * num_boards
+    hero = sample_combos(hand_class, num_samples, rng)
+    villain = np.concatenate([sample_combos(villain_class, num_boards, rng) for villain_class in range(169)])
+    # redraw villain combos that collide with the hero's cards
+    while True:
+        conflicts = np.flatnonzero((hero[:, :, None] == villain[:, None, :]).any(axis=(1, 2)))
+        if conflicts.size == 0:
+            break
+        villain[conflicts] = np.concatenate([sample_combos(villain_class, 1, rng)
+                                             for villain_class in conflicts // num_boards])
+
+    boards = batch.deal(num_samples, 5, rng, dead=np.concatenate([hero, villain], axis=1))
+    hero_scores = evaluator.evaluate_batch(np.concatenate([hero, boards], axis=1)).reshape(169, num_boards)
+    villain_scores = evaluator.evaluate_batch(np.concatenate([villain, boards], axis=1)).reshape(169, num_boards)
+    return np.stack([(hero_scores > villain_scores).sum(axis=1), (hero_scores == villain_scores).sum(axis=1),
+                     np.full(169, num_boards)])
+
+
+def estimate_row(hand_class, num_boards, rng):
+    """
+    sampled equities of hand_class against every class, num_boards random combo pairs and boards per opponent class
+    """
+    won, tied, played = sample_row(hand_class, num_boards, rng)
+    return (won + 0.5 * tied) / played
+
+
+def estimate(num_boards=DEFAULT_NUM_BOARDS, rng=None):
+    """
+    (169, 169) sampled equity matrix, made exactly antisymmetric around 0.5
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    equities = np.stack([estimate_row(hand_class, num_boards, rng) for hand_class in range(169)])
+    return (equities + 1 - equities.T) / 2
+
+
+def load(path=DEFAULT_PATH, num_boards=DEFAULT_NUM_BOARDS, matrix_path=DEFAULT_MATRIX_PATH):
+    """
+    the equities of a complete built matrix, otherwise the cached sampled equity matrix, estimating and saving it
+    first if there is none
+    """
+    if matrix_path is not None and os.path.exists(matrix_path):
+        matrix = Matrix.load(matrix_path)
+        if not matrix.missing_rows():
+            return matrix.equities()
+    if not os.path.exists(path):
+        equities = estimate(num_boards)
+        np.save(path, equities)
+    return np.load(path)
+
+
+def make_tasks(hand_classes, exact_rows=False, num_boards=DEFAULT_NUM_BOARDS, entropy=None,
+               chunk_size=exact.DEFAULT_CHUNK_SIZE):
+    """
+    exact rows are split into exact.py's (opponent class, chunk) tasks so one row spreads over the pool, sampled rows
+    are one task each with an RNG stream keyed by the row
+    """
+    hand_classes = [hand_class_index(hand) for hand in hand_classes]
+    if exact_rows:
+        pairs = [(hand_class, villain_class) for hand_class in hand_classes for villain_class in range(169)]
+        return [(True, task) for task in exact.make_tasks(pairs, chunk_size)]
+    return [(False, (hand_class, num_boards, np.random.SeedSequence(entropy, spawn_key=(hand_class,))))
+            for hand_class in hand_classes]
+
+
+def run_task(task):
+    """
+    (hand class, (3, 169) won, tied and played counts) of one task
+    """
+    exact_row, args = task
+    if exact_row:
+        hand_class, villain_class, _, won, tied, played = exact.run_task(args)
+        counts = np.zeros((3, 169), dtype=np.int64)
+        counts[:, villain_class] = won, tied, played
+        return hand_class, counts
+    hand_class, num_boards, seed = args
+    return hand_class, sample_row(hand_class, num_boards, np.random.default_rng(seed))
+
+
+def build(path=DEFAULT_MATRIX_PATH, hand_classes=None, exact_rows=False, num_boards=DEFAULT_NUM_BOARDS,
+          processes=None, seed=None, chunk_size=exact.DEFAULT_CHUNK_SIZE):
+    """
+    fill the missing rows of the matrix file at path (created if needed) for the given hand class indices, all 169 by
+    default, on a pool sized to the machine by default
+
+    rows already in the file are kept whichever way they were computed; returns the memory-mapped Matrix
+    """
+    if not os.path.exists(path):
+        with util.atomic_path(path, '.npy') as tmp_path:
+            np.save(tmp_path, np.full((3, 169, 169), np.nan))
+    matrix = np.lib.format.open_memmap(path, mode='r+')
+    if matrix.shape != (3, 169, 169):
+        raise ValueError(f"{path} holds a {matrix.shape} array, not a (3, 169, 169) matchup matrix.")
+    hand_classes = range(169) if hand_classes is None else [hand_class_index(hand) for hand in hand_classes]
+    missing = [hand_class for hand_class in hand_classes if np.isnan(matrix[:, hand_class]).any()]
+    tasks = make_tasks(missing, exact_rows, num_boards, np.random.SeedSequence(seed).entropy, chunk_size)
+    remaining = {hand_class: 0 for hand_class in missing}
+    for _, (hand_class, *_) in tasks:
+        remaining[hand_class] += 1
+    print(f"Building {len(missing):,} matchup rows ({len(hand_classes) - len(missing):,} already built).")
+
+    counts = {hand_class: np.zeros((3, 169), dtype=np.int64) for hand_class in missing}
+    for hand_class, task_counts in util.imap_tasks(run_task, tasks, processes):
+        counts[hand_class] += task_counts
+        remaining[hand_class] -= 1
+        if remaining[hand_class]:
+            continue
+        won, tied, played = counts.pop(hand_class)
+        matrix[:, hand_class] = np.stack([won, tied, played - won - tied]) / played
+        matrix.flush()
+        print(f"Finished {evaluator.HAND_CLASSES[hand_class]} ({len(missing) - len(counts):,} / {len(missing):,}).")
+    del matrix
+    return Matrix.load(path)
+
+
+class Matrix:
+    def __init__(self, matrix, weights=None):
+        """
+        matrix is a (3, 169, 169) array of win, tie and loss probabilities, weights the combo pair counts of
+        class_weights (computed when first needed)
+        """
+        self.matrix = matrix
+        self._weights = weights
+        self._weighted = None
+
+    def __repr__(self):
+        return f"Matrix(rows={169 - len(self.missing_rows())} / 169)"
+
+    def missing_rows(self):
+        return np.flatnonzero(np.isnan(self.matrix).any(axis=(0, 2))).tolist()
+
+    @property
+    def weights(self):
+        if self._weights is None:
+            self._weights = class_weights()
+        return self._weights
+
+    def row(self, hand):
+        """
+        (3, 169) win, tie and loss probabilities of a class (name or index) against every class
+        """
+        return self.matrix[:, hand_class_index(hand)]
+
+    def equities(self):
+        return self.matrix[WIN] + self.matrix[TIE] / 2
+
+    def equity(self, hero, villain):
+        win, tie, _ = self.row(hero)[:, hand_class_index(villain)]
+        return float(win + tie / 2)
+
+    def range_vs_range(self, hero, villain):
+        """
+        (win, tie, loss) of one range against another, each a (169,) array of the fraction of every class held or
+        a ranges.Range
+
+        every class pair counts once per non-conflicting combo pair, so the aggregate is hero @ (weights * matrix) @
+        villain over hero @ weights @ villain, with the weighted matrix computed once
+        """
+        hero, villain = class_fractions(hero), class_fractions(villain)
+        missing = self.missing_rows()
+        if (hero[missing] > 0).any():
+            raise ValueError('The matchup matrix is missing rows for hands in the hero range.')
+        if self._weighted is None:
+            self._weighted = np.nan_to_num(self.weights * self.matrix)
+        return hero @ self._weighted @ villain / (hero @ self.weights @ villain)
+
+    @staticmethod
+    def load(path=DEFAULT_MATRIX_PATH):
+        return Matrix(np.load(path, mmap_mode='r'))
+
+
+def class_fractions(hand_range):
+    """
+    (169,) fraction of each class's combos held by a ranges.Range, or the array itself
+    """
+    if hasattr(hand_range, 'weights'):
+        return np.bincount(COMBO_CLASSES, hand_range.weights, minlength=169) / np.bincount(COMBO_CLASSES, minlength=169)
+    return np.asarray(hand_range, dtype=float)
+
+
+if __name__ == '__main__':
+    build(exact_rows=True, seed=0)
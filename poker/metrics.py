@@ -0,0 +1,135 @@
+"""
+Optional instrumentation for the simulation hot paths.
+
+A Metrics object accumulates per-phase time (shuffle, deal, evaluate, winner selection, count update), deals and
+hands played and the hand category distribution, and appends JSON-lines snapshots to a file at most every
+snapshot_every seconds. Engines only touch it when one is passed in, so a disabled run pays nothing but an
+`is None` check. Metrics pickle as plain attributes, so pool workers return theirs and the parent merges them.
+"""
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+import evaluator
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+PHASES = SHUFFLE, DEAL, EVALUATE, WINNER, UPDATE = 'shuffle', 'deal', 'evaluate', 'winner', 'update'
+DEFAULT_PATH = os.path.join(os.path.dirname(__file__), '../data/metrics.jsonl')
+DEFAULT_SNAPSHOT_EVERY = 10.0
+
+
+def max_rss_bytes():
+    """
+    peak resident memory of this process, or None where the resource module is missing
+    """
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024  # kilobytes on Linux
+
+
+class Stopwatch:
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self.last = time.perf_counter()
+
+    def lap(self, phase):
+        """
+        charge the time since the previous lap to phase
+        """
+        now = time.perf_counter()
+        self.metrics.phase_seconds[phase] += now - self.last
+        self.last = now
+
+
+class Metrics:
+    def __init__(self, snapshot_path=None, snapshot_every=DEFAULT_SNAPSHOT_EVERY):
+        self.phase_seconds = dict.fromkeys(PHASES, 0.0)
+        self.categories = np.zeros(evaluator.STRAIGHT_FLUSH + 1, dtype=np.int64)
+        self.deals = 0
+        self.hands = 0
+        self.worker_max_rss_bytes = None
+        self.snapshot_path = snapshot_path
+        self.snapshot_every = snapshot_every
+        self.started = time.perf_counter()
+        self.last_snapshot = self.started
+
+    def __repr__(self):
+        return f"Metrics(deals={self.deals:,}, hands={self.hands:,})"
+
+    def __getstate__(self):
+        # pickled on the way back from a pool worker, so capture the peak memory of the process that did the work
+        state = self.__dict__.copy()
+        state['worker_max_rss_bytes'] = max(self.worker_max_rss_bytes or 0, max_rss_bytes() or 0) or None
+        return state
+
+    def stopwatch(self):
+        return Stopwatch(self)
+
+    def record(self, scores, num_deals=1):
+        """
+        count num_deals deals whose player hands scored scores, snapshotting if one is due
+        """
+        if isinstance(scores, np.ndarray):
+            self.categories += np.bincount(evaluator.score_category(scores.ravel()), minlength=len(self.categories))
+            self.hands += scores.size
+        else:
+            for score in scores:
+                self.categories[evaluator.score_category(score)] += 1
+            self.hands += len(scores)
+        self.deals += num_deals
+        if self.snapshot_path is not None and time.perf_counter() - self.last_snapshot >= self.snapshot_every:
+            self.write_snapshot()
+
+    def merge(self, other):
+        """
+        add a worker's metrics into this one, keeping this one's clock and snapshot settings
+        """
+        for phase, seconds in other.phase_seconds.items():
+            self.phase_seconds[phase] += seconds
+        self.categories += other.categories
+        self.deals += other.deals
+        self.hands += other.hands
+        if other.worker_max_rss_bytes is not None:
+            self.worker_max_rss_bytes = max(self.worker_max_rss_bytes or 0, other.worker_max_rss_bytes)
+        if self.snapshot_path is not None and time.perf_counter() - self.last_snapshot >= self.snapshot_every:
+            self.write_snapshot()
+        return self
+
+    def snapshot(self):
+        elapsed = time.perf_counter() - self.started
+        total_phase_seconds = sum(self.phase_seconds.values())
+        return dict(
+            time=time.time(),
+            elapsed_seconds=elapsed,
+            deals=self.deals,
+            hands=self.hands,
+            deals_per_second=self.deals / elapsed if elapsed > 0 else 0.0,
+            phase_seconds=self.phase_seconds.copy(),
+            phase_shares={phase: seconds / total_phase_seconds if total_phase_seconds > 0 else 0.0
+                          for phase, seconds in self.phase_seconds.items()},
+            categories={evaluator.CATEGORY_NAMES[category]: int(self.categories[category])
+                        for category in evaluator.CATEGORY_NAMES},
+            max_rss_bytes=max_rss_bytes(),
+            worker_max_rss_bytes=self.worker_max_rss_bytes,
+        )
+
+    def write_snapshot(self, path=None):
+        """
+        append the current snapshot as one JSON line
+        """
+        path = self.snapshot_path if path is None else path
+        snapshot = self.snapshot()
+        with open(path, 'a') as f:
+            f.write(json.dumps(snapshot) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self.last_snapshot = time.perf_counter()
+        return snapshot
@@ -0,0 +1,287 @@
+"""
+Weighted hand ranges and heads-up hand/range vs range equity.
+
+A Range is a weight per two card combo (in matchups.COMBOS order) parsed from text such as "22+, A9s+, KQo, AhKh:0.5"
+or "top 15%", where the top of the range follows the heads-up equity ordering of data/probabilities.csv.
+
+Equities are computed over one shared set of boards: every complete board on the flop or later, or a random sample
+preflop. Each board is read once, each villain combo is scored once per board with the same table lookups that give
+Hand.score, and every hero combo is then compared against the whole villain score matrix. Boards and combos that
+collide with the hero's or the villain's cards are masked out instead of being redrawn. Boards are split into chunks
+that run on a process pool, and the per-chunk totals are added up in the parent.
+"""
+import itertools
+import math
+import re
+
+import numpy as np
+
+import equity
+import evaluator
+import lookup
+import matchups
+import util
+
+DEFAULT_NUM_BOARDS = 5000
+DEFAULT_CHUNK_SIZE = 500
+NUM_COMBOS = len(matchups.COMBOS)
+COMBO_INDEX = {tuple(combo): index for index, combo in enumerate(matchups.COMBOS.tolist())}
+
+RANK = f"[{evaluator.RANKS}]"
+SUIT = f"[{evaluator.SUITS}]"
+TOP_PATTERN = re.compile(r'(?:top\s*)?(\d+(?:\.\d+)?)%')
+COMBO_PATTERN = re.compile(f"({RANK})({SUIT})({RANK})({SUIT})")
+CLASS_PATTERN = re.compile(f"({RANK})({RANK})([so]?)(\\+?)")
+SPAN_PATTERN = re.compile(f"({RANK})({RANK})([so]?)-({RANK})({RANK})([so]?)")
+
+# totals accumulated per hero combo: weighted wins, ties and pot shares, the weight of valid (villain, board) pairs,
+# and the per-board sums of squares and products needed for the standard error of the share / weight ratio
+WINS, TIES, SHARES, WEIGHTS, SHARES_SQUARED, WEIGHTS_SQUARED, PRODUCTS = range(7)
+
+
+def class_index(high, low, suited):
+    """
+    hand class of rank indices (0 is a deuce) as evaluator.hole_card_class
+    """
+    if high == low:
+        return high * 13 + high
+    high, low = max(high, low), min(high, low)
+    return high * 13 + low if suited else low * 13 + high
+
+
+def class_combos(hand_classes):
+    return np.isin(matchups.COMBO_CLASSES, list(hand_classes))
+
+
+def expand_class(high, low, kind, plus):
+    """
+    class indices of e.g. AK (both), AKs, AKo, 99+ or A9s+ (kicker up to one below the high card)
+    """
+    if high == low:
+        return [class_index(rank, rank, False) for rank in (range(high, 13) if plus else [high])]
+    high, low = max(high, low), min(high, low)
+    kinds = [True, False] if not kind else [kind == 's']
+    kickers = range(low, high) if plus else [low]
+    return [class_index(high, kicker, suited) for kicker in kickers for suited in kinds]
+
+
+def expand_span(first, last):
+    """
+    class indices of e.g. QQ-88 or A5s-A2s, inclusive
+    """
+    (high1, low1, kind1), (high2, low2, kind2) = first, last
+    if high1 == low1 and high2 == low2:
+        return [class_index(rank, rank, False) for rank in range(min(high1, high2), max(high1, high2) + 1)]
+    if high1 != high2 or kind1 != kind2 or high1 == low1 or high2 == low2:
+        raise ValueError('A span must keep its high card and suitedness, e.g. A5s-A2s.')
+    return list(itertools.chain.from_iterable(
+        expand_class(high1, kicker, kind1, False) for kicker in range(min(low1, low2), max(low1, low2) + 1)))
+
+
+class Range:
+    def __init__(self, weights=None):
+        """
+        weights is a (1326,) array of combo weights in matchups.COMBOS order, the empty range by default
+        """
+        self.weights = np.zeros(NUM_COMBOS) if weights is None else np.asarray(weights, dtype=float)
+
+    def __repr__(self):
+        return f"Range({self.size():.0f} combos, {self.fraction() * 100:.1f}%)"
+
+    def __or__(self, other):
+        return Range(np.maximum(self.weights, other.weights))
+
+    def size(self):
+        return float(self.weights.sum())
+
+    def fraction(self):
+        return self.size() / NUM_COMBOS
+
+    def combos(self):
+        """
+        (card index pairs, weights) of every combo with a positive weight
+        """
+        indices = np.flatnonzero(self.weights > 0)
+        return matchups.COMBOS[indices], self.weights[indices]
+
+    def classes(self):
+        """
+        names of the hand classes with at least one combo in the range
+        """
+        return [evaluator.HAND_CLASSES[index] for index in np.unique(matchups.COMBO_CLASSES[self.weights > 0])]
+
+    def without(self, cards):
+        """
+        the range with every combo holding one of cards removed
+        """
+        dead = sum(1 << card for card in equity.to_indices(cards))
+        return Range(np.where(matchups.COMBO_MASKS & dead, 0, self.weights))
+
+    @staticmethod
+    def from_classes(hand_classes, weight=1.0):
+        return Range(class_combos(hand_classes) * weight)
+
+    @staticmethod
+    def top(percent, equities=None):
+        """
+        the strongest classes by heads-up equity that make up percent of all combos, rounding to the nearest class
+        """
+        if equities is None:
+            equities = lookup.EquityTable.load().probabilities[2]
+        order = np.argsort(-np.nan_to_num(np.asarray(equities, dtype=float), nan=-1), kind='stable')
+        class_sizes = np.bincount(matchups.COMBO_CLASSES, minlength=169)[order]
+        before = np.cumsum(class_sizes) - class_sizes
+        target = percent / 100 * NUM_COMBOS
+        return Range.from_classes(order[before + class_sizes / 2 <= target])
+
+    @staticmethod
+    def parse(text, equities=None):
+        """
+        union of comma separated tokens, each optionally weighted as token:weight (a later token's weight wins where
+        tokens overlap); equities order "top X%" tokens
+        """
+        weights = np.zeros(NUM_COMBOS)
+        for token in filter(None, (token.strip() for token in text.split(','))):
+            token, _, weight = token.partition(':')
+            token, weight = token.strip(), float(weight) if weight else 1.0
+            token_range = Range.parse_token(token, equities)
+            weights = np.where(token_range.weights > 0, weight, weights)
+        return Range(weights)
+
+    @staticmethod
+    def parse_token(token, equities=None):
+        if token.lower() in ('any', 'random'):
+            return Range(np.ones(NUM_COMBOS))
+        if match := TOP_PATTERN.fullmatch(token.lower()):
+            return Range.top(float(match.group(1)), equities)
+        if match := COMBO_PATTERN.fullmatch(token):
+            card1 = evaluator.card_index(evaluator.RANKS.index(match.group(1)) + 2, match.group(2))
+            card2 = evaluator.card_index(evaluator.RANKS.index(match.group(3)) + 2, match.group(4))
+            if card1 == card2:
+                raise ValueError(f"Combo {token!r} holds the same card twice.")
+            weights = np.zeros(NUM_COMBOS)
+            weights[COMBO_INDEX[tuple(sorted((card1, card2)))]] = 1
+            return Range(weights)
+        if match := SPAN_PATTERN.fullmatch(token):
+            first, last = [(evaluator.RANKS.index(high), evaluator.RANKS.index(low), kind)
+                           for high, low, kind in (match.group(1, 2, 3), match.group(4, 5, 6))]
+            return Range.from_classes(expand_span(first, last))
+        if match := CLASS_PATTERN.fullmatch(token):
+            high, low, kind, plus = match.groups()
+            high, low = evaluator.RANKS.index(high), evaluator.RANKS.index(low)
+            if high == low and kind == 's':
+                raise ValueError(f"A pair cannot be suited: {token!r}.")
+            return Range.from_classes(expand_class(high, low, kind if high != low else '', bool(plus)))
+        raise ValueError(f"Cannot parse range token {token!r}.")
+
+
+def to_range(hands):
+    return hands if isinstance(hands, Range) else Range.parse(hands)
+
+
+def deal_boards(board, dead, num_boards, rng):
+    """
+    (board completions, exact) with every completion when there are at most num_boards of them, else a sample
+    """
+    remaining = [card for card in range(52) if card not in set(board) | set(dead)]
+    num_cards = 5 - len(board)
+    count = math.comb(len(remaining), num_cards)
+    if count <= num_boards:
+        completions = np.array(list(itertools.combinations(remaining, num_cards)), dtype=np.int64)
+        return completions.reshape(count, num_cards), True
+    rng = np.random.default_rng() if rng is None else rng
+    return equity.sample_outcomes(remaining, num_cards, num_boards, rng), False
+
+
+def run_task(task):
+    """
+    (7, heroes) per-hero totals and (7,) totals over the weighted hero range for one chunk of boards
+    """
+    heroes, hero_weights, villains, villain_weights, board, completions = task
+    full_boards = np.concatenate([np.tile(np.asarray(board, dtype=np.int64), (len(completions), 1)), completions],
+                                 axis=1)
+    keys, suit_bits = evaluator.board_state(full_boards)
+    board_masks = (np.int64(1) << completions).sum(axis=1)
+    villain_masks = (np.int64(1) << villains).sum(axis=1)
+    villain_scores = np.stack([evaluator.evaluate_boards(keys, suit_bits, villain) for villain in villains])
+    villain_valid = ((villain_masks[:, None] & board_masks[None, :]) == 0) * villain_weights[:, None]
+
+    totals = np.zeros((7, len(heroes)))
+    range_shares, range_weights = np.zeros((2, len(completions)))
+    for i, hero in enumerate(heroes):
+        hero_mask = (1 << int(hero[0])) | (1 << int(hero[1]))
+        weighted = villain_valid * ((villain_masks & hero_mask) == 0)[:, None] * ((board_masks & hero_mask) == 0)
+        hero_scores = evaluator.evaluate_boards(keys, suit_bits, hero)
+        wins = weighted * (hero_scores > villain_scores)
+        ties = weighted * (hero_scores == villain_scores)
+        shares = (wins + ties / 2).sum(axis=0)
+        weights = weighted.sum(axis=0)
+        totals[:, i] = [wins.sum(), ties.sum(), shares.sum(), weights.sum(),
+                        shares @ shares, weights @ weights, shares @ weights]
+        range_shares += hero_weights[i] * shares
+        range_weights += hero_weights[i] * weights
+    range_totals = totals @ hero_weights
+    range_totals[[SHARES_SQUARED, WEIGHTS_SQUARED, PRODUCTS]] = [
+        range_shares @ range_shares, range_weights @ range_weights, range_shares @ range_weights]
+    return totals, range_totals
+
+
+def make_equity(totals, num_boards, exact):
+    """
+    Equity from one column of totals, the standard error treating boards as independent samples of a ratio
+    """
+    weight = totals[WEIGHTS]
+    if weight == 0:
+        raise ValueError('No villain combo is compatible with the hero and the board.')
+    share = totals[SHARES] / weight
+    variance = totals[SHARES_SQUARED] - 2 * share * totals[PRODUCTS] + share ** 2 * totals[WEIGHTS_SQUARED]
+    std_err = 0.0 if exact else math.sqrt(max(variance, 0)) / weight
+    return equity.Equity(totals[WINS] / weight, totals[TIES] / weight, share, std_err, num_boards, exact)
+
+
+def calculate_totals(heroes, hero_weights, villain, board, dead, num_boards, processes, chunk_size, rng):
+    board, dead = equity.to_indices(board or []), equity.to_indices(dead or [])
+    if len(board) not in (0, 3, 4, 5):
+        raise ValueError(f"A board has 0, 3, 4 or 5 cards, not {len(board)}.")
+    if len(set(board + dead)) != len(board + dead):
+        raise ValueError('The same card is used more than once.')
+    villains, villain_weights = to_range(villain).without(board + dead).combos()
+    completions, exact = deal_boards(board, dead, num_boards, rng)
+    tasks = [(heroes, hero_weights, villains, villain_weights, board, completions[start:start + chunk_size])
+             for start in range(0, len(completions), chunk_size)]
+
+    results = list(util.imap_tasks(run_task, tasks, 1 if len(tasks) == 1 else processes))
+    totals = sum(task_totals for task_totals, _ in results)
+    range_totals = sum(task_range_totals for _, task_range_totals in results)
+    return totals, range_totals, len(completions), exact
+
+
+def hands_vs_range(hands, villain, board=None, dead=None, num_boards=DEFAULT_NUM_BOARDS, processes=None,
+                   chunk_size=DEFAULT_CHUNK_SIZE, rng=None):
+    """
+    Equity of each hero hand (HoleCards or card pairs) against a villain Range or range text, all evaluated on the
+    same boards: every completion if there are at most num_boards of them, otherwise num_boards random ones
+    """
+    heroes = [equity.hole_card_indices(hand) for hand in hands]
+    for hand in heroes:
+        if len(hand) != 2:
+            raise ValueError(f"Hole cards are 2 cards, not {len(hand)}.")
+    heroes = np.array(heroes, dtype=np.int64).reshape(-1, 2)
+    used = set(equity.to_indices(board or [])) | set(equity.to_indices(dead or []))
+    if any(card in used for card in heroes.ravel().tolist()):
+        raise ValueError('A hero hand uses a board or dead card.')
+    totals, _, num_boards, exact = calculate_totals(heroes, np.ones(len(heroes)), villain, board, dead, num_boards,
+                                                    processes, chunk_size, rng)
+    return [make_equity(totals[:, i], num_boards, exact) for i in range(len(heroes))]
+
+
+def range_vs_range(hero, villain, board=None, dead=None, num_boards=DEFAULT_NUM_BOARDS, processes=None,
+                   chunk_size=DEFAULT_CHUNK_SIZE, rng=None):
+    """
+    Equity of a hero Range (or range text) against a villain range, weighting every pair of combos by both weights
+    """
+    used = equity.to_indices(board or []) + equity.to_indices(dead or [])
+    heroes, hero_weights = to_range(hero).without(used).combos()
+    _, range_totals, num_boards, exact = calculate_totals(heroes, hero_weights, villain, board, dead, num_boards,
+                                                          processes, chunk_size, rng)
+    return make_equity(range_totals, num_boards, exact)
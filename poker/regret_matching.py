@@ -1,127 +1,168 @@
-from __future__ import division
-from random import random
 import numpy as np
-import pandas as pd
 
 '''
-    Use regret-matching algorithm to play Scissors-Rock-Paper.
+    Use regret-matching algorithm to play Scissors-Rock-Paper, or any two-player normal-form game given as payoff
+    matrices with integer actions.
 '''
 
+
 class RPS:
     actions = ['ROCK', 'PAPER', 'SCISSORS']
     n_actions = 3
-    utilities = pd.DataFrame([
+    utilities = np.array([
         # ROCK  PAPER  SCISSORS
         [ 0,    -1,    1], # ROCK
         [ 1,     0,   -1], # PAPER
         [-1,     1,    0]  # SCISSORS
-    ], columns=actions, index=actions)
+    ])
 
 
-class Player:
-    def __init__(self, name):
-        self.strategy, self.avg_strategy,\
-        self.strategy_sum, self.regret_sum = np.zeros((4, RPS.n_actions))
-        self.name = name
-        self.all_regret_sum = []
+def regret_matching(regret_sum):
+    """
+    set the preference (strategy) of choosing an action to be proportional to positive regrets, one row per game
+    e.g, a strategy that prefers PAPER can be [0.2, 0.6, 0.2]; with no positive regret play uniformly
+    """
+    positive = np.maximum(regret_sum, 0)
+    summation = positive.sum(axis=-1, keepdims=True)
+    return np.where(summation > 0, positive / np.where(summation > 0, summation, 1), 1 / regret_sum.shape[-1])
 
-    def __repr__(self):
-        return self.name
 
-    def update_strategy(self):
-        """
-        set the preference (strategy) of choosing an action to be proportional to positive regrets
-        e.g, a strategy that prefers PAPER can be [0.2, 0.6, 0.2]
-        """
-        self.strategy = np.copy(self.regret_sum)
-        self.strategy[self.strategy < 0] = 0  # reset negative regrets to zero
+def normalise(strategy_sum):
+    summation = strategy_sum.sum(axis=-1, keepdims=True)
+    return np.where(summation > 0, strategy_sum / np.where(summation > 0, summation, 1), 1 / strategy_sum.shape[-1])
 
-        summation = sum(self.strategy)
-        if summation > 0:
-            # normalise
-            self.strategy /= summation
-        else:
-            # uniform distribution to reduce exploitability
-            self.strategy = np.repeat(1 / RPS.n_actions, RPS.n_actions)
 
-        self.strategy_sum += self.strategy
+class RegretMatching:
+    def __init__(self, utilities, opponent_utilities=None, n_games=1, expected=False, history=0, seed=None):
+        """
+        utilities[a, b] is the first player's payoff for actions (a, b); the second player's payoffs default to the
+        zero-sum -utilities. n_games independent games are played side by side as rows of every array.
 
-    def regret(self, my_action, opp_action):
+        expected=True updates regrets against the opponent's full strategy instead of a sampled action, and
+        history > 0 keeps the last `history` regret vectors per player in a ring buffer
+        """
+        utilities = np.asarray(utilities, dtype=float)
+        opponent_utilities = -utilities if opponent_utilities is None else np.asarray(opponent_utilities, dtype=float)
+        # each player's payoffs indexed by [own action, opponent action]
+        self.utilities = [utilities, opponent_utilities.T]
+        self.n_games = n_games
+        self.expected = expected
+        self.regret_sum = [np.zeros((n_games, player_utilities.shape[0])) for player_utilities in self.utilities]
+        self.strategy_sum = [np.zeros_like(regret_sum) for regret_sum in self.regret_sum]
+        self.history = [np.zeros((history,) + regret_sum.shape) for regret_sum in self.regret_sum] if history else None
+        self.iterations = 0
+        self.rng = np.random.default_rng(seed)
+
+    def strategies(self):
+        return [regret_matching(regret_sum) for regret_sum in self.regret_sum]
+
+    def sample(self, strategy):
         """
-        we here define the regret of not having chosen an action as the difference between the utility of that action
-        and the utility of the action we actually chose, with respect to the fixed choices of the other player.
+        one action index per game drawn from each row of strategy
+        """
+        actions = (self.rng.random((self.n_games, 1)) >= strategy.cumsum(axis=1)).sum(axis=1)
+        return np.minimum(actions, strategy.shape[1] - 1)
 
-        compute the regret and add it to regret sum.
+    def step(self):
+        """
+        play one iteration of every game and return the sampled (first, second) actions, or None in expected mode
         """
-        result = RPS.utilities.loc[my_action, opp_action]
-        facts = RPS.utilities.loc[:, opp_action].values
-        regret = facts - result
-        self.regret_sum += regret
-        self.all_regret_sum += [regret]
+        strategies = self.strategies()
+        for strategy_sum, strategy in zip(self.strategy_sum, strategies):
+            strategy_sum += strategy
+
+        if self.expected:
+            actions = None
+            values = [strategies[1] @ self.utilities[0].T, strategies[0] @ self.utilities[1].T]
+            regrets = [value - (value * strategy).sum(axis=1, keepdims=True)
+                       for value, strategy in zip(values, strategies)]
+        else:
+            # regret of not having chosen an action is its utility minus the utility of the action actually chosen
+            actions = [self.sample(strategy) for strategy in strategies]
+            regrets = [utilities[:, opp_actions].T - utilities[my_actions, opp_actions][:, None]
+                       for utilities, my_actions, opp_actions in
+                       zip(self.utilities, actions, reversed(actions))]
+
+        for player, regret in enumerate(regrets):
+            self.regret_sum[player] += regret
+            if self.history is not None:
+                self.history[player][self.iterations % len(self.history[player])] = regret
+        self.iterations += 1
+        return actions
+
+    def run(self, iterations):
+        for _ in range(iterations):
+            self.step()
+        return self
+
+    def average_strategies(self):
+        # averaged strategy converges to Nash Equilibrium
+        return [normalise(strategy_sum) for strategy_sum in self.strategy_sum]
 
-    def action(self, use_avg=False):
+    def regret_history(self, player):
+        """
+        stored regret vectors of a player, oldest first
         """
-        select an action according to strategy probabilities
+        if self.history is None:
+            raise ValueError('Regret history is only kept when history > 0.')
+        history = self.history[player]
+        if self.iterations < len(history):
+            return history[:self.iterations]
+        return np.roll(history, -(self.iterations % len(history)), axis=0)
+
+    def exploitability(self):
         """
-        strategy = self.avg_strategy if use_avg else self.strategy
-        return np.random.choice(RPS.actions, p=strategy)
+        per game, how much the two players could gain in total by best responding to each other's average strategy
+        """
+        strategies = self.average_strategies()
+        values = [strategies[1] @ self.utilities[0].T, strategies[0] @ self.utilities[1].T]
+        current = (values[0] * strategies[0]).sum(axis=1) + (values[1] * strategies[1]).sum(axis=1)
+        return values[0].max(axis=1) + values[1].max(axis=1) - current
 
-    def learn_avg_strategy(self):
-        # averaged strategy converges to Nash Equilibrium
-        summation = sum(self.strategy_sum)
-        if summation > 0:
-            self.avg_strategy = self.strategy_sum / summation
-        else:
-            self.avg_strategy = np.repeat(1/RPS.n_actions, RPS.n_actions)
+
+class Player:
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return self.name
 
 
 class Game:
-    def __init__(self, max_game=1000):
+    def __init__(self, max_game=1000, seed=None):
         self.p1 = Player('Alasdair')
         self.p2 = Player('Calum')
         self.max_game = max_game
+        self.engine = RegretMatching(RPS.utilities, seed=seed)
+        self.avg_strategies = None
 
     def winner(self, a1, a2):
-        result = RPS.utilities.loc[a1, a2]
+        result = RPS.utilities[a1, a2]
         if result == 1:     return self.p1
         elif result == -1:  return self.p2
         else:               return 'Draw'
 
     def play(self, avg_regret_matching=False):
-        def play_regret_matching():
-            for i in range(self.max_game):
-                self.p1.update_strategy()
-                self.p2.update_strategy()
-                a1 = self.p1.action()
-                a2 = self.p2.action()
-                self.p1.regret(a1, a2)
-                self.p2.regret(a2, a1)
-
-                winner = self.winner(a1, a2)
-                num_wins[winner] += 1
-
-        def play_avg_regret_matching():
-            for i in range(self.max_game):
-                a1 = self.p1.action(use_avg=True)
-                a2 = self.p2.action(use_avg=True)
-                winner = self.winner(a1, a2)
-                num_wins[winner] += 1
+        if not avg_regret_matching:
+            actions = np.array([np.concatenate(self.engine.step()) for _ in range(self.max_game)])
+        else:
+            actions = np.stack([self.engine.rng.choice(RPS.n_actions, size=self.max_game, p=strategy[0])
+                                for strategy in self.avg_strategies], axis=1)
 
+        results = RPS.utilities[actions[:, 0], actions[:, 1]]
         num_wins = {
-            self.p1: 0,
-            self.p2: 0,
-            'Draw': 0
+            self.p1: int(np.count_nonzero(results == 1)),
+            self.p2: int(np.count_nonzero(results == -1)),
+            'Draw': int(np.count_nonzero(results == 0))
         }
-
-        play_regret_matching() if not avg_regret_matching else play_avg_regret_matching()
         print(num_wins)
+        return num_wins
 
     def conclude(self):
         """
         let two players conclude the average strategy from the previous strategy stats
         """
-        self.p1.learn_avg_strategy()
-        self.p2.learn_avg_strategy()
+        self.avg_strategies = self.engine.average_strategies()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,167 @@
+"""
+Process pool scheduler for batched simulations.
+
+Every player count is split into fixed-size (player count, games) tasks, each with its own RNG stream keyed by
+(player count, chunk) so a player count's results do not depend on which others run alongside it. Workers
+return only the per-class count arrays, which the parent reduces by addition. When metrics are requested every
+worker instruments its own task and returns its Metrics alongside the counts for the parent to merge.
+
+run_to_store streams the results into a ResultsStore instead: the parent is the single writer, committing the
+buffered deltas together with the keys of the tasks that produced them on a time or task count interval. A task's
+RNG stream only depends on the run's entropy and its key, so the entropy and the finished keys are all the state a
+restarted run needs.
+"""
+import itertools
+import multiprocessing as mp
+import queue
+import time
+
+import numpy as np
+
+import batch
+from counts import Counts
+from metrics import Metrics
+
+DEFAULT_TASK_SIZE = 200000
+DEFAULT_TASKS_PER_WORKER = 4
+DEFAULT_FLUSH_SECONDS = 30.0
+DEFAULT_FLUSH_TASKS = 100
+
+
+def iter_tasks(players, num_games, task_size, entropy):
+    """
+    lazily yield (num_players, num_games, seed sequence) tasks, interleaved across player counts so a slow player
+    count is spread over the whole run instead of holding back its end; num_games=None never runs out of tasks
+    """
+    def player_tasks(num_players):
+        starts = itertools.count(0, task_size) if num_games is None else range(0, num_games, task_size)
+        for chunk, start in enumerate(starts):
+            yield (num_players, task_size if num_games is None else min(task_size, num_games - start),
+                   np.random.SeedSequence(entropy, spawn_key=(num_players, chunk)))
+
+    per_players = [player_tasks(num_players) for num_players in sorted(players, reverse=True)]
+    return (task for task in itertools.chain.from_iterable(itertools.zip_longest(*per_players)) if task is not None)
+
+
+def make_tasks(players, num_games, task_size=DEFAULT_TASK_SIZE, seed=None):
+    return list(iter_tasks(players, num_games, task_size, np.random.SeedSequence(seed).entropy))
+
+
+def task_key(task):
+    """
+    'players:chunk' name of a task, stable across restarts of the same run
+    """
+    num_players, chunk = task[2].spawn_key
+    return f"{num_players}:{chunk}"
+
+
+def run_task(task):
+    num_players, num_games, seed = task
+    return (num_players, *batch.run(num_players, num_games, rng=np.random.default_rng(seed)))
+
+
+def run_instrumented_task(task):
+    num_players, num_games, seed = task
+    task_metrics = Metrics()
+    totals = batch.run(num_players, num_games, rng=np.random.default_rng(seed), metrics=task_metrics)
+    return (num_players, *totals, task_metrics)
+
+
+def stream(tasks, processes=None, instrumented=False, tasks_per_worker=DEFAULT_TASKS_PER_WORKER, worker=None):
+    """
+    run tasks on a pool and yield (task, result) pairs as they complete
+
+    tasks are pulled lazily and at most tasks_per_worker per worker are in flight, so memory stays flat however long
+    the task iterable is, and a slow task only holds up its own result; worker replaces run_task, e.g. with another
+    engine returning the same tuple
+    """
+    processes = processes or mp.cpu_count()
+    if worker is None:
+        worker = run_instrumented_task if instrumented else run_task
+    finished = queue.SimpleQueue()
+
+    def next_result():
+        task, result, error = finished.get()
+        if error is not None:
+            raise error
+        return task, result
+
+    with mp.Pool(processes) as pool:
+        in_flight = 0
+        for task in tasks:
+            pool.apply_async(worker, (task,), callback=lambda result, task=task: finished.put((task, result, None)),
+                             error_callback=lambda error, task=task: finished.put((task, None, error)))
+            in_flight += 1
+            if in_flight >= processes * tasks_per_worker:
+                in_flight -= 1
+                yield next_result()
+        for _ in range(in_flight):
+            yield next_result()
+
+
+def run(players, num_games, processes=None, task_size=DEFAULT_TASK_SIZE, seed=None, metrics=None):
+    """
+    simulate num_games for every player count on a pool sized to the machine by default, merging every worker's
+    instrumentation into metrics if given
+
+    returns the merged Counts
+    """
+    tasks = make_tasks(players, num_games, task_size, seed)
+    counts = Counts()
+    for i, (_, (num_players, won, tied, share, played, *task_metrics)) in enumerate(
+            stream(tasks, processes, instrumented=metrics is not None)):
+        counts.add(num_players, won, tied, share, played)
+        if metrics is not None:
+            metrics.merge(*task_metrics)
+        print(f"Finished {i + 1:,} / {len(tasks):,} tasks.")
+    return counts
+
+
+def run_to_store(players, num_games, store, name, processes=None, task_size=DEFAULT_TASK_SIZE, seed=None,
+                 flush_seconds=DEFAULT_FLUSH_SECONDS, flush_tasks=DEFAULT_FLUSH_TASKS, metrics=None, worker=None,
+                 progress=None):
+    """
+    stream the results of run `name` into a ResultsStore, checkpointing every flush_seconds or flush_tasks tasks
+
+    calling it again with the same name resumes the run: its seed entropy comes from the store and checkpointed
+    tasks are skipped, so a resumed run adds exactly the counts an uninterrupted one would have
+
+    num_games=None runs until progress, called with the Counts added so far after every task, returns True (progress
+    can stop a bounded run early the same way); worker is passed on to stream
+
+    returns the Counts added by this call
+    """
+    entropy = np.random.SeedSequence(seed).entropy
+    # open-ended runs are registered with num_games = 0
+    stored_entropy = store.start_run(name, entropy, num_games or 0, task_size)
+    if seed is not None and stored_entropy != entropy:
+        raise ValueError(f"Run {name!r} was started with a different seed.")
+    done = store.done_tasks(name)
+    tasks = (task for task in iter_tasks(players, num_games, task_size, stored_entropy) if task_key(task) not in done)
+    if done:
+        print(f"Resuming run {name!r} with {len(done):,} tasks already checkpointed.")
+
+    counts, pending, pending_keys = Counts(), Counts(), []
+    last_flush = time.perf_counter()
+    for task, (num_players, won, tied, share, played, *task_metrics) in stream(
+            tasks, processes, instrumented=metrics is not None, worker=worker):
+        pending.add(num_players, won, tied, share, played)
+        pending_keys.append(task_key(task))
+        if metrics is not None:
+            metrics.merge(*task_metrics)
+        # tasks still in flight when progress stops the run are dropped, and a resumed run redoes them
+        if progress is not None and progress(counts + pending):
+            break
+        if len(pending_keys) >= flush_tasks or time.perf_counter() - last_flush >= flush_seconds:
+            store.checkpoint(pending, name, pending_keys)
+            print(f"Checkpointed {len(done) + len(pending_keys):,} tasks of run {name!r}.")
+            counts += pending
+            done.update(pending_keys)
+            pending, pending_keys = Counts(), []
+            last_flush = time.perf_counter()
+    if pending_keys:
+        store.checkpoint(pending, name, pending_keys)
+        counts += pending
+        done.update(pending_keys)
+    print(f"Run {name!r} finished with {len(done):,} tasks.")
+    return counts
@@ -0,0 +1,379 @@
+"""
+Long-lived local equity service.
+
+    python service.py --socket /tmp/equity.sock    # or --port 8765 for localhost TCP
+
+Requests and responses are JSON lines: {"id": 1, "method": "equity", "params": {...}} is answered with
+{"id": 1, "result": ...} or {"id": 1, "error": "..."}. Methods:
+
+    preflop   {"hand": "AKs", "players": 3}                    equity from data/probabilities.csv
+    evaluate  {"cards": [[12, 51, ...], ...]}                  evaluator scores of 5 to 7 card hands
+    equity    {"hands": ["AsKs", "QdQc"], "board": "2c7h9d", "dead": "", "random": 0}
+    metrics   {}                                               latency percentiles, queue depth and cache stats
+
+Evaluate requests that arrive within batch_window seconds of each other are merged into one evaluate_batch call.
+Equity queries run on a process pool so the event loop keeps serving, identical concurrent queries share one
+computation, and finished results are kept in an LRU. LocalClient runs a Service on a background event loop in the
+same process, so callers and tests need no socket at all.
+"""
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import json
+import socket
+import threading
+import time
+
+import numpy as np
+
+import equity
+import evaluator
+from lookup import EquityTable
+
+DEFAULT_CACHE_SIZE = 10000
+DEFAULT_BATCH_WINDOW = 0.002
+DEFAULT_MAX_BATCH = 50000
+LATENCY_WINDOW = 10000
+METHODS = ('preflop', 'evaluate', 'equity', 'metrics')
+
+
+def parse_cards(cards):
+    """
+    card indices of a string such as 'AsKd', a list of card strings or a list of card indices
+    """
+    if cards is None:
+        return []
+    if isinstance(cards, str):
+        cards = [cards[i:i + 2] for i in range(0, len(cards.replace(' ', '')), 2)] if cards else []
+    indices = []
+    for card in cards:
+        if isinstance(card, str):
+            if len(card) != 2 or card[0] not in evaluator.RANKS or card[1] not in evaluator.SUITS:
+                raise ValueError(f"{card!r} is not a card such as 'As' or 'Td'.")
+            card = evaluator.card_index(evaluator.RANKS.index(card[0]) + 2, card[1])
+        elif int(card) not in range(52):
+            raise ValueError(f"{card!r} is not a card index from 0 to 51.")
+        indices.append(int(card))
+    if len(set(indices)) != len(indices):
+        raise ValueError(f"{cards!r} repeats a card.")
+    return indices
+
+
+def run_equity(hands, board, dead, num_random, max_error, max_time):
+    """
+    equity.calculate as plain dicts, run in a pool worker
+    """
+    results = equity.calculate(hands, board, dead, num_random, max_error=max_error, max_time=max_time)
+    return [dict(win=float(result.win), tie=float(result.tie), equity=float(result.equity),
+                 std_err=float(result.std_err), samples=int(result.samples), exact=bool(result.exact))
+            for result in results]
+
+
+class Service:
+    def __init__(self, table=None, processes=None, cache_size=DEFAULT_CACHE_SIZE, batch_window=DEFAULT_BATCH_WINDOW,
+                 max_batch=DEFAULT_MAX_BATCH):
+        """
+        table is an EquityTable for preflop lookups (data/probabilities.csv, loaded on first use, by default)
+        """
+        self.table = table
+        self.processes = processes
+        self.executor = None
+        self.cache_size = cache_size
+        self.cache = collections.OrderedDict()
+        self.running = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.batch = []
+        self.batch_rows = 0
+        self.batch_handle = None
+        self.num_batches = 0
+        self.batched_rows = 0
+        self.latencies = {method: collections.deque(maxlen=LATENCY_WINDOW) for method in METHODS}
+        self.errors = 0
+        self.started = time.perf_counter()
+
+    def __repr__(self):
+        return f"Service(requests={sum(len(latencies) for latencies in self.latencies.values()):,})"
+
+    async def handle(self, request):
+        """
+        response dict for a request dict
+        """
+        start = time.perf_counter()
+        method = request.get('method')
+        response = dict(id=request.get('id'))
+        try:
+            if method not in METHODS:
+                raise ValueError(f"Unknown method {method!r}, expected one of {', '.join(METHODS)}.")
+            response['result'] = await getattr(self, method)(**request.get('params', {}))
+        except (ValueError, TypeError, KeyError) as error:
+            self.errors += 1
+            response['error'] = str(error)
+        except Exception as error:
+            # anything unexpected still gets a response, so a client waiting on this id never hangs
+            self.errors += 1
+            response['error'] = f"{type(error).__name__}: {error}"
+        else:
+            self.latencies[method].append(time.perf_counter() - start)
+        return response
+
+    async def preflop(self, hand, players=2):
+        if self.table is None:
+            self.table = EquityTable.load()
+        if players not in range(2, len(self.table.probabilities)):
+            raise ValueError(f"Players must be from 2 to {len(self.table.probabilities) - 1}, not {players!r}.")
+        is_class = isinstance(hand, str) and hand in evaluator.HAND_CLASS_INDEX
+        value = self.table.get(hand if is_class else parse_cards(hand), players)
+        if np.isnan(value):
+            raise ValueError(f"No preflop equity for {hand} with {players} players.")
+        return value
+
+    async def evaluate(self, cards):
+        """
+        scores of a list of 5 to 7 card hands, evaluated together with every other hand queued in the same window
+        """
+        cards = np.array([parse_cards(hand) for hand in cards], dtype=np.int64)
+        if cards.ndim != 2 or not 5 <= cards.shape[1] <= 7:
+            raise ValueError('Hands are lists of 5 to 7 cards of the same length.')
+        future = asyncio.get_running_loop().create_future()
+        self.batch.append((cards, future))
+        self.batch_rows += len(cards)
+        if self.batch_rows >= self.max_batch:
+            self.flush()
+        elif self.batch_handle is None:
+            self.batch_handle = asyncio.get_running_loop().call_later(self.batch_window, self.flush)
+        return (await future).tolist()
+
+    def flush(self):
+        """
+        score every queued evaluate request with one evaluate_batch call per hand length
+        """
+        if self.batch_handle is not None:
+            self.batch_handle.cancel()
+            self.batch_handle = None
+        batch, self.batch, self.batch_rows = self.batch, [], 0
+        for num_cards in {cards.shape[1] for cards, _ in batch}:
+            requests = [(cards, future) for cards, future in batch if cards.shape[1] == num_cards]
+            try:
+                scores = evaluator.evaluate_batch(np.concatenate([cards for cards, _ in requests]))
+            except Exception as error:
+                # requests are validated before they are queued, but a failed batch must never leave one waiting
+                for _, future in requests:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            self.num_batches += 1
+            self.batched_rows += len(scores)
+            start = 0
+            for cards, future in requests:
+                if not future.done():
+                    future.set_result(scores[start:start + len(cards)])
+                start += len(cards)
+
+    async def equity(self, hands, board=None, dead=None, random=0, max_error=equity.DEFAULT_MAX_ERROR,
+                     max_time=equity.DEFAULT_MAX_TIME):
+        hands = [parse_cards(hand) for hand in hands]
+        for hand in hands:
+            if len(hand) != 2:
+                raise ValueError(f"Hands are 2 cards, not {len(hand)}.")
+        key = (tuple(map(tuple, hands)), tuple(parse_cards(board)), tuple(sorted(parse_cards(dead))), random,
+               max_error, max_time)
+        result = self.cache.get(key)
+        if result is not None:
+            self.cache.move_to_end(key)
+            self.cache_hits += 1
+            # every caller gets its own dicts, so mutating a response cannot corrupt the cache
+            return [dict(player) for player in result]
+        self.cache_misses += 1
+        if key not in self.running:
+            # identical queries in flight wait on the same computation
+            if self.executor is None:
+                self.executor = concurrent.futures.ProcessPoolExecutor(self.processes)
+            self.running[key] = asyncio.get_running_loop().run_in_executor(
+                self.executor, run_equity, hands, list(key[1]), list(key[2]), random, max_error, max_time)
+        try:
+            result = await asyncio.shield(self.running[key])
+        finally:
+            self.running.pop(key, None)
+        self.cache[key] = result
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return [dict(player) for player in result]
+
+    async def metrics(self):
+        return self.snapshot()
+
+    def snapshot(self):
+        latencies = {}
+        for method, samples in self.latencies.items():
+            if samples:
+                p50, p99 = np.percentile(np.array(samples), [50, 99]) * 1e3
+                latencies[method] = dict(count=len(samples), p50_ms=float(p50), p99_ms=float(p99))
+        lookups = self.cache_hits + self.cache_misses
+        return dict(
+            uptime_seconds=time.perf_counter() - self.started,
+            latencies=latencies,
+            errors=self.errors,
+            queue_depth=dict(evaluate_rows=self.batch_rows, equity_queries=len(self.running)),
+            batches=self.num_batches,
+            mean_batch_rows=self.batched_rows / self.num_batches if self.num_batches else 0.0,
+            cache=dict(entries=len(self.cache), hits=self.cache_hits, misses=self.cache_misses,
+                       hit_rate=self.cache_hits / lookups if lookups else 0.0),
+        )
+
+    async def serve_connection(self, reader, writer):
+        """
+        answer JSON line requests concurrently, so a slow equity query does not hold back the ones behind it
+        """
+        lock = asyncio.Lock()
+
+        async def respond(line):
+            try:
+                response = await self.handle(json.loads(line))
+            except json.JSONDecodeError as error:
+                response = dict(id=None, error=f"Invalid JSON: {error}.")
+            except Exception as error:  # e.g. a line that is valid JSON but not a request object
+                response = dict(id=None, error=f"{type(error).__name__}: {error}")
+            async with lock:
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+
+        tasks = set()
+        while line := await reader.readline():
+            task = asyncio.create_task(respond(line))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        await asyncio.gather(*tasks)
+        writer.close()
+
+    async def start(self, path=None, host='127.0.0.1', port=None):
+        """
+        listen on a Unix socket at path, or on host:port
+        """
+        if path is not None:
+            return await asyncio.start_unix_server(self.serve_connection, path)
+        return await asyncio.start_server(self.serve_connection, host, port)
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+
+class BaseClient:
+    def request(self, method, **params):
+        raise NotImplementedError
+
+    def call(self, method, **params):
+        response = self.request(method, **params)
+        if 'error' in response:
+            raise ValueError(response['error'])
+        return response['result']
+
+    def preflop(self, hand, players=2):
+        return self.call('preflop', hand=hand, players=players)
+
+    def evaluate(self, cards):
+        return self.call('evaluate', cards=cards)
+
+    def equity(self, hands, board=None, dead=None, random=0, **options):
+        return self.call('equity', hands=hands, board=board, dead=dead, random=random, **options)
+
+    def metrics(self):
+        return self.call('metrics')
+
+
+class LocalClient(BaseClient):
+    """
+    runs a Service on an event loop in a background thread of this process
+    """
+    def __init__(self, service=None):
+        self.service = Service() if service is None else service
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.next_id = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def request(self, method, **params):
+        self.next_id += 1
+        request = dict(id=self.next_id, method=method, params=params)
+        return asyncio.run_coroutine_threadsafe(self.service.handle(request), self.loop).result()
+
+    def request_many(self, requests):
+        """
+        send (method, params) pairs concurrently, as several bots would, and return the responses in order
+        """
+        async def gather():
+            return await asyncio.gather(*(self.service.handle(dict(id=i, method=method, params=params))
+                                          for i, (method, params) in enumerate(requests)))
+        return asyncio.run_coroutine_threadsafe(gather(), self.loop).result()
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.service.close()
+
+
+class Client(BaseClient):
+    """
+    blocking client for a running service
+    """
+    def __init__(self, path=None, host='127.0.0.1', port=None):
+        if path is not None:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.connect(path)
+        else:
+            self.socket = socket.create_connection((host, port))
+        self.file = self.socket.makefile('rwb')
+        self.next_id = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def request(self, method, **params):
+        self.next_id += 1
+        self.file.write(json.dumps(dict(id=self.next_id, method=method, params=params)).encode() + b'\n')
+        self.file.flush()
+        return json.loads(self.file.readline())
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+
+async def serve(path=None, host='127.0.0.1', port=None, processes=None):
+    service = Service(processes=processes)
+    server = await service.start(path, host, port)
+    print(f"Serving equities on {path or f'{host}:{port}'}.")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--socket', help='Unix socket path to listen on')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--processes', type=int, help='equity worker processes (default one per core)')
+    args = parser.parse_args(argv)
+    asyncio.run(serve(args.socket, args.host, args.port, args.processes))
+
+
+if __name__ == '__main__':
+    main()
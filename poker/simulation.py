@@ -1,38 +1,92 @@
 import itertools
+import operator
 import random
-import time
-import pprint
-import os
-import multiprocessing as mp
+import sys
 import collections
-import pandas as pd
+import numpy as np
 from typing import List
 
+import adaptive
+import batch
+import evaluator
+import exact
+import metrics as metrics_module
+from counts import Counts
+
+PROGRESS_EVERY = 100000
+
 
 class Game:
-    def __init__(self, num_players):
+    def __init__(self, num_players, counts=None, seed=None, cache=None):
+        """
+        cache is an optional cache.EvaluationCache used to score every hand
+        """
         self.num_players = num_players
+        self.cache = cache
         self.players = [Player() for _ in range(num_players)]
-        self.deck = Deck()
-        self.probabilities = {}
-
-    def run_simulations(self, n, result_queue):
+        self.deck = Deck(seed)
+        self.counts = Counts() if counts is None else counts
+        self.metrics = None
+
+    def run_simulations(self, n, result_queue, metrics=None):
+        """
+        simulate n games and put this game on result_queue, with the run's Metrics attached as self.metrics if given
+        """
+        simulate = self.simulate if metrics is None else lambda: self.simulate_instrumented(metrics)
         for i in range(n):
-            if i % 1e5 == 0:
+            if i % PROGRESS_EVERY == 0:
                 print(f"Running {i:,} / {n:,} simulations for {self.num_players} players.")
-            self.simulate()
+            simulate()
+        self.metrics = metrics
         result_queue.put(self)
 
     def simulate(self):
         self.deck.shuffle()
         self.deck.deal_hole_cards(self.players)
         self.deck.deal_community_cards()
-        player_hands = [player.get_hand(self.deck.community_cards) for player in self.players]
+        player_hands = [player.get_hand(self.deck.community_cards, self.cache) for player in self.players]
+        winning_hands = self.get_winning_hands(player_hands)
+        self.update_probabilities(player_hands, winning_hands)
+
+    def simulate_instrumented(self, metrics):
+        """
+        simulate with every phase timed into metrics; kept apart from simulate so an uninstrumented run pays nothing
+        """
+        stopwatch = metrics.stopwatch()
+        self.deck.shuffle()
+        stopwatch.lap(metrics_module.SHUFFLE)
+        self.deck.deal_hole_cards(self.players)
+        self.deck.deal_community_cards()
+        stopwatch.lap(metrics_module.DEAL)
+        player_hands = [player.get_hand(self.deck.community_cards, self.cache) for player in self.players]
+        stopwatch.lap(metrics_module.EVALUATE)
         winning_hands = self.get_winning_hands(player_hands)
+        stopwatch.lap(metrics_module.WINNER)
         self.update_probabilities(player_hands, winning_hands)
+        stopwatch.lap(metrics_module.UPDATE)
+        metrics.record([hand.score for hand in player_hands])
+
+    def simulate_batch(self, n, rng=None, chunk_size=batch.DEFAULT_CHUNK_SIZE):
+        self.counts.add(self.num_players, *batch.run(self.num_players, n, rng=rng, chunk_size=chunk_size))
+
+    def simulate_adaptive(self, target_std_err, batch_size=adaptive.DEFAULT_BATCH_SIZE, max_games=None, rng=None):
+        return adaptive.run(self.counts, [self.num_players], target_std_err, batch_size=batch_size,
+                            max_games=max_games, rng=rng)
+
+    def enumerate_probabilities(self, hands=None, processes=None, checkpoint_path=exact.DEFAULT_CHECKPOINT_PATH):
+        """
+        exact (won, tied, played) per hand class instead of sampling, written to data/exact_probabilities.csv
+        """
+        if self.num_players != 2:
+            raise ValueError('Exact enumeration is only feasible heads-up.')
+        results = exact.enumerate_classes(hands, processes=processes, checkpoint_path=checkpoint_path)
+        exact.write_csv(results, num_players=self.num_players)
+        return exact.summarize(results)
 
     def print_probabilities(self):
-        print({k: v for k, v in sorted(self.probabilities.items(), key=lambda prob: -prob[1].probability)})
+        equities = self.counts.equities(self.num_players)
+        print({evaluator.HAND_CLASSES[index]: f"{equities[index] * 100:.2f}%"
+               for index in np.argsort(-equities) if self.counts.played[self.num_players, index]})
 
     @staticmethod
     def get_winning_hands(hands):
@@ -41,46 +95,18 @@ class Game:
         return winning_hands
 
     def update_probabilities(self, player_hands, winning_hands):
+        num_winners = len(winning_hands)
         for hand in player_hands:
-            prob = self.probabilities.get(str(hand.hole_cards), Probability())
-            self.probabilities[str(hand.hole_cards)] = prob.update(hand in winning_hands)
-
-    def store_probabilities(self):
-        path = os.path.join(os.path.dirname(__file__), '../data/probabilities.csv')
-        orig_df = pd.read_csv(path)
-        prob_df = pd.DataFrame(
-            [dict(players=self.num_players, hand=hand, new_won=prob.hands_won, new_played=prob.hands_played)
-             for hand, prob in self.probabilities.items()])
-
-        df = pd.merge(orig_df, prob_df, on=['players', 'hand'], how='outer')
-        df.fillna(0, inplace=True)
-        df['won'] = (df['won'] + df['new_won']).astype(int)
-        df['played'] = (df['played'] + df['new_played']).astype(int)
-        df['prob'] = df['won'] / df['played']
-        new_hands_played = int(df['new_played'].sum())
-        total_hands_played = df[df.players == self.num_players]['played'].sum()
-
-        df = df[orig_df.columns].sort_values(['players', 'prob'], ascending=[True, False])
-        df.to_csv(path, index=False)
-
-        print(f"Players = {self.num_players}, New hands = {new_hands_played:,}, Total hands = {total_hands_played:,}.")
-
+            self.counts.record(self.num_players, hand.hole_cards.index, hand in winning_hands, num_winners)
 
-class Probability:
-    def __init__(self):
-        self.hands_played = 0
-        self.hands_won = 0
-        self.probability = 0
-
-    def __repr__(self):
-        return f"{self.probability * 100:.2f}% ({self.hands_won} / {self.hands_played} hands won)"
+    def store_probabilities(self, store=None):
+        from store import ResultsStore  # sqlite and csv are only loaded by callers that store results
 
-    def update(self, won):
-        if won:
-            self.hands_won += 1
-        self.hands_played += 1
-        self.probability = self.hands_won / self.hands_played
-        return self
+        store = ResultsStore() if store is None else store
+        store.add(self.counts, self.num_players)
+        new_hands_played = int(self.counts.played[self.num_players].sum())
+        total_hands_played = store.total_played(self.num_players)
+        print(f"Players = {self.num_players}, New hands = {new_hands_played:,}, Total hands = {total_hands_played:,}.")
 
 
 class Player:
@@ -91,40 +117,62 @@ class Player:
     def __repr__(self):
         return f"Player({self.hole_cards})"
 
-    def get_hand(self, community_cards):
+    def get_hand(self, community_cards, cache=None):
         assert self.hole_cards is not None, 'Hole cards have not been dealt!'
-        all_cards = self.hole_cards.cards + community_cards
-        self.hole_cards = HoleCards(self.hole_cards.cards)
-        self.hand = Hand(all_cards, self.hole_cards)
+        self.hand = Hand(self.hole_cards.cards + community_cards, self.hole_cards, cache)
         return self.hand
 
 
 class Card:
+    """
+    immutable flyweight: Card(rank, suit) always returns the same one of 52 shared instances
+    """
+    __slots__ = ('rank', 'rank_number', 'suit', 'index')
     rank_map = {**dict({'A': 14, 'K': 13, 'Q': 12, 'J': 11, 'T': 10}), **dict(zip(range(2, 11), range(2, 11)))}
-
-    def __init__(self, rank, suit):
-        assert rank in Deck.ranks
-        assert suit in Deck.suits
-        self.rank = rank
-        self.rank_number = Card.rank_map[rank]
-        self.suit = suit
+    interned = {}
+
+    def __new__(cls, rank, suit):
+        card = cls.interned.get((rank, suit))
+        if card is None:
+            # only the first construction of each card is validated
+            assert rank in Deck.ranks
+            assert suit in Deck.suits
+            card = object.__new__(cls)
+            rank_number = Card.rank_map[rank]
+            for name, value in zip(cls.__slots__, (rank, rank_number, suit, evaluator.card_index(rank_number, suit))):
+                object.__setattr__(card, name, value)
+            cls.interned[rank, suit] = card
+        return card
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Cards are immutable.')
+
+    def __reduce__(self):
+        # unpickle to the shared instance
+        return Card, (self.rank, self.suit)
 
     def __repr__(self):
         return f"{self.rank}{self.suit}"
 
     def __eq__(self, other):
-        return self.rank_number == other.rank_number and self.suit == other.suit
+        return self is other or (isinstance(other, Card) and self.index == other.index)
+
+    def __hash__(self):
+        return self.index
 
     def __lt__(self, other):
         return self.rank_number < other.rank_number
 
 
 class HoleCards:
+    __slots__ = ('cards', 'suited', 'index')
+
     def __init__(self, cards: List[Card]):
         assert len(cards) == 2
         self.cards = cards
         self.cards.sort(reverse=True)
         self.suited = cards[0].suit == cards[1].suit
+        self.index = evaluator.hole_card_class(cards[0].index, cards[1].index)
 
     def __repr__(self):
         return f"{self.cards[0].rank}{self.cards[1].rank}{'s' if self.suited else 'o'}"
@@ -134,49 +182,90 @@ class Deck:
     ranks = list(range(2, 10)) + ['A', 'K', 'Q', 'J', 'T']
     suits = ['s', 'c', 'h', 'd']
 
-    def __init__(self):
+    def __init__(self, seed=None):
         self.community_cards = []
         self.index = 0
-        self.cards = [Card(rank, suit) for rank, suit in itertools.product(Deck.ranks, Deck.suits)]
-        self.shuffle()
+        self.cards = list(range(52))  # card indices, the first self.index of which have been dealt
+        self.random = random.Random(seed).random
 
     def deal_hole_cards(self, players):
         for player in players:
-            cards = self.deal_cards(2)
-            player.hole_cards = HoleCards(cards)
+            card1, card2 = self.deal_indices(2)
+            player.hole_cards = HOLE_CARDS[card1][card2]
 
     def deal_community_cards(self):
         self.community_cards = self.deal_cards(5)
 
-    def deal_cards(self, num):
+    def deal_indices(self, num):
         assert self.index <= (52 - num), 'No cards left in deck.'
-        cards = [self.cards[self.index + i] for i in range(1, num + 1)]
+        # partial Fisher-Yates: swap a uniformly chosen undealt card into each dealt position
+        cards, rand = self.cards, self.random
+        start = self.index
+        for i in range(start, start + num):
+            j = i + int(rand() * (52 - i))
+            cards[i], cards[j] = cards[j], cards[i]
         self.index += num
-        return cards
+        return cards[start:self.index]
+
+    def deal_cards(self, num):
+        return [CARDS[card] for card in self.deal_indices(num)]
 
     def shuffle(self):
-        random.shuffle(self.cards)
+        # every deal draws uniformly from the undealt cards, so only the dealt position needs resetting
         self.index = 0
 
 
 class Hand:
-    def __init__(self, cards, hole_cards=None):
+    """
+    7 cards and their score; the lists behind the legacy score_* methods are only derived when first used
+    """
+    __slots__ = ('cards', 'hole_cards', 'score', '_straight_cards', '_straight_card_ranks', '_flush_cards',
+                 '_straight_flush_cards', '_rank_counts')
+
+    def __init__(self, cards, hole_cards=None, cache=None):
         assert len(cards) == 7
-        self.cards = list(cards)
-        self.cards.sort(reverse=True)
+        self.cards = sorted(cards, key=RANK_NUMBER, reverse=True)
         self.hole_cards = hole_cards if hole_cards is not None else []
+        self._straight_cards = self._straight_card_ranks = self._flush_cards = None
+        self._straight_flush_cards = self._rank_counts = None
 
-        self.straight_cards = self.get_straight_cards(self.cards)
-        self.straight_card_ranks = sorted(set([card.rank_number for card in self.straight_cards]), reverse=True)
-        self.flush_cards = self.get_flush_cards(self.cards)
-        self.straight_flush_cards = [card for card in self.straight_cards if card in self.flush_cards]
-        self.rank_counts = self.get_rank_counts(self.cards)  # map of cunts to list of ranks
-
-        self.score = self.get_score()
+        indices = [card.index for card in self.cards]
+        self.score = evaluator.evaluate(indices) if cache is None else cache.evaluate(indices)
 
     def __repr__(self):
         return f"Hand({self.cards})"
 
+    @property
+    def straight_cards(self):
+        if self._straight_cards is None:
+            self._straight_cards = self.get_straight_cards(self.cards)
+        return self._straight_cards
+
+    @property
+    def straight_card_ranks(self):
+        if self._straight_card_ranks is None:
+            self._straight_card_ranks = sorted(set([card.rank_number for card in self.straight_cards]), reverse=True)
+        return self._straight_card_ranks
+
+    @property
+    def flush_cards(self):
+        if self._flush_cards is None:
+            self._flush_cards = self.get_flush_cards(self.cards)
+        return self._flush_cards
+
+    @property
+    def straight_flush_cards(self):
+        if self._straight_flush_cards is None:
+            self._straight_flush_cards = [card for card in self.straight_cards if card in self.flush_cards]
+        return self._straight_flush_cards
+
+    @property
+    def rank_counts(self):
+        # map of counts to list of ranks
+        if self._rank_counts is None:
+            self._rank_counts = self.get_rank_counts(self.cards)
+        return self._rank_counts
+
     def get_score(self):
         hand_order_functions = [
             self.score_royal_flush,
@@ -325,28 +414,18 @@ class Hand:
         return score
 
 
+RANK_NUMBER = operator.attrgetter('rank_number')
+
+# one shared Card per card index
+CARDS = sorted((Card(rank, suit) for rank, suit in itertools.product(Deck.ranks, Deck.suits)), key=lambda card: card.index)
+# one shared HoleCards per pair of card indices, in either order
+HOLE_CARDS = [[None] * 52 for _ in range(52)]
+for _card1, _card2 in itertools.combinations(range(52), 2):
+    HOLE_CARDS[_card1][_card2] = HOLE_CARDS[_card2][_card1] = HoleCards([CARDS[_card1], CARDS[_card2]])
+
+
 if __name__ == '__main__':
-    players = range(2, 6)
-    num_processes = len(players)
-    num_games = 13 * 13 * 10000
-
-    start_time = time.time()
-
-    # run sims
-    result_queue = mp.Queue()
-    processes = [mp.Process(target=Game(3).run_simulations, args=(num_games, result_queue))
-                 for num_players in players]
-    for p in processes:
-        p.start()
-    for p in processes:
-        p.join()
-
-    # store result
-    result = [result_queue.get() for _ in processes]
-    for game in result:
-        game.store_probabilities()
-
-    # print stats
-    time_elapsed = time.time() - start_time
-    print(f"Took {time_elapsed:.1f}s for {num_games} simulations. {num_games / time_elapsed:.0f} games/s => "
-          f"{num_games / time_elapsed / 169:.1f} hands/s.")
+    # python simulation.py [run name] is kept as shorthand for python cli.py --metrics [--run run name]
+    import cli
+
+    cli.main(['--metrics'] + (['--run', sys.argv[1]] if len(sys.argv) > 1 else []))
@@ -0,0 +1,205 @@
+"""
+SQLite results backend for simulation counts.
+
+Every flush is a single upsert transaction that adds count deltas to the stored totals, so concurrent writers never
+clobber each other and a checkpoint only costs as much as the rows it touches. The ``probabilities`` view (and
+``export_csv``) give the same schema as ``data/probabilities.csv``: outright wins, split pots, the summed pot share,
+prob = won / played and equity = share / played.
+
+Streaming runs (see scheduler.run_to_store) also record their seed entropy in ``runs`` and every finished task in
+``tasks``, committed in the same transaction as that task's counts, so a killed run resumes exactly where its last
+checkpoint left it.
+
+Stores and CSV files from before ties were tracked counted every split as a win. They are migrated with tied = 0 and
+share = won, which keeps their rows usable but carries over their upward bias until enough new games outweigh it.
+"""
+import csv
+import os
+import sqlite3
+
+from counts import Counts, SHARE_UNITS
+import evaluator
+import util
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '../data')
+DEFAULT_PATH = os.path.join(DATA_DIR, 'probabilities.sqlite')
+CSV_PATH = os.path.join(DATA_DIR, 'probabilities.csv')
+CSV_COLUMNS = ['hand', 'players', 'won', 'tied', 'played', 'share', 'prob', 'equity']
+
+VIEW = f'''
+CREATE VIEW IF NOT EXISTS probabilities AS
+    SELECT hand, players, won, tied, played, CAST(share AS REAL) / {SHARE_UNITS} AS share,
+        CAST(won AS REAL) / played AS prob, CAST(share AS REAL) / {SHARE_UNITS} / played AS equity FROM counts
+    ORDER BY players, equity DESC
+'''
+
+# share is stored in whole counts.SHARE_UNITS so upserts stay exact integer additions
+SCHEMA = f'''
+CREATE TABLE IF NOT EXISTS counts (
+    players INTEGER NOT NULL,
+    hand TEXT NOT NULL,
+    won INTEGER NOT NULL,
+    tied INTEGER NOT NULL DEFAULT 0,
+    share INTEGER NOT NULL DEFAULT 0,
+    played INTEGER NOT NULL,
+    PRIMARY KEY (players, hand)
+);
+{VIEW};
+CREATE TABLE IF NOT EXISTS runs (
+    name TEXT PRIMARY KEY,
+    entropy TEXT NOT NULL,
+    num_games INTEGER NOT NULL,
+    task_size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    run TEXT NOT NULL,
+    task TEXT NOT NULL,
+    PRIMARY KEY (run, task)
+);
+'''
+
+UPSERT = '''
+INSERT INTO counts (players, hand, won, tied, share, played) VALUES (:players, :hand, :won, :tied, :share, :played)
+ON CONFLICT (players, hand) DO UPDATE SET won = won + excluded.won, tied = tied + excluded.tied,
+    share = share + excluded.share, played = played + excluded.played
+'''
+
+
+class ResultsStore:
+    def __init__(self, path=DEFAULT_PATH, csv_path=CSV_PATH):
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.execute('PRAGMA journal_mode = WAL')
+        with self.connection:
+            self.connection.executescript(SCHEMA)
+        self.migrate_schema()
+        if csv_path is not None and os.path.exists(csv_path):
+            self.migrate_csv(csv_path)
+
+    def __repr__(self):
+        return f"ResultsStore({self.path})"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def is_empty(self):
+        return self.connection.execute('SELECT COUNT(*) FROM counts').fetchone()[0] == 0
+
+    def add_rows(self, rows):
+        with self.connection:
+            self.connection.executemany(UPSERT, rows)
+
+    def add(self, counts, num_players=None):
+        """
+        add the deltas in a Counts object (optionally only one player count) in one transaction
+        """
+        self.add_rows(list(counts.rows(num_players)))
+
+    def start_run(self, name, entropy, num_games, task_size):
+        """
+        register a streaming run and return its seed entropy, which is the stored one when the run is being resumed
+        """
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            row = self.connection.execute('SELECT entropy, num_games, task_size FROM runs WHERE name = ?',
+                                          (name,)).fetchone()
+            if row is None:
+                self.connection.execute('INSERT INTO runs VALUES (?, ?, ?, ?)',
+                                        (name, str(entropy), num_games, task_size))
+                return entropy
+        if (row[1], row[2]) != (num_games, task_size):
+            raise ValueError(f"Run {name!r} was started with num_games={row[1]} and task_size={row[2]}.")
+        return int(row[0])
+
+    def done_tasks(self, name):
+        return {task for task, in self.connection.execute('SELECT task FROM tasks WHERE run = ?', (name,))}
+
+    def checkpoint(self, counts, name, tasks):
+        """
+        add the counts of finished tasks and mark them done in one transaction
+        """
+        with self.connection:
+            self.connection.executemany(UPSERT, list(counts.rows()))
+            self.connection.executemany('INSERT INTO tasks (run, task) VALUES (?, ?)', [(name, task) for task in tasks])
+
+    def columns(self):
+        return [row[1] for row in self.connection.execute('PRAGMA table_info(counts)')]
+
+    def migrate_schema(self):
+        """
+        add the tied and share columns to a store written before ties were tracked
+        """
+        if 'tied' in self.columns():
+            return
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            if 'tied' in self.columns():  # another process got there first
+                return
+            self.connection.execute('ALTER TABLE counts ADD COLUMN tied INTEGER NOT NULL DEFAULT 0')
+            self.connection.execute('ALTER TABLE counts ADD COLUMN share INTEGER NOT NULL DEFAULT 0')
+            self.connection.execute('UPDATE counts SET share = won * ?', (SHARE_UNITS,))
+            self.connection.execute('DROP VIEW probabilities')
+            self.connection.execute(VIEW)
+
+    @staticmethod
+    def read_csv(path):
+        """
+        count rows of a probabilities.csv file, legacy files without tied and share columns included
+        """
+        rows = []
+        with open(path, newline='') as f:
+            for row in csv.DictReader(f):
+                won = int(row['won'])
+                legacy = 'share' not in row
+                rows.append(dict(players=int(row['players']), hand=row['hand'], won=won,
+                                 tied=0 if legacy else int(row['tied']),
+                                 share=won * SHARE_UNITS if legacy else round(float(row['share']) * SHARE_UNITS),
+                                 played=int(row['played'])))
+        return rows
+
+    def migrate_csv(self, path):
+        """
+        seed an empty store with the counts in a probabilities.csv file
+        """
+        if not self.is_empty():
+            # an already seeded store needs nothing from the csv, so it is not even parsed
+            return
+        rows = self.read_csv(path)
+        with self.connection:
+            # take the write lock before checking again so two fresh workers cannot both import
+            self.connection.execute('BEGIN IMMEDIATE')
+            if self.is_empty():
+                self.connection.executemany(UPSERT, rows)
+
+    def rows(self, num_players=None):
+        query = f"SELECT {', '.join(CSV_COLUMNS)} FROM probabilities"
+        if num_players is None:
+            return self.connection.execute(query).fetchall()
+        return self.connection.execute(f"{query} WHERE players = ?", (num_players,)).fetchall()
+
+    def total_played(self, num_players):
+        return self.connection.execute('SELECT COALESCE(SUM(played), 0) FROM counts WHERE players = ?',
+                                       (num_players,)).fetchone()[0]
+
+    def to_counts(self):
+        counts = Counts()
+        for players, hand, won, tied, share, played in self.connection.execute(
+                'SELECT players, hand, won, tied, share, played FROM counts'):
+            index = evaluator.HAND_CLASS_INDEX[hand]
+            counts.won[players, index] = won
+            counts.tied[players, index] = tied
+            counts.share[players, index] = share
+            counts.played[players, index] = played
+        return counts
+
+    def export_csv(self, path=CSV_PATH):
+        with util.atomic_path(path) as tmp_path, open(tmp_path, 'w', newline='') as f:
+            writer = csv.writer(f, lineterminator='\n')
+            writer.writerow(CSV_COLUMNS)
+            writer.writerows(self.rows())
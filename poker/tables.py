@@ -0,0 +1,357 @@
+"""
+Multi-street No-Limit Hold'em engine that plays many tables at once as NumPy arrays.
+
+Every table is a row: stacks, street bets and total contributions, folded and all-in flags are (tables, players)
+arrays, and the bet to match, minimum raise, raise count and player to act are (tables,) arrays, so thousands of
+tables cost a few small integer arrays. A hand posts the blinds from fresh stacks, runs the preflop, flop, turn and
+river betting rounds in lockstep across tables, and pays out the main and side pots at showdown.
+
+Players are Policy objects. At every step each policy sees a Situation holding the tables where one of its seats is
+to act and returns one action per table. Seat s plays policies[s] at every table while the button is random per
+table, so every policy plays every position. Chip results are recorded per policy name, and run spreads hands over a
+process pool and reports chip EV per hand with a 95% confidence interval.
+"""
+import time
+
+import numpy as np
+
+import batch
+import evaluator
+from equity import Z_95
+import util
+
+SMALL_BLIND = 1
+BIG_BLIND = 2
+DEFAULT_STACK = 100  # big blinds
+DEFAULT_NUM_TABLES = 5000
+DEFAULT_NUM_SAMPLES = 32
+MAX_RAISES = 4  # per street, so every betting round ends
+FOLD, CALL, RAISE = 0, 1, 2  # calling nothing is a check
+STREETS = PREFLOP, FLOP, TURN, RIVER = 0, 1, 2, 3
+BOARD_CARDS = (0, 3, 4, 5)
+ALL_IN = np.inf
+
+
+def estimate_equity(hole_cards, board, num_opponents, num_samples, rng):
+    """
+    (N,) sampled pot share of each (2,) hole cards on its visible board against one random hand, raised to the power
+    of num_opponents as an estimate against that many
+    """
+    num_hands, num_board = board.shape
+    hole_cards = np.repeat(hole_cards, num_samples, axis=0)
+    board = np.repeat(board, num_samples, axis=0)
+    drawn = batch.deal(len(hole_cards), 7 - num_board, rng, dead=np.concatenate([hole_cards, board], axis=1))
+    full_board = np.concatenate([board, drawn[:, :5 - num_board]], axis=1)
+    hero_scores = evaluator.evaluate_batch(np.concatenate([hole_cards, full_board], axis=1))
+    villain_scores = evaluator.evaluate_batch(np.concatenate([drawn[:, 5 - num_board:], full_board], axis=1))
+    shares = (hero_scores > villain_scores) + 0.5 * (hero_scores == villain_scores)
+    return shares.reshape(num_hands, num_samples).mean(axis=1) ** num_opponents
+
+
+def pot_payouts(contributed, folded, scores):
+    """
+    (tables, players) chips won from the main pot and every side pot
+
+    each distinct contribution level is a pot layer shared by the players still in the hand who reached it and hold
+    its best score; an uncalled bet is a layer only its bettor reached, so it comes back to them
+    """
+    levels = np.sort(contributed, axis=1)
+    payouts = np.zeros(contributed.shape)
+    previous = np.zeros(len(contributed), dtype=contributed.dtype)
+    for level in levels.T:
+        reached = contributed >= level[:, None]
+        amount = (level - previous) * reached.sum(axis=1)
+        eligible = reached & ~folded
+        eligible_scores = np.where(eligible, scores, -1)
+        best = eligible & (eligible_scores == eligible_scores.max(axis=1, keepdims=True))
+        payouts += np.where(best, (amount / np.maximum(best.sum(axis=1), 1))[:, None], 0)
+        previous = level
+    return payouts
+
+
+class Situation:
+    def __init__(self, street, hole_cards, board, pot, to_call, to_match, stack, num_opponents, rng,
+                 num_samples=DEFAULT_NUM_SAMPLES):
+        """
+        one row per table where the policy is to act; chip amounts are in chips (BIG_BLIND chips a big blind)
+        """
+        self.street = street
+        self.hole_cards = hole_cards
+        self.board = board
+        self.pot = pot
+        self.to_call = to_call
+        self.to_match = to_match
+        self.stack = stack
+        self.num_opponents = num_opponents
+        self.rng = rng
+        self.num_samples = num_samples
+        self._equity = None
+
+    def __repr__(self):
+        return f"Situation(street={self.street}, tables={len(self.pot)})"
+
+    def __len__(self):
+        return len(self.pot)
+
+    def hand_classes(self):
+        return evaluator.CLASS_TABLE[self.hole_cards[:, 0], self.hole_cards[:, 1]]
+
+    def equity(self):
+        """
+        sampled equity against the players left in the hand, estimated on first use
+        """
+        if self._equity is None:
+            self._equity = estimate_equity(self.hole_cards, self.board, self.num_opponents, self.num_samples,
+                                           self.rng)
+        return self._equity
+
+
+class Policy:
+    """
+    base class for players: act returns (actions, sizes), one FOLD, CALL or RAISE per table and a raise size as a
+    fraction of the pot after calling (ALL_IN to shove); folding when there is nothing to call checks
+    """
+    name = 'policy'
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.name!r})"
+
+    def act(self, situation, rng):
+        raise NotImplementedError
+
+
+class CallPolicy(Policy):
+    """
+    checks or calls every bet
+    """
+    name = 'call'
+
+    def act(self, situation, rng):
+        return np.full(len(situation), CALL), np.zeros(len(situation))
+
+
+class EquityThreshold(Policy):
+    """
+    folds below one sampled equity threshold, raises above another and calls in between
+    """
+    def __init__(self, fold_below=0.4, raise_above=0.7, raise_size=1.0, name=None):
+        self.fold_below = fold_below
+        self.raise_above = raise_above
+        self.raise_size = raise_size
+        self.name = f"equity({fold_below}, {raise_above})" if name is None else name
+
+    def act(self, situation, rng):
+        equity = situation.equity()
+        actions = np.where(equity >= self.raise_above, RAISE, np.where(equity < self.fold_below, FOLD, CALL))
+        return actions, np.full(len(situation), self.raise_size)
+
+
+class StrategyPolicy(Policy):
+    """
+    preflop push/fold strategy, e.g. the average strategy of a cfr.PushFold solve: shoves with probability push[class]
+    when unraised and with probability call[class] facing a raise, folding otherwise, then checks down
+    """
+    def __init__(self, push, call, name='strategy'):
+        self.push = np.asarray(push, dtype=float)
+        self.call = np.asarray(call, dtype=float)
+        self.name = name
+
+    def act(self, situation, rng):
+        if situation.street != PREFLOP:
+            return np.full(len(situation), CALL), np.zeros(len(situation))
+        classes = situation.hand_classes()
+        probabilities = np.where(situation.to_match > BIG_BLIND, self.call[classes], self.push[classes])
+        actions = np.where(rng.random(len(situation)) < probabilities, RAISE, FOLD)
+        return actions, np.full(len(situation), ALL_IN)
+
+    @staticmethod
+    def from_solver(solver, stack_index, name='push/fold'):
+        return StrategyPolicy(solver.average_strategy(0)[stack_index], solver.average_strategy(1)[stack_index], name)
+
+
+class Tables:
+    def __init__(self, policies, num_tables, rng, stack=DEFAULT_STACK, num_samples=DEFAULT_NUM_SAMPLES):
+        """
+        one hand at each of num_tables tables, seat s played by policies[s], every stack starting at stack big blinds
+        """
+        self.policies = policies
+        self.rng = rng
+        self.num_samples = num_samples
+        num_players = len(policies)
+        cards = batch.deal(num_tables, 2 * num_players + 5, rng)
+        self.hole_cards = cards[:, :2 * num_players].reshape(num_tables, num_players, 2)
+        self.board = cards[:, 2 * num_players:]
+        self.button = rng.integers(num_players, size=num_tables)
+        self.stacks = np.full((num_tables, num_players), stack * BIG_BLIND, dtype=np.int32)
+        self.bets = np.zeros((num_tables, num_players), dtype=np.int32)
+        self.contributed = np.zeros((num_tables, num_players), dtype=np.int32)
+        self.folded = np.zeros((num_tables, num_players), dtype=bool)
+        self.all_in = np.zeros((num_tables, num_players), dtype=bool)
+
+    def __repr__(self):
+        return f"Tables(tables={len(self.stacks):,}, players={len(self.policies)})"
+
+    def bet(self, tables, seats, amounts):
+        self.stacks[tables, seats] -= amounts
+        self.bets[tables, seats] += amounts
+        self.contributed[tables, seats] += amounts
+        self.all_in[tables, seats] = self.stacks[tables, seats] == 0
+
+    def post_blinds(self):
+        num_tables, num_players = self.stacks.shape
+        tables = np.arange(num_tables)
+        # heads-up the button posts the small blind
+        small_blind = (self.button + (num_players > 2)) % num_players
+        for seats, blind in ((small_blind, SMALL_BLIND), ((small_blind + 1) % num_players, BIG_BLIND)):
+            self.bet(tables, seats, np.minimum(blind, self.stacks[tables, seats]))
+
+    def betting_round(self, street):
+        num_tables, num_players = self.stacks.shape
+        to_match = self.bets.max(axis=1)
+        min_raise = np.full(num_tables, BIG_BLIND)
+        raises = np.zeros(num_tables, dtype=np.int8)
+        pending = ~self.folded & ~self.all_in
+        # preflop the player after the big blind opens, afterwards the first player after the button
+        first = 2 + (num_players > 2) if street == PREFLOP else 1
+        actor = (self.button + first) % num_players
+        seat_order = np.arange(num_players)
+        while True:
+            live = pending.any(axis=1) & ((~self.folded).sum(axis=1) > 1)
+            if not live.any():
+                break
+            tables = np.flatnonzero(live)
+            order = (actor[tables, None] + seat_order) % num_players
+            seats = order[np.arange(len(tables)), pending[tables[:, None], order].argmax(axis=1)]
+            to_call = to_match[tables] - self.bets[tables, seats]
+            stack = self.stacks[tables, seats]
+            in_hand = ~self.folded[tables]
+            pot = self.contributed[tables].sum(axis=1)
+
+            actions = np.empty(len(tables), dtype=np.int64)
+            sizes = np.empty(len(tables))
+            for seat, policy in enumerate(self.policies):
+                mine = np.flatnonzero(seats == seat)
+                if not len(mine):
+                    continue
+                situation = Situation(street, self.hole_cards[tables[mine], seat],
+                                      self.board[tables[mine], :BOARD_CARDS[street]], pot[mine], to_call[mine],
+                                      to_match[tables[mine]], stack[mine], in_hand[mine].sum(axis=1) - 1, self.rng,
+                                      self.num_samples)
+                actions[mine], sizes[mine] = policy.act(situation, self.rng)
+
+            can_respond = (in_hand & ~self.all_in[tables]).sum(axis=1) > 1
+            fold = (actions == FOLD) & (to_call > 0)
+            raise_ = (actions == RAISE) & (raises[tables] < MAX_RAISES) & (stack > to_call) & can_respond
+            target = to_match[tables] + np.maximum(min_raise[tables], sizes * (pot + to_call))
+            target = np.minimum(target, self.bets[tables, seats] + stack).astype(np.int32)
+            amounts = np.where(fold, 0, np.where(raise_, target - self.bets[tables, seats], np.minimum(to_call, stack)))
+            self.bet(tables, seats, amounts)
+            self.folded[tables[fold], seats[fold]] = True
+
+            # a raise reopens the action for everyone who can still act; an all-in short of a full raise is
+            # treated the same way rather than tracking who may only call
+            raised = tables[raise_]
+            raise_sizes = target[raise_] - to_match[raised]
+            min_raise[raised] = np.maximum(min_raise[raised], raise_sizes)
+            to_match[raised] = target[raise_]
+            raises[raised] += 1
+            pending[raised] = ~self.folded[raised] & ~self.all_in[raised]
+            pending[tables, seats] = False
+            actor[tables] = (seats + 1) % num_players
+        self.bets[:] = 0
+
+    def showdown(self):
+        """
+        (tables, players) net chips won by every seat
+        """
+        num_tables, num_players = self.stacks.shape
+        cards = np.concatenate([self.hole_cards, np.broadcast_to(self.board[:, None], (num_tables, num_players, 5))],
+                               axis=2)
+        scores = evaluator.evaluate_batch(cards.reshape(-1, 7)).reshape(num_tables, num_players)
+        return pot_payouts(self.contributed, self.folded, scores) - self.contributed
+
+    def play(self):
+        self.post_blinds()
+        for street in STREETS:
+            self.betting_round(street)
+        return self.showdown()
+
+
+class Results:
+    def __init__(self, names=()):
+        # per policy name: hands played, and the sum and sum of squares of the net big blinds won per hand
+        self.totals = {name: np.zeros(3) for name in names}
+
+    def __repr__(self):
+        return f"Results({', '.join(f'{name}={mean:+.3f}bb' for name, (mean, _) in self.chip_ev().items())})"
+
+    def __iadd__(self, other):
+        for name, totals in other.totals.items():
+            self.totals[name] = self.totals.get(name, 0) + totals
+        return self
+
+    def record(self, names, net):
+        """
+        add a (tables, players) array of net big blinds, column s played by names[s]
+        """
+        for name, column in zip(names, net.T):
+            self.totals[name] = self.totals.get(name, 0) + [len(column), column.sum(), (column ** 2).sum()]
+
+    def hands(self, name):
+        return int(self.totals[name][0])
+
+    def chip_ev(self):
+        """
+        {name: (mean big blinds won per hand, 95% confidence half-width)}
+        """
+        chip_ev = {}
+        for name, (hands, total, squares) in self.totals.items():
+            mean = total / hands if hands else 0.0
+            variance = max(squares / hands - mean ** 2, 0) if hands else 0.0
+            chip_ev[name] = (mean, Z_95 * np.sqrt(variance / hands) if hands else np.inf)
+        return chip_ev
+
+
+def play(policies, num_hands, rng=None, num_tables=DEFAULT_NUM_TABLES, stack=DEFAULT_STACK,
+         num_samples=DEFAULT_NUM_SAMPLES):
+    """
+    play num_hands hands at most num_tables at a time and return the Results
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    names = [policy.name for policy in policies]
+    results = Results(names)
+    for start in range(0, num_hands, num_tables):
+        tables = Tables(policies, min(num_tables, num_hands - start), rng, stack, num_samples)
+        results.record(names, tables.play() / BIG_BLIND)
+    return results
+
+
+def run_task(task):
+    policies, num_hands, seed, num_tables, stack, num_samples = task
+    return play(policies, num_hands, np.random.default_rng(seed), num_tables, stack, num_samples)
+
+
+def run(policies, num_hands, processes=None, num_tables=DEFAULT_NUM_TABLES, seed=None, stack=DEFAULT_STACK,
+        num_samples=DEFAULT_NUM_SAMPLES):
+    """
+    play num_hands hands split into tasks of num_tables tables, on a pool sized to the machine by default
+
+    every task has its own RNG stream spawned from seed, so the results only depend on the seed and the task size
+    """
+    seeds = np.random.SeedSequence(seed).spawn(-(-num_hands // num_tables))
+    tasks = [(policies, min(num_tables, num_hands - i * num_tables), task_seed, num_tables, stack, num_samples)
+             for i, task_seed in enumerate(seeds)]
+    start_time = time.perf_counter()
+    results = Results(policy.name for policy in policies)
+    for task_result in util.imap_tasks(run_task, tasks, 1 if len(tasks) == 1 else processes):
+        results += task_result
+    elapsed = time.perf_counter() - start_time
+    print(f"Played {num_hands:,} hands in {elapsed:.1f}s ({num_hands / elapsed:,.0f} hands/s).")
+    return results
+
+
+if __name__ == '__main__':
+    contestants = [EquityThreshold(0.3, 0.8, name='loose'), EquityThreshold(0.5, 0.7, name='tight'),
+                   EquityThreshold(0.4, 0.6, 0.5, name='aggressive'), CallPolicy()]
+    for name, (mean, half_width) in run(contestants, 100000).chip_ev().items():
+        print(f"{name:>12}: {mean:+.3f} +/- {half_width:.3f} bb per hand")
@@ -1,4 +1,41 @@
+import argparse
+import asyncio
+import collections
+import contextlib
+import io
+import itertools
+import json
+import math
+import os
+import pickle
+import random
+import sqlite3
+import tempfile
 import unittest
+
+import abstraction
+import adaptive
+import batch
+import benchmarks
+import cache
+import cfr
+import cli
+import evaluator
+import equity
+import exact
+import lookup
+import matchups
+import metrics as metrics_module
+import ranges
+import regret_matching
+import scheduler
+import service
+import tables
+from counts import Counts, SHARE_UNITS
+from lookup import EquityTable
+from ranges import Range
+from metrics import Metrics
+from store import ResultsStore
 from simulation import *
 
 
@@ -141,5 +178,882 @@ class TestPokerHands(unittest.TestCase):
                                delta=1e-11)
 
 
+class TestEvaluator(unittest.TestCase):
+    # the hands used above, paired with the score method they are tested against
+    cases = [
+        ([Card(2, 's'), Card('A', 's'), Card('K', 's'), Card('Q', 's'), Card('J', 's'), Card('T', 's'), Card(3, 'c')],
+         'score_royal_flush'),
+        ([Card(2, 's'), Card('A', 's'), Card(3, 's'), Card(4, 's'), Card(5, 's'), Card('A', 'c'), Card(3, 'c')],
+         'score_straight_flush'),
+        ([Card(9, 's'), Card(9, 'c'), Card(9, 'd'), Card(9, 'h'), Card('K', 's'), Card(7, 's'), Card(6, 's')],
+         'score_four_of_a_kind'),
+        ([Card('T', 's'), Card('T', 'c'), Card('T', 'd'), Card(2, 'h'), Card(2, 's'), Card('A', 's'), Card(5, 's')],
+         'score_full_house'),
+        ([Card('T', 's'), Card('T', 'c'), Card('T', 'd'), Card(2, 'h'), Card(2, 's'), Card(2, 'c'), Card(5, 's')],
+         'score_full_house'),
+        ([Card('T', 's'), Card('T', 'c'), Card('T', 'd'), Card(2, 'h'), Card(2, 's'), Card(5, 'c'), Card(5, 's')],
+         'score_full_house'),
+        ([Card('T', 's'), Card(9, 's'), Card(8, 's'), Card(5, 's'), Card(2, 's'), Card(2, 's'), Card(2, 'h')],
+         'score_flush'),
+        ([Card(7, 'c'), Card(6, 's'), Card(5, 's'), Card(4, 's'), Card(3, 's'), Card('A', 'c'), Card('K', 'c')],
+         'score_straight'),
+        ([Card(5, 'c'), Card(4, 's'), Card(3, 's'), Card(2, 's'), Card('A', 's'), Card(7, 'c'), Card('T', 'c')],
+         'score_straight'),
+        ([Card(7, 'c'), Card(7, 's'), Card(6, 's'), Card(6, 'c'), Card(5, 's'), Card(4, 'c'), Card(3, 'd')],
+         'score_straight'),
+        ([Card(9, 's'), Card(9, 'c'), Card(9, 'h'), Card(5, 's'), Card(4, 'd'), Card(3, 's'), Card(2, 'd')],
+         'score_three_of_a_kind'),
+        ([Card(9, 's'), Card(9, 'c'), Card(5, 'h'), Card(5, 's'), Card(4, 'd'), Card(3, 's'), Card(2, 'd')],
+         'score_two_pair'),
+        ([Card(9, 's'), Card(9, 'c'), Card(5, 'h'), Card(5, 's'), Card(3, 'd'), Card(2, 's'), Card(2, 'd')],
+         'score_two_pair'),
+        ([Card('T', 'd'), Card(9, 's'), Card(9, 'c'), Card(5, 'h'), Card(4, 's'), Card(3, 'd'), Card(2, 's')],
+         'score_one_pair'),
+        ([Card('T', 'd'), Card(9, 's'), Card(7, 'c'), Card(5, 'h'), Card(4, 's'), Card(3, 's'), Card(2, 'd')],
+         'score_high_card'),
+        ([Card(2, 's'), Card(3, 's'), Card(4, 's'), Card(5, 's'), Card(7, 'c'), Card(9, 'c'), Card('J', 'c')],
+         'score_high_card'),
+    ]
+
+    def test_order_matches_score_methods(self):
+        scored = [(Hand(cards).score, getattr(Hand(cards), method)()) for cards, method in self.cases]
+        for (score, old_score), (other, other_old_score) in itertools.product(scored, scored):
+            self.assertEqual(score > other, old_score > other_old_score)
+            self.assertEqual(score == other, abs(old_score - other_old_score) < 1e-9)
+
+    def test_categories(self):
+        categories = [evaluator.score_category(Hand(cards).score) for cards, _ in self.cases]
+        self.assertEqual(categories, [9, 9, 8, 7, 7, 7, 6, 5, 5, 5, 4, 3, 3, 2, 1, 1])
+
+    def test_cached_tables(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'evaluator_tables.npy')
+            np.save(path, np.array([evaluator.TABLES_VERSION - 1, 0]))  # stale
+            built = evaluator.load_tables(path)
+            loaded = evaluator.load_tables(path)
+        for array, built_array, loaded_array in zip(
+                (evaluator.RANK_KEYS, evaluator.RANK_VALUES, evaluator.FLUSH_ARRAY, evaluator.FLUSH_SUIT_ARRAY),
+                built, loaded):
+            np.testing.assert_array_equal(built_array, array)
+            np.testing.assert_array_equal(loaded_array, array)
+        self.assertEqual(len(evaluator.RANK_TABLE), len(evaluator.RANK_KEYS))
+
+    def test_evaluate_batch(self):
+        rng = random.Random(0)
+        cards = [rng.sample(range(52), num_cards) for num_cards in [5, 6, 7] for _ in range(1000)]
+        for num_cards in [5, 6, 7]:
+            hands = [hand for hand in cards if len(hand) == num_cards]
+            expected = [evaluator.evaluate(hand) for hand in hands]
+            self.assertEqual(evaluator.evaluate_batch(hands).tolist(), expected)
+
+
+class TestValueTypes(unittest.TestCase):
+    def test_card_flyweight(self):
+        card = Card('A', 's')
+        self.assertIs(card, CARDS[card.index])
+        self.assertIs(pickle.loads(pickle.dumps(card)), card)
+        self.assertEqual(len({Card(2, 'h'), Card(2, 'h'), Card(2, 'd')}), 2)
+        self.assertNotEqual(card, 'As')
+        with self.assertRaises(AttributeError):
+            card.rank = 'K'
+        with self.assertRaises(AttributeError):
+            card.__dict__
+
+    def test_hole_cards_shared(self):
+        deck = Deck(seed=0)
+        players = [Player() for _ in range(3)]
+        deck.deal_hole_cards(players)
+        for player in players:
+            card1, card2 = player.hole_cards.cards
+            self.assertIs(player.hole_cards, HOLE_CARDS[card2.index][card1.index])
+            self.assertEqual(str(player.hole_cards), str(HoleCards([card1, card2])))
+
+    def test_lazy_hand(self):
+        hand = Hand([Card(rank, 's') for rank in (2, 3, 4, 5, 6)] + [Card('A', 'c'), Card('A', 'd')])
+        self.assertIsNone(hand._straight_cards)
+        self.assertEqual(evaluator.score_category(hand.score), evaluator.STRAIGHT_FLUSH)
+        self.assertIsNone(hand._rank_counts)
+        self.assertEqual(hand.score_straight_flush(), 9.06)
+        self.assertEqual([card.rank_number for card in hand.straight_flush_cards], [6, 5, 4, 3, 2])
+
+
+class TestDeck(unittest.TestCase):
+    def test_deal(self):
+        deck = Deck(seed=0)
+        hole_cards = deck.deal_indices(18)
+        community_cards = deck.deal_cards(5)
+        self.assertEqual(len(set(hole_cards + [card.index for card in community_cards])), 23)
+        with self.assertRaises(AssertionError):
+            deck.deal_cards(30)
+        deck.shuffle()
+        self.assertEqual(sorted(deck.cards), list(range(52)))
+
+    def test_uniform(self):
+        deck = Deck(seed=0)
+        first = collections.Counter()
+        second = collections.Counter()
+        for _ in range(52000):
+            deck.shuffle()
+            card1, card2 = deck.deal_indices(2)
+            first[card1] += 1
+            second[card2] += 1
+        for counter in (first, second):
+            self.assertEqual(len(counter), 52)
+            self.assertLess(max(abs(count - 1000) for count in counter.values()), 150)
+
+    def test_seeded(self):
+        self.assertEqual(Deck(seed=1).deal_indices(9), Deck(seed=1).deal_indices(9))
+        game = Game(2, seed=3)
+        game.simulate()
+        other = Game(2, seed=3)
+        other.simulate()
+        self.assertEqual(game.counts, other.counts)
+
+
+class TestBatch(unittest.TestCase):
+    def test_hand_classes(self):
+        for card1, card2 in itertools.combinations(CARDS, 2):
+            index = evaluator.hole_card_class(card1.index, card2.index)
+            self.assertEqual(evaluator.HAND_CLASSES[index], str(HoleCards([card1, card2])))
+
+    def test_deal(self):
+        cards = batch.deal(1000, 9, np.random.default_rng(0))
+        self.assertEqual(cards.shape, (1000, 9))
+        self.assertTrue(all(len(set(row)) == 9 for row in cards.tolist()))
+
+    def test_simulate_batch(self):
+        game = Game(3)
+        game.simulate_batch(20000, rng=np.random.default_rng(0), chunk_size=3000)
+        self.assertEqual(game.counts.played[3].sum(), 3 * 20000)
+        self.assertEqual(len(list(game.counts.rows())), 169)
+        self.assertGreater(game.counts.probability(3, 'AAo'), 0.6)
+        self.assertEqual(game.counts.share[3].sum(), 20000 * SHARE_UNITS)
+        self.assertGreater(game.counts.tied[3].sum(), 0)
+        self.assertLess(game.counts.share[3].sum(), (game.counts.won[3] + game.counts.tied[3]).sum() * SHARE_UNITS)
+
+
+class TestScheduler(unittest.TestCase):
+    def test_make_tasks(self):
+        tasks = scheduler.make_tasks([2, 3], 25, task_size=10, seed=0)
+        self.assertEqual([(num_players, games) for num_players, games, _ in tasks],
+                         [(3, 10), (2, 10), (3, 10), (2, 10), (3, 5), (2, 5)])
+        self.assertEqual(len({seed.spawn_key for _, _, seed in tasks}), len(tasks))
+
+    def test_run(self):
+        counts = scheduler.run([2, 4], 3000, processes=2, task_size=1000, seed=0)
+        self.assertEqual(counts.played.sum(axis=1).tolist(), [0, 0, 2 * 3000, 0, 4 * 3000] + [0] * 6)
+        self.assertEqual(scheduler.run([2], 3000, processes=2, task_size=1000, seed=0).won[2].tolist(),
+                         counts.won[2].tolist())
+
+    def test_stream(self):
+        # a slow task at the head of the queue does not hold back the results behind it
+        seeds = np.random.SeedSequence(0).spawn(4)
+        tasks = [(2, 200000, seeds[0])] + [(2, 10, seed) for seed in seeds[1:]]
+        results = list(scheduler.stream(tasks, processes=2))
+        self.assertEqual(results[0][0][1], 10)
+        self.assertEqual(sorted(task[1] for task, _ in results), [10, 10, 10, 200000])
+        self.assertTrue(all(result[-1].sum() == 2 * task[1] for task, result in results))
+
+    def test_run_to_store(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'probabilities.sqlite')
+            with ResultsStore(path, csv_path=None) as store:
+                # a run killed after checkpointing its first two tasks
+                entropy = store.start_run('run', np.random.SeedSequence(0).entropy, 3000, 1000)
+                tasks = scheduler.make_tasks([2, 3], 3000, task_size=1000, seed=0)[:2]
+                partial = Counts()
+                for task in tasks:
+                    num_players, *totals = scheduler.run_task(task)
+                    partial.add(num_players, *totals)
+                store.checkpoint(partial, 'run', [scheduler.task_key(task) for task in tasks])
+
+                resumed = scheduler.run_to_store([2, 3], 3000, store, 'run', processes=2, task_size=1000,
+                                                 flush_tasks=1)
+                self.assertEqual(resumed.played.sum(), 2 * 2000 + 3 * 2000)
+                self.assertEqual(store.to_counts(), scheduler.run([2, 3], 3000, processes=2, task_size=1000, seed=0))
+                self.assertEqual(len(store.done_tasks('run')), 6)
+                self.assertEqual(entropy, store.start_run('run', 0, 3000, 1000))
+
+                # a finished run has nothing left to do, and a run cannot change its shape
+                self.assertEqual(scheduler.run_to_store([2, 3], 3000, store, 'run', task_size=1000).played.sum(), 0)
+                with self.assertRaises(ValueError):
+                    scheduler.run_to_store([2, 3], 4000, store, 'run', task_size=1000)
+                with self.assertRaises(ValueError):
+                    scheduler.run_to_store([2, 3], 3000, store, 'run', task_size=1000, seed=1)
+
+    def test_run_to_store_progress(self):
+        with ResultsStore(':memory:', csv_path=None) as store:
+            # an open-ended run goes on until its progress callback stops it
+            counts = scheduler.run_to_store([2, 3], None, store, 'run', processes=1, task_size=100,
+                                            progress=lambda counts: counts.played.sum() >= 1500)
+            self.assertEqual(counts.played.sum(), 3 * (3 * 100 + 2 * 100))
+            self.assertEqual(store.to_counts(), counts)
+            self.assertEqual(len(store.done_tasks('run')), 6)
+
+
+class TestMetrics(unittest.TestCase):
+    def test_simulate_instrumented(self):
+        game = Game(3, seed=0)
+        metrics = Metrics()
+        for _ in range(200):
+            game.simulate_instrumented(metrics)
+        self.assertEqual((metrics.deals, metrics.hands), (200, 600))
+        self.assertEqual(int(metrics.categories.sum()), 600)
+        self.assertEqual(game.counts.played[3].sum(), 600)
+        self.assertTrue(all(seconds > 0 for seconds in metrics.phase_seconds.values()))
+
+    def test_scheduler_merges_workers(self):
+        metrics = Metrics()
+        counts = scheduler.run([2, 3], 2000, processes=2, task_size=1000, seed=0, metrics=metrics)
+        self.assertEqual(counts, scheduler.run([2, 3], 2000, processes=2, task_size=1000, seed=0))
+        self.assertEqual((metrics.deals, metrics.hands), (4000, 2 * 2000 + 3 * 2000))
+        self.assertEqual(metrics.categories.sum(), metrics.hands)
+        self.assertEqual(metrics.phase_seconds[metrics_module.SHUFFLE], 0)
+        self.assertGreater(metrics.phase_seconds[metrics_module.EVALUATE], 0)
+
+    def test_snapshots(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'metrics.jsonl')
+            metrics = Metrics(snapshot_path=path, snapshot_every=0)
+            batch.run(2, 1000, rng=np.random.default_rng(0), chunk_size=500, metrics=metrics)
+            with open(path) as f:
+                snapshots = [json.loads(line) for line in f]
+        self.assertEqual([snapshot['deals'] for snapshot in snapshots], [500, 1000])
+        self.assertEqual(sum(snapshots[-1]['categories'].values()), 2000)
+        self.assertAlmostEqual(sum(snapshots[-1]['phase_shares'].values()), 1)
+
+
+class TestEvaluationCache(unittest.TestCase):
+    def test_canonical_key(self):
+        cards = [0, 5, 10, 15, 20, 25, 30]
+        for permutation in exact.SUIT_PERMUTATIONS:
+            permuted = [exact.permute_suits(card, permutation) for card in cards]
+            self.assertEqual(cache.canonical_key(permuted), cache.canonical_key(cards))
+        self.assertEqual(cache.canonical_keys(np.array([cards, cards[::-1]])).tolist(),
+                         [cache.canonical_key(cards)] * 2)
+        self.assertNotEqual(cache.canonical_key([0, 4, 8, 12, 16]), cache.canonical_key([0, 4, 8, 12, 17]))
+
+    def test_lru(self):
+        rng = random.Random(0)
+        hands = [rng.sample(range(52), 7) for _ in range(2000)]
+        evaluation_cache = cache.EvaluationCache(max_size=100)
+        for cards in hands + hands[-50:]:
+            self.assertEqual(evaluation_cache.evaluate(cards), evaluator.evaluate(cards))
+        self.assertEqual(len(evaluation_cache.entries), 100)
+        self.assertEqual(evaluation_cache.hits, 50)
+        self.assertEqual(evaluation_cache.stats()['misses'], 2000)
+
+    def test_table(self):
+        table = cache.build_table(5)
+        self.assertEqual(table.shape, (2, 134459))
+        hands = np.array([random.Random(seed).sample(range(52), 5) for seed in range(1000)])
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'cache.npy')
+            cache.EvaluationCache(table=table).save(path)
+            evaluation_cache = cache.EvaluationCache.load(path)
+            self.assertTrue(evaluation_cache.stats()['mapped'])
+            self.assertEqual(evaluation_cache.evaluate_batch(hands).tolist(), evaluator.evaluate_batch(hands).tolist())
+            self.assertEqual([evaluation_cache.evaluate(cards) for cards in hands.tolist()[:100]],
+                             evaluator.evaluate_batch(hands[:100]).tolist())
+            self.assertEqual(evaluation_cache.hit_rate(), 1)
+            del evaluation_cache
+
+    def test_game(self):
+        evaluation_cache = cache.EvaluationCache()
+        cached, plain = Game(3, seed=0, cache=evaluation_cache), Game(3, seed=0)
+        for _ in range(500):
+            cached.simulate()
+            plain.simulate()
+        self.assertEqual(cached.counts, plain.counts)
+        self.assertEqual(evaluation_cache.hits + evaluation_cache.misses, 1500)
+
+
+class TestAdaptive(unittest.TestCase):
+    def test_play_fixed(self):
+        won, tied, share, played = adaptive.play_fixed(2, evaluator.HAND_CLASS_INDEX['AAo'], 20000,
+                                                       np.random.default_rng(0))
+        self.assertEqual(played, 20000)
+        self.assertEqual(share, won * SHARE_UNITS + tied * SHARE_UNITS // 2)
+        self.assertAlmostEqual(share / SHARE_UNITS / played, 0.85, delta=0.01)
+
+    def test_simulate_adaptive(self):
+        game = Game(3)
+        aces = evaluator.HAND_CLASS_INDEX['AAo']
+        game.counts.won[3, aces], game.counts.played[3, aces] = 70000, 100000
+        games = game.simulate_adaptive(0.05, batch_size=100, rng=np.random.default_rng(0))
+        self.assertEqual(games, game.counts.played[3].sum() - 100000)
+        self.assertEqual(game.counts.played[3, aces], 100000)
+        self.assertLessEqual(adaptive.std_errors(game.counts, [3]).max(), 0.05)
+
+
+class TestCounts(unittest.TestCase):
+    def test_simulate(self):
+        game = Game(2)
+        for _ in range(100):
+            game.simulate()
+        self.assertEqual(game.counts.played[2].sum(), 200)
+        # every pot is shared out exactly once, however many players split it
+        self.assertEqual(game.counts.share[2].sum(), 100 * SHARE_UNITS)
+        self.assertEqual(game.counts.won[2].sum() + game.counts.tied[2].sum() // 2, 100)
+
+    def test_split_pots(self):
+        counts = Counts()
+        for hand in ('AAo', 'KKo', 'QQo'):
+            counts.record(3, evaluator.HAND_CLASS_INDEX[hand], hand != 'QQo', num_winners=2)
+        self.assertEqual(counts.probability(3, 'AAo'), 0)
+        self.assertEqual(counts.equity(3, 'AAo'), 0.5)
+        self.assertEqual(counts.equity(3, 'QQo'), 0)
+        self.assertEqual(counts.tied[3].sum(), 2)
+
+    def test_legacy_bytes(self):
+        buffer = io.BytesIO()
+        np.savez(buffer, won=np.ones((11, 169), dtype=np.int64), played=np.full((11, 169), 2, dtype=np.int64))
+        counts = Counts.from_bytes(buffer.getvalue())
+        self.assertEqual(counts.tied.sum(), 0)
+        self.assertEqual(counts.equity(2, 'AAo'), 0.5)
+
+    def test_merge_and_serialize(self):
+        counts = Counts()
+        counts.record(2, evaluator.HAND_CLASS_INDEX['AAo'], True)
+        counts.record(2, evaluator.HAND_CLASS_INDEX['72o'], False)
+        counts.record(2, evaluator.HAND_CLASS_INDEX['72o'], True, num_winners=2)
+        other = Counts.from_bytes(counts.to_bytes())
+        self.assertEqual(other, counts)
+        other += counts
+        self.assertEqual(list(other.rows()), [
+            dict(players=2, hand='72o', won=0, tied=2, share=SHARE_UNITS, played=4),
+            dict(players=2, hand='AAo', won=2, tied=0, share=2 * SHARE_UNITS, played=2)])
+        self.assertEqual(other.probability(2, 'AAo'), 1)
+        self.assertTrue(np.isnan(other.probability(3, 'AAo')))
+
+
+class TestResultsStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.csv_path = os.path.join(self.tmp_dir.name, 'probabilities.csv')
+        with open(self.csv_path, 'w') as f:
+            f.write('hand,players,won,played,prob\nAAo,2,8,10,0.8\n72o,2,3,10,0.3\n')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_add_and_export(self):
+        path = os.path.join(self.tmp_dir.name, 'probabilities.sqlite')
+        counts = Counts()
+        counts.record(2, evaluator.HAND_CLASS_INDEX['72o'], True)
+        counts.record(3, evaluator.HAND_CLASS_INDEX['AAo'], False)
+        with ResultsStore(path, csv_path=self.csv_path) as store:
+            Game(2, counts).store_probabilities(store)
+            Game(3, counts).store_probabilities(store)
+        # a seeded store does not parse the csv again
+        with open(self.csv_path, 'a') as f:
+            f.write('not a row\n')
+        with ResultsStore(path, csv_path=self.csv_path) as store:
+            self.assertEqual(store.total_played(2), 21)
+            self.assertEqual(store.to_counts().won[2, evaluator.HAND_CLASS_INDEX['72o']], 4)
+            store.export_csv(self.csv_path)
+        with open(self.csv_path) as f:
+            self.assertEqual(f.read().splitlines(), [
+                'hand,players,won,tied,played,share,prob,equity', 'AAo,2,8,0,10,8.0,0.8,0.8',
+                '72o,2,4,0,11,4.0,0.36363636363636365,0.36363636363636365', 'AAo,3,0,0,1,0.0,0.0,0.0'])
+
+        # the new format round trips, splits included
+        counts = Counts()
+        counts.record(2, evaluator.HAND_CLASS_INDEX['AAo'], True, num_winners=2)
+        with ResultsStore(os.path.join(self.tmp_dir.name, 'other.sqlite'), csv_path=self.csv_path) as store:
+            store.add(counts)
+            self.assertEqual(store.rows(2)[0], ('AAo', 2, 8, 1, 11, 8.5, 8 / 11, 8.5 / 11))
+
+    def test_migrate_schema(self):
+        path = os.path.join(self.tmp_dir.name, 'legacy.sqlite')
+        with sqlite3.connect(path) as connection:
+            connection.executescript('''
+                CREATE TABLE counts (players INTEGER NOT NULL, hand TEXT NOT NULL, won INTEGER NOT NULL,
+                    played INTEGER NOT NULL, PRIMARY KEY (players, hand));
+                CREATE VIEW probabilities AS SELECT hand, players, won, played, CAST(won AS REAL) / played AS prob
+                    FROM counts ORDER BY players, prob DESC;
+                INSERT INTO counts VALUES (2, 'AAo', 8, 10);
+            ''')
+        connection.close()
+        with ResultsStore(path, csv_path=None) as store:
+            self.assertEqual(store.rows(), [('AAo', 2, 8, 0, 10, 8.0, 0.8, 0.8)])
+            store.add(Game(2).counts)
+        with ResultsStore(path, csv_path=None) as store:
+            self.assertEqual(store.to_counts().share[2, evaluator.HAND_CLASS_INDEX['AAo']], 8 * SHARE_UNITS)
+
+
+class TestEquityTable(unittest.TestCase):
+    def test_load(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'probabilities.csv')
+            with open(path, 'w') as f:
+                f.write('hand,players,won,played,prob\nAAo,2,8,10,0.8\n72o,2,3,10,0.3\nAKs,3,1,2,0.5\n')
+            table = EquityTable.load(path)
+            self.assertTrue(os.path.exists(os.path.join(tmp_dir, 'probabilities.npy')))
+            self.assertEqual(EquityTable.load(path).players(), [2, 3])
+
+        self.assertEqual(table.get('AAo', 2), 0.8)
+        self.assertEqual(table.get((Card(2, 'h'), Card(7, 's')), 2), 0.3)
+        self.assertEqual(table.get(HoleCards([Card('K', 'd'), Card('A', 'd')]), 3), 0.5)
+        self.assertTrue(math.isnan(table.get('AAo', 3)))
+        cards = [[Card('A', 's').index, Card('A', 'c').index], [Card(7, 'c').index, Card(2, 'd').index]]
+        self.assertEqual(table.batch(cards, 2).tolist(), [0.8, 0.3])
+        self.assertEqual(table.batch([evaluator.HAND_CLASS_INDEX['72o']], 2).tolist(), [0.3])
+
+    def test_canonical(self):
+        self.assertEqual(lookup.canonical(Card(2, 'h'), Card(7, 'h')), '72s')
+        self.assertEqual(lookup.canonical(Card('T', 'h'), Card('T', 'c')), 'TTo')
+
+
+class TestService(unittest.TestCase):
+    def setUp(self):
+        probabilities = np.full((11, 169), np.nan)
+        probabilities[2] = np.linspace(0, 1, 169)
+        self.service = service.Service(EquityTable(probabilities), processes=1)
+
+    def test_local_client(self):
+        hands = np.array([random.Random(i).sample(range(52), 7) for i in range(40)])
+        with service.LocalClient(self.service) as client:
+            self.assertEqual(client.preflop('AAo'), 1.0)
+            self.assertEqual(client.preflop(['As', 'Ah']), 1.0)
+            with self.assertRaises(ValueError):
+                client.preflop('AAo', players=3)
+            responses = client.request_many([('evaluate', dict(cards=[hand])) for hand in hands.tolist()])
+            scores = [response['result'][0] for response in responses]
+            self.assertEqual(scores, evaluator.evaluate_batch(hands).tolist())
+            first = client.equity(['AsKs', 'QdQc'], board='2c7h9d')
+            self.assertEqual(client.equity(['AsKs', 'QdQc'], board=['2c', '7h', '9d']), first)
+            self.assertTrue(first[1]['exact'])
+            self.assertAlmostEqual(first[0]['equity'] + first[1]['equity'], 1)
+            with self.assertRaises(ValueError):
+                client.equity(['AsAs'])
+            metrics = client.metrics()
+        self.assertLess(metrics['batches'], len(hands))
+        self.assertEqual(metrics['cache']['hits'], 1)
+        self.assertEqual(metrics['errors'], 2)
+        self.assertEqual(metrics['latencies']['evaluate']['count'], len(hands))
+        self.assertLessEqual(metrics['latencies']['evaluate']['p50_ms'], metrics['latencies']['evaluate']['p99_ms'])
+        self.assertEqual(metrics['queue_depth'], dict(evaluate_rows=0, equity_queries=0))
+
+    def test_bad_requests(self):
+        hand = [0, 5, 10, 15, 20, 25, 30]
+        with service.LocalClient(self.service) as client:
+            # a bad request in a batch fails on its own
+            responses = client.request_many([('evaluate', dict(cards=[cards]))
+                                             for cards in (hand, hand[:6] + [60], hand[:6] + [-1], hand[:6] + [0])])
+            self.assertEqual(responses[0]['result'], evaluator.evaluate_batch(np.array([hand])).tolist())
+            self.assertIn('0 to 51', responses[1]['error'])
+            self.assertIn('0 to 51', responses[2]['error'])
+            self.assertIn('repeats', responses[3]['error'])
+            with self.assertRaises(ValueError):
+                client.preflop('AAo', players=11)
+            for hands in (['AsKsQs', '2c2d'], ['As', '2c2d']):
+                self.assertIn('2 cards', client.request('equity', hands=hands)['error'])
+            # a client mutating its response does not change what the next one gets
+            first = client.equity(['AsKs', 'QdQc'], board='2c7h9d')
+            first[0]['equity'] = -1
+            self.assertGreater(client.equity(['AsKs', 'QdQc'], board='2c7h9d')[0]['equity'], 0)
+            self.assertIn('error', client.request('preflop', hand='AAo', players='2'))
+
+    def test_socket(self):
+        async def session(path):
+            server = await self.service.start(path)
+            async with server:
+                reader, writer = await asyncio.open_unix_connection(path)
+                for request in [dict(id=1, method='preflop', params=dict(hand='72o')), dict(id=2, method='nope')]:
+                    writer.write(json.dumps(request).encode() + b'\n')
+                writer.write(b'not json\n')
+                await writer.drain()
+                responses = [json.loads(await reader.readline()) for _ in range(3)]
+                writer.close()
+                await writer.wait_closed()
+            return sorted(responses, key=lambda response: response['id'] or 0)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            responses = asyncio.run(session(os.path.join(tmp_dir, 'equity.sock')))
+        self.service.close()
+        self.assertTrue(responses[0]['error'].startswith('Invalid JSON'))
+        self.assertEqual(responses[1], dict(id=1, result=np.linspace(0, 1, 169)[evaluator.HAND_CLASS_INDEX['72o']]))
+        self.assertIn('Unknown method', responses[2]['error'])
+
+
+class TestEquity(unittest.TestCase):
+    aces = HoleCards([Card('A', 's'), Card('A', 'c')])
+    kings = HoleCards([Card('K', 's'), Card('K', 'c')])
+
+    def test_river(self):
+        board = [Card(2, 'h'), Card(7, 'd'), Card('K', 'h'), Card(3, 's'), Card(3, 'd')]
+        aces, kings = equity.calculate([self.aces, self.kings], board=board)
+        self.assertTrue(aces.exact)
+        self.assertEqual((aces.equity, kings.equity, aces.samples), (0, 1, 1))
+
+    def test_enumerate(self):
+        board = [Card(2, 'h'), Card(7, 'd'), Card('K', 'h'), Card(3, 's')]
+        aces, kings = equity.calculate([self.aces, self.kings], board=board, dead=[Card('K', 'd')])
+        self.assertTrue(aces.exact)
+        self.assertEqual(aces.samples, 43)
+        self.assertAlmostEqual(aces.equity, 2 / 43)
+        self.assertAlmostEqual(aces.win + aces.tie + aces.loss, 1)
+
+        board = [card.index for card in board + [Card(9, 'c')]]
+        hero = [card.index for card in self.aces.cards]
+        aces, = equity.calculate([hero], board=board, num_random=1)
+        self.assertEqual(aces.samples, 45 * 44 // 2)
+        outcomes = [evaluator.evaluate(hero + board) - evaluator.evaluate(list(villain) + board)
+                    for villain in itertools.combinations(set(range(52)) - set(hero + board), 2)]
+        self.assertAlmostEqual(aces.win, sum(outcome > 0 for outcome in outcomes) / len(outcomes))
+        self.assertAlmostEqual(aces.tie, sum(outcome == 0 for outcome in outcomes) / len(outcomes))
+
+    def test_sample(self):
+        aces, kings = equity.calculate([self.aces, self.kings], max_error=0.01, max_time=10,
+                                       rng=np.random.default_rng(0))
+        self.assertFalse(aces.exact)
+        self.assertLessEqual(equity.Z_95 * aces.std_err, 0.01)
+        self.assertAlmostEqual(aces.equity, 0.82, delta=0.02)
+        self.assertAlmostEqual(aces.equity + kings.equity, 1)
+
+    def test_duplicate_cards(self):
+        with self.assertRaises(ValueError):
+            equity.calculate([self.aces, self.aces])
+
+    def test_hand_size(self):
+        for hand in ([0], [0, 1, 2]):
+            with self.assertRaises(ValueError):
+                equity.calculate([self.kings, hand])
+
+
+class TestMatchups(unittest.TestCase):
+    def test_build_resumes(self):
+        with tempfile.TemporaryDirectory() as tmp_dir, contextlib.redirect_stdout(io.StringIO()) as output:
+            path = os.path.join(tmp_dir, 'matchup_matrix.npy')
+            first = matchups.build(path, ['AAo', 'KKo'], num_boards=50, processes=1, seed=0)
+            self.assertEqual(len(first.missing_rows()), 167)
+            aces = np.array(first.row('AAo'))
+            second = matchups.build(path, ['AAo', '72o'], num_boards=50, processes=1, seed=1)
+            np.testing.assert_array_equal(second.row('AAo'), aces)
+            self.assertEqual(len(second.missing_rows()), 166)
+            del first, second
+        self.assertIn('Building 1 matchup rows (1 already built).', output.getvalue())
+        np.testing.assert_allclose(aces.sum(axis=0), 1)
+        self.assertGreater(aces[matchups.WIN, evaluator.HAND_CLASS_INDEX['KKo']], 0.7)
+
+    def test_exact_task(self):
+        exact_row, (hand_class, villain_class, chunk, orbits) = matchups.make_tasks(['AAo'], exact_rows=True)[0]
+        self.assertTrue(exact_row)
+        row, (won, tied, played) = matchups.run_task((True, (hand_class, villain_class, chunk, orbits[:2])))
+        self.assertEqual(row, evaluator.HAND_CLASS_INDEX['AAo'])
+        self.assertEqual(played[villain_class], played.sum())
+        self.assertEqual(played.sum(), sum(weight for _, weight in orbits[:2]) * math.comb(48, 5))
+        self.assertTrue((won + tied <= played).all())
+
+    def test_range_vs_range(self):
+        rng = np.random.default_rng(0)
+        win = rng.random((169, 169)) / 2
+        matrix = matchups.Matrix(np.stack([win, np.full((169, 169), 0.1), 0.9 - win]))
+        matrix.matrix[:, 0] = np.nan
+        aces, kings = evaluator.HAND_CLASS_INDEX['AAo'], evaluator.HAND_CLASS_INDEX['KKo']
+        np.testing.assert_allclose(matrix.range_vs_range(np.eye(169)[aces], np.eye(169)[kings]),
+                                   matrix.row(aces)[:, kings])
+        self.assertAlmostEqual(matrix.equity('AAo', 'KKo'), win[aces, kings] + 0.05)
+        # every class counts once per non-conflicting combo pair
+        hero = Range.parse('AA, KK', np.zeros(169))
+        villain = Range.parse('QQ', np.zeros(169))
+        queens = evaluator.HAND_CLASS_INDEX['QQo']
+        expected = (win[aces, queens] + win[kings, queens]) / 2
+        self.assertAlmostEqual(matrix.range_vs_range(hero, villain)[matchups.WIN], expected)
+        with self.assertRaises(ValueError):
+            matrix.range_vs_range(np.ones(169), np.ones(169))
+
+
+class TestAbstraction(unittest.TestCase):
+    def test_canonical_keys(self):
+        rng = np.random.default_rng(0)
+        cards = np.array([rng.permutation(52)[:6] for _ in range(100)])
+        permutation = np.array([2, 0, 3, 1])
+        permuted = (cards & ~3) | permutation[cards & 3]
+        swapped = cards[:, [1, 0, 2, 5, 4, 3]]
+        keys = abstraction.canonical_keys(cards)
+        np.testing.assert_array_equal(abstraction.canonical_keys(permuted), keys)
+        np.testing.assert_array_equal(abstraction.canonical_keys(swapped), keys)
+        # a board card is not interchangeable with a hole card
+        self.assertFalse((abstraction.canonical_keys(cards[:, [2, 1, 0, 3, 4, 5]]) == keys).all())
+        decoded = abstraction.decode_keys(keys, 6)
+        np.testing.assert_array_equal(abstraction.canonical_keys(decoded), keys)
+        self.assertEqual(len(abstraction.enumerate_classes(abstraction.PREFLOP)), 169)
+
+    def test_histograms(self):
+        keys = abstraction.canonical_keys([exact.representative('AAo'), exact.representative('72o')])
+        aces, trash = abstraction.histograms(keys, abstraction.PREFLOP, np.random.default_rng(0), num_boards=200)
+        np.testing.assert_allclose([aces.sum(), trash.sum()], 1, rtol=1e-6)
+        bins = (np.arange(abstraction.DEFAULT_NUM_BINS) + 0.5) / abstraction.DEFAULT_NUM_BINS
+        self.assertAlmostEqual(aces @ bins, 0.85, delta=0.05)
+        self.assertAlmostEqual(trash @ bins, 0.35, delta=0.05)
+
+    def test_kmeans(self):
+        rng = np.random.default_rng(0)
+        centres = np.array([[0.9, 1, 1, 1], [0.1, 0.2, 0.3, 1], [0, 0, 0.1, 1]])
+        cdfs = np.minimum(centres[rng.integers(3, size=300)] + rng.random((300, 4)) * 0.02, 1)
+        centroids = abstraction.kmeans(cdfs, 3, rng)
+        np.testing.assert_allclose(centroids, centres, atol=0.02)
+        buckets, _ = abstraction.assign(cdfs, centroids, chunk_size=50)
+        np.testing.assert_array_equal(buckets, abstraction.assign(cdfs, centres)[0])
+
+    def test_build(self):
+        with tempfile.TemporaryDirectory() as tmp_dir, contextlib.redirect_stdout(io.StringIO()) as output:
+            table = abstraction.build(abstraction.PREFLOP, tmp_dir, num_buckets=8, processes=1, seed=0, chunk_size=50,
+                                      num_boards=50, num_opponents=4)
+            os.remove(abstraction.chunk_path(tmp_dir, abstraction.PREFLOP, 1))
+            abstraction.build(abstraction.PREFLOP, tmp_dir, num_buckets=8, processes=1, seed=0, chunk_size=50,
+                              num_boards=50, num_opponents=4)
+            # saved chunks are never joined to a build with other parameters or another seed
+            for options in (dict(chunk_size=40, seed=0), dict(chunk_size=50, seed=1)):
+                with self.assertRaises(ValueError):
+                    abstraction.build(abstraction.PREFLOP, tmp_dir, num_buckets=8, processes=1, num_boards=50,
+                                      num_opponents=4, **options)
+            loaded = abstraction.BucketTable.load(os.path.join(tmp_dir, 'preflop_buckets.npz'))
+        self.assertIn('Computing 1 preflop chunks (3 already saved).', output.getvalue())
+        np.testing.assert_array_equal(loaded.buckets, table.buckets)
+        self.assertEqual(loaded.buckets.dtype, np.uint16)
+        self.assertEqual(table.bucket([Card('A', 's'), Card('A', 'h')]), 7)
+        self.assertEqual(table.bucket([Card(7, 'c'), Card(2, 'd')]), 0)
+        with self.assertRaises(ValueError):
+            table.lookup([[0, 1, 2]])
+
+
+class TestRanges(unittest.TestCase):
+    def test_parse(self):
+        self.assertEqual(Range.parse('22+').size(), 13 * 6)
+        self.assertEqual(Range.parse('A9s+').classes(), ['A9s', 'ATs', 'AJs', 'AQs', 'AKs'])
+        self.assertEqual(Range.parse('AK').size(), 16)
+        self.assertEqual(Range.parse('KQo, QQ-TT').classes(), ['TTo', 'JJo', 'QQo', 'KQo'])
+        self.assertEqual(Range.parse('A5s-A3s').classes(), ['A3s', 'A4s', 'A5s'])
+        weighted = Range.parse('AKs, AhKh:0.5')
+        self.assertEqual(weighted.size(), 3.5)
+        self.assertEqual(Range.parse('any').fraction(), 1)
+        for token in ('AKx', 'AAs', 'AhAh', 'A5s-K2s'):
+            with self.assertRaises(ValueError):
+                Range.parse(token)
+
+    def test_top(self):
+        # rank classes by their index, so the top is made of the highest indices
+        equities = np.arange(169)
+        top = Range.parse('top 1%', equities=equities)
+        self.assertEqual(top.classes(), ['AQs', 'AKs', 'AAo'])
+        self.assertEqual(Range.top(100, equities).fraction(), 1)
+
+    def test_river(self):
+        board = [Card(2, 'h'), Card(7, 'd'), Card('K', 'h'), Card(3, 's'), Card(9, 'c')]
+        hero = HoleCards([Card('A', 's'), Card('A', 'c')])
+        villain = Range.parse('KK, 77, AKs')
+        result, = ranges.hands_vs_range([hero], villain, board=board, processes=1)
+        self.assertTrue(result.exact)
+        # brute force with Hand scores over every villain combo that fits around the hero and the board
+        used = {card.index for card in hero.cards + board}
+        outcomes = [Hand(hero.cards + board).score - Hand([CARDS[card] for card in villain_cards] + board).score
+                    for villain_cards in villain.combos()[0].tolist() if not used & set(villain_cards)]
+        self.assertAlmostEqual(result.win, sum(outcome > 0 for outcome in outcomes) / len(outcomes))
+        self.assertAlmostEqual(result.equity, sum((outcome > 0) + (outcome == 0) / 2 for outcome in outcomes)
+                               / len(outcomes))
+
+    def test_range_vs_range(self):
+        board = [Card(2, 'h'), Card(7, 'd'), Card('K', 'h'), Card(3, 's')]
+        hero, villain = Range.parse('AA, KQs'), Range.parse('77+, A2s+')
+        forward = ranges.range_vs_range(hero, villain, board=board, processes=1)
+        backward = ranges.range_vs_range(villain, hero, board=board, processes=2, chunk_size=10)
+        self.assertTrue(forward.exact)
+        self.assertAlmostEqual(forward.equity + backward.equity, 1)
+        self.assertAlmostEqual(forward.tie, backward.tie)
+
+    def test_sampled(self):
+        aces, kings = ranges.hands_vs_range([(48, 49), (44, 45)], 'any', num_boards=1000, processes=1,
+                                            rng=np.random.default_rng(0))
+        self.assertFalse(aces.exact)
+        self.assertAlmostEqual(aces.equity, 0.85, delta=3 * aces.std_err + 0.005)
+        self.assertGreater(aces.equity, kings.equity)
+        self.assertGreater(aces.std_err, 0)
+        # a 3 card hand followed by a 1 card hand is not regrouped into two pairs
+        with self.assertRaises(ValueError):
+            ranges.hands_vs_range([(48, 49, 50), (44,)], 'any', processes=1)
+
+
+class TestRegretMatching(unittest.TestCase):
+    def test_expected_converges(self):
+        engine = regret_matching.RegretMatching(regret_matching.RPS.utilities, n_games=4, expected=True).run(2000)
+        for strategy in engine.average_strategies():
+            np.testing.assert_allclose(strategy, np.full((4, 3), 1 / 3), atol=0.01)
+        self.assertTrue((engine.exploitability() < 0.01).all())
+
+    def test_sampled_general_game(self):
+        # the row player should learn to always play its dominant second action
+        utilities = np.array([[0, 1, 0], [2, 3, 1]])
+        engine = regret_matching.RegretMatching(utilities, n_games=100, seed=0).run(500)
+        self.assertGreater(engine.average_strategies()[0][:, 1].mean(), 0.95)
+        self.assertEqual(engine.average_strategies()[1].shape, (100, 3))
+
+    def test_history(self):
+        engine = regret_matching.RegretMatching(regret_matching.RPS.utilities, history=5, seed=0)
+        regrets = []
+        for _ in range(7):
+            engine.step()
+            regrets.append(engine.regret_sum[0].copy())
+        np.testing.assert_allclose(engine.regret_history(0).cumsum(axis=0)[-1] + regrets[1], regrets[-1])
+        with self.assertRaises(ValueError):
+            regret_matching.RegretMatching(regret_matching.RPS.utilities).regret_history(0)
+
+    def test_game(self):
+        game = regret_matching.Game(max_game=100, seed=0)
+        self.assertEqual(sum(game.play().values()), 100)
+        game.conclude()
+        self.assertEqual(sum(game.play(avg_regret_matching=True).values()), 100)
+
+
+class TestPushFold(unittest.TestCase):
+    def setUp(self):
+        # a stand-in equity matrix where higher cards and pairs always have the edge
+        strength = np.array([sum(divmod(i, 13)) + 13 * (i % 14 == 0) for i in range(169)]) / 37
+        self.equities = 0.5 + 0.3 * (strength[:, None] - strength[None, :])
+
+    def test_converges(self):
+        solver = cfr.PushFold([1, 10, 20], equities=self.equities).iterate(300)
+        exploitability = solver.exploitability()
+        self.assertTrue((exploitability >= -1e-9).all())
+        self.assertTrue((exploitability < 1e-3).all())
+        push_1bb, _ = solver.ranges(0)
+        push_20bb, call_20bb = solver.ranges(2)
+        self.assertGreater(len(push_1bb), len(push_20bb))
+        self.assertIn('AAo', call_20bb)
+
+    def test_checkpoint(self):
+        solver = cfr.PushFold([5, 10], equities=self.equities)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'push_fold.npz')
+            solver.iterate(20, checkpoint_path=path, checkpoint_every=10)
+            loaded = cfr.PushFold.load(path)
+        self.assertEqual(loaded.iterations, 20)
+        np.testing.assert_allclose(loaded.iterate(5).regrets, solver.iterate(5).regrets)
+
+
+class TestTables(unittest.TestCase):
+    def test_side_pots(self):
+        contributed = np.array([[50, 200, 200], [100, 100, 40], [2, 1, 6]])
+        folded = np.array([[False, False, False], [False, True, False], [True, True, False]])
+        scores = np.array([[3, 1, 1], [1, 9, 2], [9, 9, 0]])
+        np.testing.assert_allclose(tables.pot_payouts(contributed, folded, scores),
+                                   [[150, 150, 150], [120, 0, 120], [0, 0, 9]])
+
+    def test_folder_loses_blinds(self):
+        raiser = tables.EquityThreshold(fold_below=-1, raise_above=-1, name='raise')
+        folder = tables.EquityThreshold(fold_below=2, raise_above=3, name='fold')
+        game = tables.Tables([raiser, folder], 1000, np.random.default_rng(0), num_samples=1)
+        net = game.play() / tables.BIG_BLIND
+        np.testing.assert_array_equal(net.sum(axis=1), 0)
+        # the folder gives up its small blind on the button and its big blind to the raise otherwise
+        np.testing.assert_array_equal(net[:, 1], np.where(game.button == 1, -0.5, -1))
+
+    def test_all_in(self):
+        push = tables.StrategyPolicy(np.ones(169), np.ones(169), name='push')
+        results = tables.play([push, tables.CallPolicy()], 1000, np.random.default_rng(0), num_tables=300, stack=10)
+        self.assertEqual(results.hands('push'), 1000)
+        game = tables.Tables([push, tables.CallPolicy()], 100, np.random.default_rng(1), stack=10)
+        net = np.abs(game.play() / tables.BIG_BLIND)
+        self.assertTrue(np.isin(net, [0, 10]).all())
+        self.assertTrue(game.all_in.all())
+
+    def test_run(self):
+        policies = [tables.EquityThreshold(0.3, 0.8, name='loose'), tables.EquityThreshold(0.5, 0.7, name='tight'),
+                    tables.CallPolicy()]
+        with contextlib.redirect_stdout(io.StringIO()):
+            inline = tables.run(policies, 600, processes=1, num_tables=200, seed=0, num_samples=4)
+            pooled = tables.run(policies, 600, processes=2, num_tables=200, seed=0, num_samples=4)
+        self.assertEqual(inline.chip_ev(), pooled.chip_ev())
+        chip_ev = inline.chip_ev()
+        self.assertEqual(set(chip_ev), {'loose', 'tight', 'call'})
+        self.assertAlmostEqual(sum(inline.totals[name][1] for name in chip_ev), 0)
+        self.assertTrue(all(half_width > 0 for _, half_width in chip_ev.values()))
+
+
+class TestBenchmarks(unittest.TestCase):
+    def test_run(self):
+        results = benchmarks.run(['evaluate', 'store_probabilities', 'import_evaluator'], repeat=1)
+        self.assertEqual(set(results), {'evaluate', 'store_probabilities', 'import_evaluator'})
+        self.assertGreater(results['evaluate']['ops_per_second'], 0)
+
+    def test_compare(self):
+        baseline = dict(fast=dict(ops_per_second=100), slow=dict(ops_per_second=100))
+        results = dict(fast=dict(ops_per_second=150), slow=dict(ops_per_second=80), new=dict(ops_per_second=1))
+        speedups, regressions = benchmarks.compare(results, baseline, tolerance=0.1)
+        self.assertEqual(speedups, dict(fast=1.5, slow=0.8))
+        self.assertEqual(regressions, ['slow'])
+
+
+class TestCli(unittest.TestCase):
+    def test_parse_players(self):
+        self.assertEqual(cli.parse_players('7-10'), [7, 8, 9, 10])
+        self.assertEqual(cli.parse_players('2,6-7,3'), [2, 3, 6, 7])
+        for value in ('1-3', '11', 'ten'):
+            with self.assertRaises(argparse.ArgumentTypeError):
+                cli.parse_players(value)
+
+    def test_main(self):
+        with tempfile.TemporaryDirectory() as tmp_dir, contextlib.redirect_stdout(io.StringIO()):
+            csv_path = os.path.join(tmp_dir, 'probabilities.csv')
+            args = ['--players', '2,9', '--games', '2000', '--task-size', '500', '--workers', '1', '--seed', '0']
+            with contextlib.redirect_stderr(io.StringIO()):
+                counts = cli.main(args + ['--engine', 'scalar', '--output', 'csv', '--csv', csv_path])
+            self.assertEqual(counts.played.sum(axis=1)[[2, 9]].tolist(), [2 * 2000, 9 * 2000])
+            # csv output adds to the file it is given
+            with contextlib.redirect_stderr(io.StringIO()):
+                cli.main(args + ['--output', 'csv', '--csv', csv_path])
+            rows = ResultsStore.read_csv(csv_path)
+            self.assertEqual(sum(row['played'] for row in rows), 2 * (2 * 2000 + 9 * 2000))
+
+            sqlite_path = os.path.join(tmp_dir, 'probabilities.sqlite')
+            stderr = io.StringIO()
+            with contextlib.redirect_stderr(stderr):
+                cli.main(['--players', '3', '--seconds', '0.01', '--task-size', '500', '--workers', '1',
+                          '--db', sqlite_path, '--csv', csv_path])
+            self.assertIn('ETA 0s', stderr.getvalue())
+            with ResultsStore(sqlite_path, csv_path=None) as store:
+                self.assertGreater(store.total_played(3), 0)
+
+    def test_precision(self):
+        progress = cli.Progress([2], precision=0.05, file=io.StringIO())
+        counts = Counts()
+        self.assertFalse(progress(counts))
+        counts.played[2] = 400
+        counts.share[2] = 200 * SHARE_UNITS
+        self.assertTrue(progress(counts))
+
+
+class TestExact(unittest.TestCase):
+    def test_representative(self):
+        for index, hand in enumerate(evaluator.HAND_CLASSES):
+            self.assertEqual(evaluator.hole_card_class(*exact.representative(hand)), index)
+
+    def test_opponent_orbits(self):
+        for hand, stabilizer_size in [('AAo', 4), ('AKs', 6), ('AKo', 2)]:
+            hero = exact.representative(hand)
+            self.assertEqual(len(exact.stabilizer(hero)), stabilizer_size)
+            self.assertEqual(sum(weight for _, weight in exact.opponent_orbits(hero)), 50 * 49 // 2)
+
+    def test_enumerate_matchup(self):
+        won, tied, played = exact.enumerate_matchup(exact.representative('AAo'), exact.representative('KKo'))
+        self.assertEqual(played, 48 * 47 * 46 * 45 * 44 // 120)
+        self.assertAlmostEqual(won / played, 0.82, delta=0.01)
+        self.assertLess(tied, won)
+
+    def test_mirror(self):
+        # a matchup enumerated from the other side is the complement rescaled by the combo counts
+        aces, kings = evaluator.HAND_CLASS_INDEX['AAo'], evaluator.HAND_CLASS_INDEX['KKo']
+        forward, backward = [[sum(counts) for counts in zip(*(exact.run_task(task)[3:]
+                                                              for task in exact.make_tasks([pair])))]
+                             for pair in [(aces, kings), (kings, aces)]]
+        self.assertEqual(exact.mirror(*forward, aces, kings), tuple(backward))
+
+    def test_exact_requires_heads_up(self):
+        with self.assertRaises(ValueError):
+            Game(3).enumerate_probabilities()
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,35 @@
+"""
+Small helpers shared by the table builders: running tasks on an optional pool and replacing files atomically.
+"""
+import contextlib
+import os
+
+
+def imap_tasks(run_task, tasks, processes=None):
+    """
+    results of run_task over tasks in completion order, run inline when processes == 1 and on a pool sized to the
+    machine when it is None
+    """
+    if processes == 1:
+        yield from map(run_task, tasks)
+        return
+    import multiprocessing as mp  # only pools need it, not every importer of atomic_path
+
+    with mp.Pool(processes) as pool:
+        yield from pool.imap_unordered(run_task, tasks)
+
+
+@contextlib.contextmanager
+def atomic_path(path, suffix=''):
+    """
+    temporary path to write in the block, moved over path once the block succeeds so readers never see a partial
+    file; suffix is the extension np.save or np.savez would otherwise append to it
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp{suffix}"  # processes writing the same file each get their own
+    try:
+        yield tmp_path
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)